@@ -22,7 +22,31 @@ try:
 except NameError:
     basestring = str
 
+# Define ABC for python 2 & 3 compatibility
+import abc  # noqa
+try:
+    ABC = abc.ABC
+except AttributeError:
+    ABC = abc.ABCMeta('ABC', (object,), {'__slots__': ()})
+
 # Define global constants
 MIN_IGP_METRIC = 1
 OSPF_DEFAULT_AREA = '0.0.0.0'
 DEBUG_FLAG = False
+
+# The main classes, imported on first access (PEP 562, Python >= 3.7 only,
+# import them from their own module on older versions)
+_LAZY_ATTRIBUTES = {'IPNet': '.ipnet', 'IPTopo': '.iptopo', 'IPCLI': '.cli',
+                    'Router': '.router'}
+
+
+def __getattr__(name):
+    try:
+        module = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError('module %r has no attribute %r'
+                             % (__name__, name))
+    import importlib
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,271 @@
+"""This module provides coroutine counterparts to the blocking calls of the
+nodes and of the network, e.g. `await aio.acmd(host, 'ip route')`,
+`await router.astart()` or `await net.aping()`. The commands run directly in
+the namespaces of their node (see ipmininet.nsexec), so that many nodes can
+be driven concurrently from a single event loop, up to CONCURRENCY commands
+at once. Blocking code can run these coroutines in the shared event loop
+with run(), e.g. `aio.run(net.astart())`.
+
+This module requires Python 3.5+, and is only imported when one of these
+coroutines is used."""
+import asyncio
+import shlex
+import subprocess
+import time
+import weakref
+
+from mininet.log import lg as log
+
+from .ipnet import IPNet
+from .link import IPLink
+from .nsexec import executor_of
+from .reachability import collect, plan_probes
+from .router.config.readiness import MIN_DELAY, MAX_DELAY, _Inotify
+
+# The maximal number of commands running at once in an event loop
+CONCURRENCY = 64
+
+_loop = None  # The event loop used by run()
+_semaphores = weakref.WeakKeyDictionary()  # event loop: Semaphore
+
+
+def event_loop():
+    """Return the event loop shared by the coroutines run from blocking code
+    """
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    return _loop
+
+
+def run(coroutine):
+    """Run a coroutine in the shared event loop and return its result"""
+    return event_loop().run_until_complete(coroutine)
+
+
+def set_concurrency(limit):
+    """Change the maximal number of commands running at once in an event
+    loop. The commands already running are not affected.
+
+    :param limit: The maximal number of concurrent commands"""
+    global CONCURRENCY
+    CONCURRENCY = limit
+    _semaphores.clear()
+
+
+def _semaphore():
+    """Return the semaphore bounding the commands of the current event loop"""
+    loop = asyncio.get_event_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(CONCURRENCY)
+    return semaphore
+
+
+async def apopen(node, *args, **kwargs):
+    """Start a command in a node, without waiting for it
+
+    :param node: The node in which the command runs
+    :param args: the command + arguments, see ipmininet.nsexec.command_args
+    :param kwargs: key-val arguments, as used in subprocess.Popen
+    :return: its asyncio.subprocess.Process"""
+    args, kwargs = executor_of(node).popen_args(*args, **kwargs)
+    return await asyncio.create_subprocess_exec(*args, **kwargs)
+
+
+async def apexec(node, *args, **kwargs):
+    """Run a command in a node and wait for it to terminate, waiting first
+    if CONCURRENCY commands are already running
+
+    :param node: The node in which the command runs
+    :param args: the command + arguments, see ipmininet.nsexec.command_args
+    :param kwargs: key-val arguments, as used in subprocess.Popen
+    :return: its decoded stdout, stderr and exit code"""
+    async with _semaphore():
+        p = await apopen(node, *args, **kwargs)
+        out, err = await p.communicate()
+    return (out.decode('utf-8', 'replace') if out else '',
+            err.decode('utf-8', 'replace') if err else '',
+            p.returncode)
+
+
+async def acmd(node, *args, **kwargs):
+    """Run a command in a node and wait for it to terminate, as Node.cmd
+
+    :param node: The node in which the command runs
+    :param args: the command + arguments, see ipmininet.nsexec.command_args
+    :param kwargs: key-val arguments, as used in subprocess.Popen
+    :return: its decoded output, stdout and stderr being merged"""
+    kwargs.setdefault('stderr', subprocess.STDOUT)
+    return (await apexec(node, *args, **kwargs))[0]
+
+
+async def await_conditions(conditions, timeout=None):
+    """Wait until all conditions hold, as
+    ipmininet.router.config.readiness.wait_for, without blocking the event
+    loop
+
+    :param conditions: A sequence of ReadinessCondition
+    :param timeout: The maximal number of seconds to wait, None to wait
+                    indefinitely
+    :return: whether all conditions hold"""
+    pending = [c for c in conditions if not c.is_ready()]
+    if not pending:
+        return True
+    loop = asyncio.get_event_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    watcher = _Inotify({c.watched_directory for c in pending
+                        if c.watched_directory is not None})
+    changed = asyncio.Event()
+    if watcher.fd is not None:
+        def wake():
+            watcher._drain()
+            changed.set()
+        loop.add_reader(watcher.fd, wake)
+    delay = MIN_DELAY
+    try:
+        while pending:
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return False
+                delay = min(delay, remaining)
+            try:
+                await asyncio.wait_for(changed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            changed.clear()
+            pending = [c for c in pending if not c.is_ready()]
+            delay = min(delay * 2, MAX_DELAY)
+    finally:
+        if watcher.fd is not None:
+            loop.remove_reader(watcher.fd)
+        watcher.close()
+    return True
+
+
+async def await_started(daemon, timeout=None):
+    """Wait until a daemon has started, and record how long it took, as
+    Daemon.wait_started
+
+    :param timeout: The maximal number of seconds to wait, defaults to
+                    the STARTUP_TIMEOUT of the daemon
+    :return: whether the daemon has started before the timeout"""
+    start = time.time()
+    started = await await_conditions(
+        daemon.readiness_conditions(),
+        timeout=daemon.STARTUP_TIMEOUT if timeout is None else timeout)
+    daemon.startup_latency = time.time() - start
+    log.debug('%s on %s ready after %.3fs\n'
+              % (daemon.NAME, daemon._node.name, daemon.startup_latency))
+    return started
+
+
+async def astart_router(router, build_config=True):
+    """Start a router, as Router.start. The configurations of its daemons are
+    checked concurrently. The daemons are still started one after the other,
+    as they can depend on each other, but waiting for them does not block
+    the event loop.
+
+    :param router: The router to start
+    :param build_config: Whether the configuration files should be
+                         built, False if they were already built
+    :raise RuntimeError: if the configuration of a daemon is invalid
+                         or if a daemon did not start in time"""
+    if build_config:
+        router.config.build()
+    checks = router._configs_to_check()
+    results = await asyncio.gather(*[apexec(router, shlex.split(d.dry_run))
+                                     for d, _ in checks])
+    errors = [router._record_check(d, key, result)
+              for (d, key), result in zip(checks, results)]
+    errors = [e for e in errors if e is not None]
+    if errors:
+        raise RuntimeError('\n'.join(errors))
+    router._apply_sysctls()
+    for d in router.config.daemons:
+        # The process manager keeps track of the daemon to terminate it
+        router._processes.popen(shlex.split(d.startup_line))
+        if not await await_started(d):
+            raise RuntimeError('%s did not start after %ss'
+                               % (d.NAME, d.STARTUP_TIMEOUT))
+
+
+async def _astart_router(router):
+    """Start a router and report its failure instead of raising it
+
+    :return: None if the router started, (router, error) otherwise"""
+    try:
+        await astart_router(router, build_config=False)
+    except Exception as e:
+        return router, e
+    finally:
+        log.info(router.name + ' ')
+    return None
+
+
+async def astart_network(net):
+    """Start a network, as IPNet.start, all routers starting concurrently
+
+    :param net: The IPNet to start"""
+    super(IPNet, net).start()
+    errors = net._build_configs()
+    if not errors:
+        log.info('*** Starting', len(net.routers), 'routers\n')
+        results = await asyncio.gather(*[_astart_router(r)
+                                         for r in net.routers])
+        errors = [r for r in results if r is not None]
+        log.info('\n')
+    net._finish_start(errors)
+
+
+async def _adelete_link(link):
+    """Delete a link, as Link.delete. Deleting one end of a veth pair
+    deletes the other one."""
+    await acmd(link.intf1.node, ['ip', 'link', 'del', link.intf1.name])
+    for intf in (link.intf1, link.intf2):
+        intf.node.delIntf(intf)
+        intf.link = None
+    link.intf1 = link.intf2 = None
+
+
+async def astop_network(net):
+    """Stop a network, as IPNet.stop, its links being deleted concurrently
+
+    :param net: The IPNet to stop"""
+    net._stop_routers()
+    links = [link for link in net.links if isinstance(link, IPLink)]
+    if links:
+        log.info('*** Deleting', len(links), 'links\n')
+        net.links = [link for link in net.links
+                     if not isinstance(link, IPLink)]
+        await asyncio.gather(*[_adelete_link(link) for link in links])
+    super(IPNet, net).stop()
+    net._close_address_monitors()
+
+
+async def aping(net, hosts=None, timeout=None, use_v4=True, use_v6=True):
+    """Ping between all specified hosts, as IPNet.ping, the probes running
+    as coroutines instead of in a window of processes
+
+    :param net: The IPNet of the hosts
+    :param hosts: list of hosts or None if all must be pinged
+    :param timeout: time to wait for a response, as string
+    :param use_v4: whether IPv4 addresses can be used
+    :param use_v6: whether IPv6 addresses can be used
+    :return: the packet loss percentage"""
+    if not hosts:
+        hosts = net.hosts
+    if not use_v4 and not use_v6:
+        log.output("*** Warning: Parameters forbid both IPv4 and IPv6 for "
+                   "pings\n")
+        return 0
+
+    log.output("*** Ping: testing reachability over %s%s%s\n"
+               % ("IPv4" if use_v4 else "",
+                  " and " if use_v4 and use_v6 else "",
+                  "IPv6" if use_v6 else ""))
+    plan, incompatible_hosts = net._ping_plan(hosts, use_v4, use_v6)
+    probes = plan_probes(plan, timeout)
+    outputs = await asyncio.gather(*[acmd(p.src, p.args) for p in probes])
+    return net._ping_report(collect(probes, outputs, incompatible_hosts))
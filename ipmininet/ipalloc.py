@@ -0,0 +1,131 @@
+"""This module defines an allocator of IP subnets, working on integer
+prefixes rather than on ipaddress objects, and helpers to materialize
+integer addresses."""
+from bisect import bisect_right
+from collections import deque
+
+from ipaddress import IPv4Interface, IPv4Network, IPv6Interface, IPv6Network
+
+_MAX_PREFIXLEN = {4: 32, 6: 128}
+_NETWORKS = {4: IPv4Network, 6: IPv6Network}
+_INTERFACES = {4: IPv4Interface, 6: IPv6Interface}
+
+
+def interfaces_of(addresses, prefixlen, version):
+    """Build the ip_interface of addresses given as integers, without
+    formatting and parsing them back
+
+    :param addresses: an iterable of integers
+    :param prefixlen: the prefix length of the interfaces
+    :param version: the IP version of the addresses
+    :return: a list of ip_interface"""
+    interface = _INTERFACES[version]
+    return [interface((address, prefixlen)) for address in addresses]
+
+
+def _merge_intervals(networks):
+    """Return the sorted list of disjoint [start, end) intervals covered by
+    a list of ip_network"""
+    intervals = sorted((int(n.network_address),
+                        int(n.broadcast_address) + 1) for n in networks)
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class SubnetAllocator(object):
+    """A buddy allocator of subnets. The free subnets are kept in one FIFO
+    list per prefix length. A request for a given prefix length takes the
+    first free subnet of the longest prefix length that can hold it, and
+    splits it until it has the requested size, keeping the first half and
+    freeing the other half at each step. This keeps the allocated subnets
+    as aggregated as possible, and costs at most one split per prefix length
+    instead of one scan of the free subnets per allocation.
+
+    The reserved subnets are carved out of the free subnets once, when
+    building the allocator, so that the free lists never overlap them."""
+
+    def __init__(self, subnets, reserved=()):
+        """:param subnets: a list of ip_network available for allocation,
+                           which must all be of the same IP version
+        :param reserved: a list of ip_network that cannot be allocated"""
+        self.version = subnets[0].version if subnets else 4
+        self.max_prefixlen = _MAX_PREFIXLEN[self.version]
+        self._free = {plen: deque() for plen in range(self.max_prefixlen + 1)}
+        self._count = 0
+        reserved = [n for n in reserved if n.version == self.version]
+        self._reserved = _merge_intervals(reserved)
+        self._reserved_starts = [start for start, _ in self._reserved]
+        for net in subnets:
+            self._add_free(int(net.network_address), net.prefixlen)
+
+    def __len__(self):
+        """Return the number of free subnets"""
+        return self._count
+
+    def _overlap(self, start, end):
+        """Return whether [start, end) is free, fully reserved, or partially
+        reserved
+
+        :return: 0, 1 or 2 respectively"""
+        # The last reserved interval starting before the end of the range
+        i = bisect_right(self._reserved_starts, end - 1) - 1
+        if i < 0 or self._reserved[i][1] <= start:
+            return 0
+        r_start, r_end = self._reserved[i]
+        if r_start <= start and r_end >= end:
+            return 1
+        return 2
+
+    def _add_free(self, net, plen):
+        """Register a free subnet, minus the reserved subnets it overlaps"""
+        pending = [(net, plen)]
+        while pending:
+            net, plen = pending.pop()
+            size = 1 << (self.max_prefixlen - plen)
+            overlap = self._overlap(net, net + size)
+            if overlap == 0:
+                self._free[plen].append(net)
+                self._count += 1
+            elif overlap == 2:
+                # Split around the reserved subnets, keeping address order
+                half = size >> 1
+                pending.append((net + half, plen + 1))
+                pending.append((net, plen + 1))
+
+    def allocate(self, prefixlen):
+        """Allocate a subnet
+
+        :param prefixlen: the prefix length of the subnet
+        :return: an ip_network
+        :raise ValueError: if no free subnet can hold that prefix length"""
+        free = self._free
+        for plen in range(prefixlen, -1, -1):
+            if free[plen]:
+                break
+        else:
+            if not self._count:
+                raise ValueError('No subnet left in the prefix space for all '
+                                 'broadcast domains.')
+            raise ValueError('Could not find a subnet big enough for a '
+                             'broadcast domain.')
+        net = free[plen].popleft()
+        self._count -= 1
+        # Free the second half at each split
+        for p in range(plen + 1, prefixlen + 1):
+            free[p].append(net | (1 << (self.max_prefixlen - p)))
+            self._count += 1
+        return _NETWORKS[self.version]((net, prefixlen))
+
+    def free_subnets(self):
+        """Return the list of the free subnets, from the smallest to the
+        largest"""
+        network = _NETWORKS[self.version]
+        return [network((net, plen))
+                for plen in range(self.max_prefixlen, -1, -1)
+                for net in self._free[plen]]
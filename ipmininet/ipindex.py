@@ -0,0 +1,146 @@
+"""This module defines an index of IP prefixes, answering exact and
+longest-prefix-match queries for IPv4 and IPv6 addresses."""
+from builtins import str
+from ipmininet import basestring
+
+import numbers
+
+from ipaddress import ip_address, ip_interface
+
+_MAX_PREFIXLEN = {4: 32, 6: 128}
+
+
+def to_address(ip):
+    """Return the ip_address corresponding to an address, which can also be
+    given as a string, possibly with a prefix length, or an ip_interface
+
+    :raise ValueError: if ip is not a valid address"""
+    if isinstance(ip, basestring):
+        return ip_interface(str(ip)).ip if '/' in ip else ip_address(str(ip))
+    return getattr(ip, 'ip', ip)
+
+
+class PrefixIndex(object):
+    """An index from IP prefixes and addresses to values. Prefixes are stored
+    in one hash table per prefix length, so that a longest-prefix-match
+    query costs one lookup per distinct prefix length, i.e. at most
+    O(address length)."""
+
+    def __init__(self):
+        # version: {address int: [values]}
+        self._exact = {4: {}, 6: {}}
+        # version: {prefixlen: {network int: [values]}}
+        self._prefixes = {4: {}, 6: {}}
+        # version: [(prefixlen, mask, table)] by decreasing prefixlen
+        self._tables = {4: [], 6: []}
+
+    def __len__(self):
+        return sum(len(values) for tables in self._exact.values()
+                   for values in tables.values())
+
+    def add(self, ip, value):
+        """Register an address and its prefix
+
+        :param ip: an ip_interface
+        :param value: the value associated to that address and prefix"""
+        v = ip.version
+        self._exact[v].setdefault(int(ip.ip), []).append(value)
+        plen = ip.network.prefixlen
+        try:
+            table = self._prefixes[v][plen]
+        except KeyError:
+            table = self._prefixes[v][plen] = {}
+            self._update_tables(v)
+        table.setdefault(int(ip.network.network_address), []).append(value)
+
+    def remove(self, ip, value):
+        """Unregister an address and its prefix
+
+        :param ip: an ip_interface
+        :param value: the value that was associated to them
+        :raise KeyError: if they were not registered"""
+        v = ip.version
+        self._remove(self._exact[v], int(ip.ip), value)
+        plen = ip.network.prefixlen
+        table = self._prefixes[v][plen]
+        self._remove(table, int(ip.network.network_address), value)
+        if not table:
+            del self._prefixes[v][plen]
+            self._update_tables(v)
+
+    @staticmethod
+    def _remove(table, key, value):
+        values = table[key]
+        try:
+            values.remove(value)
+        except ValueError:
+            raise KeyError(value)
+        if not values:
+            del table[key]
+
+    def _update_tables(self, version):
+        maxlen = _MAX_PREFIXLEN[version]
+        self._tables[version] = [
+            (plen, ((1 << plen) - 1) << (maxlen - plen), table)
+            for plen, table in sorted(self._prefixes[version].items(),
+                                      reverse=True)]
+
+    def exact(self, ip):
+        """Return the values registered for an address
+
+        :param ip: an ip_address
+        :raise KeyError: if the address is not registered"""
+        return self._exact[ip.version][int(ip)]
+
+    def longest_match(self, ip):
+        """Return the values registered for the longest prefix containing an
+        address
+
+        :param ip: an ip_address
+        :raise KeyError: if no prefix contains the address"""
+        return self._longest_match(ip.version, int(ip))
+
+    def _longest_match(self, version, value):
+        for _, mask, table in self._tables[version]:
+            try:
+                return table[value & mask]
+            except KeyError:
+                pass
+        raise KeyError(value)
+
+    def lookup(self, ip):
+        """Return the values registered for an address, or for the longest
+        prefix containing it if the address itself is not registered
+
+        :param ip: an ip_address
+        :raise KeyError: if nothing matches"""
+        v, value = ip.version, int(ip)
+        try:
+            return self._exact[v][value]
+        except KeyError:
+            return self._longest_match(v, value)
+
+    def lookup_many(self, ips, version=None):
+        """Lookup many addresses at once
+
+        :param ips: an iterable of ip_address, address strings, or integers
+        :param version: the IP version of the addresses given as integers
+        :return: the list of the values matching each address (see lookup),
+                 None for the addresses that did not match"""
+        results = []
+        exact = self._exact
+        for ip in ips:
+            if isinstance(ip, numbers.Integral) and not isinstance(ip, bool):
+                v, value = version, ip
+            else:
+                if not hasattr(ip, 'version'):
+                    ip = to_address(ip)
+                v, value = ip.version, int(ip)
+            try:
+                results.append(exact[v][value])
+            except KeyError:
+                try:
+                    results.append(self._longest_match(v, value))
+                except KeyError:
+                    results.append(None)
+        return results
@@ -1,29 +1,38 @@
 """IPNet: The Mininet that plays nice with IP networks.
 This modules will auto-generate all needed configuration properties if
 unspecified by the user"""
-from builtins import str
+from builtins import str, range
+from ipmininet import basestring
 
+import logging
 import math
 import os
-from operator import attrgetter, methodcaller
+import sys
+from itertools import chain
+from multiprocessing.pool import ThreadPool
+from operator import methodcaller
 from shutil import copyfile
 
 from ipaddress import ip_network, ip_interface
 
 from . import MIN_IGP_METRIC, OSPF_DEFAULT_AREA
-from .utils import otherIntf, realIntfList, L3Router, address_pair, has_cmd
+from .utils import otherIntf, realIntfList, L3Router, address_pair, \
+    PeerAddressIndex, CommandBatch
 from .router import Router
 from .router.config import BasicRouterConfig
-from .link import IPIntf, IPLink, PhysicalInterface
-
+from .router.config.base import build_configs, RouterIdAllocator
+from .link import IPIntf, IPLink, PhysicalInterface, set_addresses, \
+    provision_links, refresh_addresses, close_address_monitor
+from .ipalloc import SubnetAllocator, interfaces_of
+from .ipindex import PrefixIndex, to_address
+from .reachability import probe
+
+import mininet.clean
 from mininet.net import Mininet
 from mininet.node import Host
 from mininet.nodelib import LinuxBridge
 from mininet.log import lg as log
 
-# ping6 is not provided by default on newer systems
-PING6_CMD = 'ping6' if has_cmd('ping6') else 'ping -6'
-
 
 class IPNet(Mininet):
     """IPNet: An IP-aware Mininet"""
@@ -43,6 +52,10 @@ class IPNet(Mininet):
                  intf=IPIntf,
                  switch=LinuxBridge,
                  controller=None,
+                 start_workers=1,
+                 batch_allocation=False,
+                 config_workers=1,
+                 batch_links=False,
                  *args, **kwargs):
         """Extends Mininet by adding IP-related ivars/functions and
         configuration knobs.
@@ -58,11 +71,26 @@ class IPNet(Mininet):
         :param max_v6_prefixlen: Maximal IPv6 prefixlen to auto-allocate
         :param allocate_IPs: wether to auto-allocate subnets in the network
         :param igp_metric: The default IGP metric for the links
-        :param igp_area: The default IGP area for the links"""
+        :param igp_area: The default IGP area for the links
+        :param start_workers: The number of routers that can be started
+                              concurrently
+        :param batch_allocation: wether to compute all auto-allocated
+                                 addresses first, then assign them with a
+                                 single command per node
+        :param config_workers: The number of processes that can render the
+                               router configurations in parallel
+        :param batch_links: wether to create all the links of the topology
+                            at once, with a few ip -batch commands, instead
+                            of several commands per link"""
         self.router = router
         self.config = config
         self.routers = []  # the list of router in the network
-        self._ip_allocs = {}  # We need this to be able to do inverse-lookups
+        self._ip_index = PrefixIndex()  # To be able to do inverse-lookups
+        self._indexed_intfs = []  # The interfaces whose addresses are indexed
+        # The interfaces through which the routers reach each other
+        self.peer_index = PeerAddressIndex()
+        # The router ids of the routers without IPv4 address
+        self.routerid_allocator = RouterIdAllocator(self.routers)
         self.max_v4_prefixlen = max_v4_prefixlen
         self._unallocated_ipbase = [ip_network(ipBase)]
         self.use_v4 = use_v4
@@ -75,6 +103,11 @@ class IPNet(Mininet):
         self.igp_area = igp_area
         self.allocate_IPs = allocate_IPs
         self.physical_interface = {}  # itf: node
+        self.start_workers = start_workers
+        self.batch_allocation = batch_allocation
+        self.config_workers = config_workers
+        self.batch_links = batch_links
+        self._link_plan = None  # The links to provision, when batching them
         super(IPNet, self).__init__(ipBase=ipBase, switch=switch, link=link,
                                     intf=intf, controller=controller,
                                     *args, **kwargs)
@@ -90,6 +123,8 @@ class IPNet(Mininet):
         if not cls:
             cls = self.router
         r = cls(name, **defaults)
+        r.peer_index = self.peer_index
+        r.routerid_allocator = self.routerid_allocator
         self.routers.append(r)
         self.nameToNode[name] = r
         return r
@@ -110,7 +145,29 @@ class IPNet(Mininet):
             log.info(routerName + ' ')
         log.info('\n')
         self.physical_interface.update(topo.phys_interface_capture)
-        super(IPNet, self).buildFromTopo(topo)
+        if self.batch_links:
+            self._link_plan = []
+        try:
+            super(IPNet, self).buildFromTopo(topo)
+            self._provision_links()
+        finally:
+            self._link_plan = None
+
+    def _can_provision(self, params):
+        """Return whether a link can be provisioned with provision_links,
+        i.e. whether it is an IPLink between plain IPIntf"""
+        cls = params.get('cls') or self.link
+        return isinstance(cls, type) and issubclass(cls, IPLink) and \
+            (params.get('intf') or self.intf) is IPIntf and \
+            params.get('cls1', IPIntf) is IPIntf and \
+            params.get('cls2', IPIntf) is IPIntf and \
+            params.get('fast', True)
+
+    def _provision_links(self):
+        """Create the planned links"""
+        if self._link_plan:
+            plan, self._link_plan = self._link_plan, []
+            self.links.extend(provision_links(plan))
 
     def addLink(self, node1, node2,
                 igp_metric=None, igp_area=None, igp_passive=False,
@@ -152,6 +209,20 @@ class IPNet(Mininet):
                 # Only iff not already specified
                 if k not in p:
                     p[k] = v
+        if self._link_plan is not None:
+            if not args and self._can_provision(params):
+                # Plan the link as Mininet.addLink would create it
+                options = dict(params)
+                cls = options.pop('cls', None) or self.link
+                options.setdefault('intf', self.intf)
+                options.setdefault('addr1', self.randMac())
+                options.setdefault('addr2', self.randMac())
+                node1, node2 = [self[n] if isinstance(n, basestring) else n
+                                for n in (node1, node2)]
+                self._link_plan.append((cls, node1, node2, options))
+                return None
+            # Keep the link creation order, e.g. for the port numbers
+            self._provision_links()
         return super(IPNet, self).addLink(node1=node1, node2=node2,
                                           *args, **params)
 
@@ -164,49 +235,149 @@ class IPNet(Mininet):
         return super(IPNet, self).addHost(name, **params)
 
     def node_for_ip(self, ip):
-        """Return the node owning a given IP address
+        """Return the node owning a given IP address. If no interface has
+        this address, return the node having the longest prefix containing
+        it, preferring routers if several nodes share that prefix.
 
         :param ip: an IP address
-        :return: a node name"""
-        return self._ip_allocs[str(ip)]
+        :return: a node
+        :raise KeyError: if no node matches the address"""
+        try:
+            ip = to_address(ip)
+        except ValueError:
+            raise KeyError(ip)
+        return self._owner(self._ip_index.lookup(ip))
+
+    def nodes_for_ips(self, ips):
+        """Return the nodes owning many IP addresses, see node_for_ip
+
+        :param ips: an iterable of IP addresses
+        :return: the list of the nodes matching each address, None for the
+                 addresses that do not match any node"""
+        return [None if intfs is None else self._owner(intfs)
+                for intfs in self._ip_index.lookup_many(ips)]
+
+    @staticmethod
+    def _owner(intfs):
+        """Return the node owning the first interface of a list, or the
+        first router owning one of them"""
+        for itf in intfs:
+            if L3Router.is_l3router_intf(itf):
+                return itf.node
+        return intfs[0].node
 
     def start(self):
         super(IPNet, self).start()
-        log.info('*** Starting, ', len(self.routers), 'routers\n')
-        for router in self.routers:
-            log.info(router.name + ' ')
-            router.start()
-        log.info('\n')
+        errors = self._build_configs()
+        if not errors:
+            log.info('*** Starting', len(self.routers), 'routers\n')
+            errors = self._start_routers()
+            log.info('\n')
+        self._finish_start(errors)
+
+    def astart(self):
+        """Coroutine starting the network, see ipmininet.aio.astart_network
+        """
+        from . import aio
+        return aio.astart_network(self)
+
+    def _build_configs(self):
+        """Build the configurations of all routers
+
+        :return: the list of (router, error) for the routers whose
+                 configuration could not be built"""
+        log.info('*** Building the configuration of', len(self.routers),
+                 'routers\n')
+        return build_configs(self.routers, workers=self.config_workers)
+
+    def _finish_start(self, errors):
+        """Abort if some routers failed to start, then set the default routes
+        of the hosts
+
+        :param errors: the list of (router, error) for the routers that
+                       failed to start"""
+        if errors:
+            for router, err in errors:
+                log.error('*** Router', router.name, 'failed to start:\n',
+                          str(err), '\n')
+            log.error('Some routers failed to start, aborting!\n')
+            mininet.clean.cleanup()
+            sys.exit(1)
         log.info('*** Setting default host routes\n')
         for h in self.hosts:
             if 'defaultRoute' in h.params:
                 continue  # Skipping hosts with explicit default route
             default = False
+            # The routes of a host are set in a single round-trip
+            batch = CommandBatch(h)
             # The first router we find will become the default gateway
             for itf in realIntfList(h):
                 for r in itf.broadcast_domain.routers:
                     log.info('%s via %s, ' % (h.name, r.name))
                     if self.use_v4 and len(r.addresses[4]) > 0:
-                        h.setDefaultRoute('via %s' % r.ip)
+                        # As h.setDefaultRoute('via %s' % r.ip)
+                        batch.add('ip route del default')
+                        batch.add('ip route add default via %s' % r.ip)
                         default = True
                     if (self.use_v6 and len(r.addresses[6]) > 0 and
                             len(r.ra_prefixes)) == 0:
                         # We define a default route only if router xi
                         # advertisement are not activated. If we call the same
                         # function, the route created above might be deleted
-                        h.cmd('ip route add default dev %s via %s' % (
+                        batch.add('ip route add default dev %s via %s' % (
                             h.defaultIntf(), r.ip6))
                         default = True
                     break
                 if default:
                     break
+            batch.run()
             if not default:
                 log.info('skipping %s , ' % h.name)
         if self.topo.register_hosts:
             self._register_etc_hosts("hosts_copy")
         log.info('\n')
 
+    def _start_routers(self):
+        """Start all routers, using up to start_workers concurrent workers
+
+        :return: the list of (router, error) for the routers that failed"""
+        workers = min(self.start_workers, len(self.routers))
+        if workers <= 1:
+            results = map(self._start_router, self.routers)
+            return [r for r in results if r is not None]
+        pool = ThreadPool(workers)
+        try:
+            return [r for r in pool.imap_unordered(self._start_router,
+                                                   self.routers)
+                    if r is not None]
+        finally:
+            pool.close()
+            pool.join()
+
+    @staticmethod
+    def _start_router(router):
+        """Start a router and report its failure instead of raising it
+
+        :return: None if the router started, (router, error) otherwise"""
+        try:
+            router.start(build_config=False)
+        except Exception as e:
+            return router, e
+        finally:
+            log.info(router.name + ' ')
+        return None
+
     def stop(self):
+        self._stop_routers()
+        super(IPNet, self).stop()
+        self._close_address_monitors()
+
+    def astop(self):
+        """Coroutine stopping the network, see ipmininet.aio.astop_network"""
+        from . import aio
+        return aio.astop_network(self)
+
+    def _stop_routers(self):
         if self.topo.register_hosts:
             self._unregister_etc_hosts("hosts_copy")
         log.info('*** Stopping', len(self.routers),  'routers\n')
@@ -214,11 +385,19 @@ class IPNet(Mininet):
             log.info(router.name + ' ')
             router.terminate()
         log.info('\n')
-        super(IPNet, self).stop()
+
+    def _close_address_monitors(self):
+        for node in self.values():
+            close_address_monitor(node)
 
     def build(self):
         super(IPNet, self).build()
+        # Stop tracking the interfaces of a previous build
+        for d in self.broadcast_domains or ():
+            d.detach()
         self.broadcast_domains = self._broadcast_domains()
+        self.peer_index.clear()
+        self.routerid_allocator.clear()
         log.info("*** Found", len(self.broadcast_domains),
                  "broadcast domains\n")
         if self.allocate_IPs:
@@ -232,6 +411,7 @@ class IPNet(Mininet):
                 self.broadcast_domains.append(BroadcastDomain(itf))
             except KeyError:
                 log.error('!!! Node', n, 'not found!\n')
+        self._register_ips()
         try:
             self.topo.post_build(self)
         except AttributeError as e:
@@ -252,12 +432,54 @@ class IPNet(Mininet):
     def _allocate_IPs(self):
         """Allocate IP addresses on every interface in every broadcast
         domain"""
+        # In batch mode, we first compute the addresses of every interface,
+        # then assign them all at once
+        plan = {} if self.batch_allocation else None
         if self.use_v4:
-            self._allocate_ipv4()
+            self._allocate_ipv4(plan)
         if self.use_v6:
-            self._allocate_ipv6()
-
-    def _allocate_ipv4(self):
+            self._allocate_ipv6(plan)
+        if plan:
+            log.info("*** Assigning the allocated addresses\n")
+            set_addresses(plan)
+
+    def _register_ips(self):
+        """Index the addresses of every interface to be able to do
+        inverse-lookups, and keep that index up-to-date when the addresses
+        of an interface change"""
+        for intf in self._indexed_intfs:
+            intf.remove_address_listener(self._update_ip_index)
+        self._indexed_intfs = []
+        self._ip_index = PrefixIndex()
+        for n in self.values():
+            # Read back the outdated addresses with one request per node
+            refresh_addresses(n, force=False)
+            for intf in n.intfList():
+                if not isinstance(intf, IPIntf):
+                    continue
+                self._update_ip_index(intf, list(intf.ips()) +
+                                      list(intf.ip6s(exclude_lls=True)), [])
+                intf.add_address_listener(self._update_ip_index)
+                self._indexed_intfs.append(intf)
+
+    def _update_ip_index(self, intf, added, removed):
+        """Update the index of addresses following a change of the
+        addresses of an interface"""
+        for ip in removed:
+            if not ip.is_loopback and not ip.is_link_local:
+                try:
+                    self._ip_index.remove(ip, intf)
+                except KeyError:
+                    pass
+        for ip in added:
+            if not ip.is_loopback and not ip.is_link_local:
+                self._ip_index.add(ip, intf)
+
+    def _allocate_ipv4(self, plan=None):
+        """Allocate IPv4 addresses to the interfaces without one
+
+        :param plan: if not None, a dict {intf: [ip_interface]} to which the
+                     allocated addresses are added instead of being set"""
         log.info("*** Allocating IPv4 addresses\n")
         self._allocate_subnets(self._unallocated_ipbase,
                                self.broadcast_domains,
@@ -270,15 +492,18 @@ class IPNet(Mininet):
             if not domain.use_ip_version(4):
                 continue
             for intf in domain:
-                if len(list(intf.ips())) == 0:
-                    ips = tuple(domain.next_ipv4()
-                                for _ in range(intf.interface_width[0]))
-                    intf.setIP(ips)
-                for ip in intf.ips():
-                    self._ip_allocs[ip.with_prefixlen] = intf.node
-                    self._ip_allocs[ip.ip.compressed] = intf.node
-
-    def _allocate_ipv6(self):
+                if next(intf.ips(), None) is None:
+                    ips = domain.next_ipv4s(intf.interface_width[0])
+                    if plan is None:
+                        intf.setIP(ips)
+                    else:
+                        plan.setdefault(intf, []).extend(ips)
+
+    def _allocate_ipv6(self, plan=None):
+        """Allocate IPv6 addresses to the interfaces without one
+
+        :param plan: if not None, a dict {intf: [ip_interface]} to which the
+                     allocated addresses are added instead of being set"""
         log.info("*** Allocating IPv6 addresses\n")
         self._allocate_subnets(self._unallocated_ip6base,
                                self.broadcast_domains,
@@ -291,13 +516,12 @@ class IPNet(Mininet):
             if not domain.use_ip_version(6):
                 continue
             for intf in domain:
-                if len(list(intf.ip6s(exclude_lls=True))) == 0:
-                    ips = tuple(domain.next_ipv6()
-                                for _ in range(intf.interface_width[1]))
-                    intf.setIP6(ips)
-                for ip in intf.ip6s(exclude_lls=True):
-                    self._ip_allocs[ip.with_prefixlen] = intf.node
-                    self._ip_allocs[ip.ip.compressed] = intf.node
+                if next(intf.ip6s(exclude_lls=True), None) is None:
+                    ips = domain.next_ipv6s(intf.interface_width[1])
+                    if plan is None:
+                        intf.setIP6(ips)
+                    else:
+                        plan.setdefault(intf, []).extend(ips)
 
     @staticmethod
     def _allocate_subnets(subnets, domains, domainlen='len_v4',
@@ -305,17 +529,13 @@ class IPNet(Mininet):
                           max_prefixlen=24, allocated_subnets=()):
         """Allocate subnets to broadcast domains.
 
-        We keep the subnets sorted as x < y wrt the available number of
-        addresses in the subnet so that the bigger domains
-        take the smallest subnets before subdividing them.
-        As the domains range from the biggest to the smallest, and the subnets
-        from the smallest to the biggest, the biggest domains will take the
-        first subnet that is able to contain it, and split it in several
-        subnets until it is restricted to its prefix.
-        The next domain then is necessarily of the same size (reuses on of the
-        split subnets) or smaller (uses a previsouly split subnet or splits a
-        bigger one). This avoids wasting of addresses (wrt. the specified
-        max_prefixlen) at the cost of a quadratic (?) behavior.
+        The domains are served from the biggest to the smallest. Each of them
+        takes the smallest free subnet that is able to contain it, and splits
+        it in several subnets until it is restricted to its prefix (see
+        SubnetAllocator). The next domain then is necessarily of the same
+        size (reuses one of the split subnets) or smaller (uses a previously
+        split subnet or splits a bigger one). This avoids wasting of addresses
+        (wrt. the specified max_prefixlen).
 
         :param subnets: a list of ip_network of available subnets. This list
                         will be modified to account for the new allocations.
@@ -329,103 +549,44 @@ class IPNet(Mininet):
         :param max_prefixlen: The maximal prefixlen that can be allocated,
                                 e.g. to not allocate /126 for IPv6 P2P links
         :param allocated_subnets: The subnets that are already allocated and
-                                  cannot be allocated to another domain
-        :return: iterator of (domain, subnet)"""
-        _domainlen = methodcaller(domainlen)
-        domains.sort(key=_domainlen, reverse=True)
-        _prefixlen = attrgetter('prefixlen')
-        subnets.sort(key=_prefixlen, reverse=True)
+                                  cannot be allocated to another domain"""
+        domains.sort(key=methodcaller(domainlen), reverse=True)
         ip_version = 4 if net_key == 'net' else 6
-        for d in domains:
-            if not d.use_ip_version(ip_version):
-                continue
-            if not subnets:
-                raise ValueError('No subnet left in the prefix space for all'
-                                 'broadcast domains.')
-            plen = min(max_prefixlen, getattr(d, size_key))
-            if plen < subnets[-1].prefixlen:
-                raise ValueError('Could not find a subnet big enough for a '
-                                 'broadcast domain.')
-            log.debug('Allocating prefix', plen, 'for interfaces',
-                      d.interfaces)
-            # Try to find a suitable subnet in the list
-            for i, net in enumerate(subnets):
-                nets = []
-                # if the subnet is too big for the prefix, perform a left
-                # expansion (only expand one at a time to keep subnets as
-                # aggregated as possible).
-                while plen > net.prefixlen:
-                    # Get list of subnets and append to list of previous
-                    # expanded subnets as it is bigger wrt. prefixlen
-                    net, next_net = tuple(net.subnets(prefixlen_diff=1))
-                    # If not a subnet of an allocated subnet
-                    if len(list(filter(lambda y: next_net in y, allocated_subnets))) == 0:
-                        nets.append(next_net)
-                # Check if we have an appropriately-sized subnet
-                if plen == net.prefixlen:
-                    # If the network overlaps with an allocated subnet, we pass it
-                    if len(list(filter(lambda y: net in y or y in net, allocated_subnets))) == 0:
-                        # Register the allocation
-                        setattr(d, net_key, net)
-                    # Delete the expanded/used subnet
-                    del subnets[i]
-                    # Insert the created subnets if any
-                    subnets.extend(nets)
-                    # Sort the array again
-                    subnets.sort(key=_prefixlen, reverse=True)
-                    # Proceed to the next broadcast domain
-                    break
-                # Otherwise try the next network for the current domain
+        allocator = SubnetAllocator(subnets, reserved=allocated_subnets)
+        # Formatting the debug messages is expensive for large topologies
+        debug = log.isEnabledFor(logging.DEBUG)
+        try:
+            for d in domains:
+                if not d.use_ip_version(ip_version):
+                    continue
+                plen = min(max_prefixlen, getattr(d, size_key))
+                if debug:
+                    log.debug('Allocating prefix', plen, 'for interfaces',
+                              d.interfaces)
+                setattr(d, net_key, allocator.allocate(plen))
+        finally:
+            subnets[:] = allocator.free_subnets()
 
     def _broadcast_domains(self):
-        """Build the broadcast domains for this topology"""
+        """Build the broadcast domains for this topology, exploring every
+        interface once"""
         domains = []
-        interfaces = {intf: False
-                      for n in self.values()
+        visited = set()
+        interfaces = [intf for n in self.values()
                       if BroadcastDomain.is_domain_boundary(n)
-                      for intf in realIntfList(n)}
-        interfaces.update({r.intf('lo'): False for r in self.routers})
-        for intf, explored in interfaces.items():
+                      for intf in realIntfList(n)]
+        interfaces.extend(r.intf('lo') for r in self.routers)
+        for intf in interfaces:
             # the interface already belongs to a broadcast domain
-            if explored:
+            if intf in visited:
                 continue
             # create a new domain and explore the interface
-            bd = BroadcastDomain(intf)
-            # Mark all explored interfaces belonging to that domain
+            bd = BroadcastDomain(intf, visited=visited)
             for i in bd:
-                interfaces[i] = True
                 i.broadcast_domain = bd
             domains.append(bd)
         return domains
 
-    def _ping_set(self, src, dst_dict, timeout, v4=True):
-        """Do the actual ping to the dict of {dst: dst_ip} from src
-
-           :param src: origin of the ping
-           :param dst_dict: destinations {dst: dst_ip} of the ping
-           :param timeout: the time to wait for a response, as string
-           :param v4: whether IPv4 or IPv6 is used
-           :param return: a tuple (lost packets, sent packets)"""
-        if len(dst_dict) == 0:
-            return 0, 0
-        lost = 0
-        packets = 0
-        opts = ''
-        if timeout:
-            opts = '-W %s' % timeout
-
-        log.output("%s --%s--> " % (src.name, "IPv4" if v4 else "IPv6"))
-        for dst, dst_ip in dst_dict.items():
-            result = src.cmd('%s -c1 %s %s' % ("ping" if v4 else PING6_CMD,
-                                               opts, dst_ip))
-            sent, received = self._parsePing(result)
-            lost += sent - received
-            packets += sent
-            log.output("%s " % dst.name if received else "X ")
-        log.output('\n')
-
-        return lost, packets
-
     def ping(self, hosts=None, timeout=None, use_v4=True, use_v6=True):
         """Ping between all specified hosts.
            If use_v4 is true, pings over IPv4 are used between any pair of
@@ -442,10 +603,6 @@ class IPNet(Mininet):
            :return: the packet loss percentage of IPv4 connectivity if
                     self.use_v4 is set the loss percentage of IPv6 connectivity
                     otherwise"""
-        packets = lost = 0
-        if not hosts:
-            hosts = self.hosts
-        incompatible_hosts = {}
         if not use_v4 and not use_v6:
             log.output("*** Warning: Parameters forbid both IPv4 and IPv6 for "
                        "pings\n")
@@ -455,6 +612,45 @@ class IPNet(Mininet):
                    % ("IPv4" if use_v4 else "",
                       " and " if use_v4 and use_v6 else "",
                       "IPv6" if use_v6 else ""))
+        return self._ping_report(self.reachability(hosts, timeout, use_v4,
+                                                   use_v6))
+
+    def reachability(self, hosts=None, timeout=None, use_v4=True,
+                     use_v6=True):
+        """Probe the reachability between all specified hosts, selecting the
+        destination addresses as in ping. All sources probe their
+        destinations concurrently, see ipmininet.reachability.
+
+           :param hosts: list of hosts or None if all must be probed
+           :param timeout: time to wait for a response, in seconds
+           :param use_v4: whether IPv4 addresses can be used
+           :param use_v6: whether IPv6 addresses can be used
+           :return: a ReachabilityMatrix"""
+        plan, incompatible_hosts = self._ping_plan(hosts or self.hosts,
+                                                   use_v4, use_v6)
+        return probe(plan, timeout=timeout,
+                     incompatible_hosts=incompatible_hosts)
+
+    def aping(self, hosts=None, timeout=None, use_v4=True, use_v6=True):
+        """Coroutine pinging between all specified hosts, see
+        ipmininet.aio.aping"""
+        from . import aio
+        return aio.aping(self, hosts=hosts, timeout=timeout, use_v4=use_v4,
+                         use_v6=use_v6)
+
+    @staticmethod
+    def _ping_plan(hosts, use_v4, use_v6):
+        """Select the addresses to ping between each pair of hosts
+
+        :param hosts: the list of hosts to ping between
+        :param use_v4: whether IPv4 addresses can be used
+        :param use_v6: whether IPv6 addresses can be used
+        :return: the list of (src, {dst: dst_ip}, {dst: dst_ip6}) for each
+                 source, and the dict {node name: set of node names} of the
+                 pairs of hosts without global address in the same IP
+                 version"""
+        plan = []
+        incompatible_hosts = {}
         for src in hosts:
             src_ip, src_ip6 = address_pair(src, use_v4, use_v6)
             ping_dict = {}
@@ -474,19 +670,32 @@ class IPNet(Mininet):
                         if node2.name not in incompatible_hosts.setdefault(
                                 node1.name, set()):
                             incompatible_hosts[node1.name].add(node2.name)
+            plan.append((src, ping_dict, ping6_dict))
+        return plan, incompatible_hosts
 
-            result = self._ping_set(src, ping_dict, timeout, True)
-            lost += result[0]
-            packets += result[1]
-            result = self._ping_set(src, ping6_dict, timeout, False)
-            lost += result[0]
-            packets += result[1]
-
-        for node1, incompatibilities in incompatible_hosts.items():
+    @staticmethod
+    def _ping_report(matrix):
+        """Log the outcome of the pings
+
+        :param matrix: the ReachabilityMatrix of the pings
+        :return: the packet loss percentage"""
+        current = None
+        for src, dst, version, _, received, _ in matrix:
+            if (src, version) != current:
+                if current is not None:
+                    log.output('\n')
+                current = src, version
+                log.output("%s --IPv%d--> " % current)
+            log.output("%s " % dst if received else "X ")
+        if current is not None:
+            log.output('\n')
+
+        for node1, incompatibilities in matrix.incompatible_hosts.items():
             for node2 in incompatibilities:
                 log.output("*** Warning: %s and %s have no global address "
                            "in the same IP version\n" % (node1, node2))
 
+        packets, lost = matrix.packets, matrix.lost
         if packets > 0:
             ploss = 100.0 * lost / packets
             received = packets - lost
@@ -577,7 +786,10 @@ class BroadcastDomain(object):
         """Initialize the broadcast domain and optionally explore a set of
         interfaces
 
-        :param interfaces: one Intf or a list of Intf"""
+        :param interfaces: one Intf or a list of Intf
+        :param visited: the set of interfaces that were already explored,
+                        see explore()"""
+        visited = kwargs.pop('visited', None)
         super(BroadcastDomain, self).__init__(*args, **kwargs)
         self.interfaces = set()
         self.net = None
@@ -586,23 +798,32 @@ class BroadcastDomain(object):
         # self._allocated_v6 = 0  # We can use the full address space
         self._allocated_v6 = 1  # FIXME null-addresses are routed directly
         # to the routers loopback .. Might be a bug in the netns code.
+        # The number of addresses per IP version, the contribution of each
+        # interface to these numbers, and the interfaces split between
+        # routers and hosts. They are updated as interfaces join or leave the
+        # domain, and as their addresses change.
+        self._len = {4: 0, 6: 0}
+        self._widths = {}
+        self._routers = []
+        self._hosts = []
         if interfaces:
             if not isinstance(interfaces, list):
                 interfaces = [interfaces]
-            self.explore(interfaces)
+            self.explore(interfaces, visited=visited)
 
         # Retrieve pre-fixed subnets
         self.fixed_net4s = []
         self.fixed_net6s = []
+        seen = set()
         for i in self.interfaces:
-            for ip in i.ips():
-                net = ip_interface(ip).network
-                if net not in self.fixed_net4s:
-                    self.fixed_net4s.append(net)
-            for ip6 in i.ip6s(exclude_lls=True):
-                net6 = ip_interface(ip6).network
-                if net6 not in self.fixed_net6s:
-                    self.fixed_net6s.append(net6)
+            for ip in chain(i.ips(), i.ip6s(exclude_lls=True)):
+                net = ip.network
+                if net not in seen:
+                    seen.add(net)
+                    if net.version == 4:
+                        self.fixed_net4s.append(net)
+                    else:
+                        self.fixed_net6s.append(net)
 
     @staticmethod
     def is_domain_boundary(node):
@@ -615,37 +836,101 @@ class BroadcastDomain(object):
         """Iterates over all interfaces in this broadcast domain"""
         return iter(self.interfaces)
 
+    def __contains__(self, intf):
+        """Return whether an interface belongs to this broadcast domain"""
+        return intf in self.interfaces
+
     def len_v4(self):
         """The number of IPv4 addresses in this broadcast domain"""
-        return sum(map(lambda x: x.interface_width[0]
-                       if len(list(x.ips())) else 0, self.interfaces))
+        return self._len[4]
 
     def len_v6(self):
         """The number of IPv6 addresses in this broadcast domain"""
-        return sum(map(lambda x: x.interface_width[1]
-                       if len(list(x.ip6s(exclude_lls=True))) else 0, self.interfaces))
-
-    def explore(self, itfs):
+        return self._len[6]
+
+    def add_interface(self, intf):
+        """Add an interface to this broadcast domain
+
+        :param intf: an Intf
+        :return: False if the interface already belonged to this domain"""
+        if intf in self.interfaces:
+            return False
+        self.interfaces.add(intf)
+        if L3Router.is_l3router_intf(intf):
+            self._routers.append(intf)
+        else:
+            self._hosts.append(intf)
+        self._count_addresses(intf)
+        if isinstance(intf, IPIntf):
+            intf.add_address_listener(self._addresses_changed)
+        return True
+
+    def remove_interface(self, intf):
+        """Remove an interface from this broadcast domain
+
+        :param intf: an Intf
+        :raise KeyError: if the interface does not belong to this domain"""
+        self.interfaces.remove(intf)
+        if L3Router.is_l3router_intf(intf):
+            self._routers.remove(intf)
+        else:
+            self._hosts.remove(intf)
+        width_v4, width_v6 = self._widths.pop(intf)
+        self._len[4] -= width_v4
+        self._len[6] -= width_v6
+        if isinstance(intf, IPIntf):
+            intf.remove_address_listener(self._addresses_changed)
+
+    def _count_addresses(self, intf):
+        """Update the number of addresses of this domain with the current
+        contribution of an interface"""
+        old_v4, old_v6 = self._widths.get(intf, (0, 0))
+        width_v4, width_v6 = intf.interface_width
+        if next(intf.ips(), None) is None:
+            width_v4 = 0
+        if next(intf.ip6s(exclude_lls=True), None) is None:
+            width_v6 = 0
+        self._widths[intf] = width_v4, width_v6
+        self._len[4] += width_v4 - old_v4
+        self._len[6] += width_v6 - old_v6
+
+    def _addresses_changed(self, intf, added, removed):
+        self._count_addresses(intf)
+
+    def detach(self):
+        """Stop following the address changes of the interfaces of this
+        domain, e.g. as it is replaced by a new domain"""
+        for intf in self.interfaces:
+            if isinstance(intf, IPIntf):
+                intf.remove_address_listener(self._addresses_changed)
+
+    def explore(self, itfs, visited=None):
         """Explore a new list of interfaces and add them and their neightbors
         to this broadcast domain
 
-        :param itf: a list of Intf"""
-        visited = []
+        :param itf: a list of Intf
+        :param visited: the set of interfaces that were already explored,
+                        which is updated with the newly explored ones. This
+                        allows to explore a whole network once, as an
+                        interface belongs to a single broadcast domain."""
+        if visited is None:
+            visited = set()
         while itfs:
             # Explore one element
             i = itfs.pop()
             if i in visited:
                 continue
-            visited.append(i)
+            visited.add(i)
             if self.is_domain_boundary(i.node):
-                self.interfaces.add(i)
+                self.add_interface(i)
             # check its corresponding interface
             other = otherIntf(i)
             if not other:  # This is an unbound interface
                 continue
             # if it is a L3 boundary register it and stop there
             if self.is_domain_boundary(other.node):
-                self.interfaces.add(other)
+                self.add_interface(other)
+                visited.add(other)
             else:
                 # explode the node's interface to explore them
                 itfs.extend([x for x in realIntfList(other.node)
@@ -667,35 +952,69 @@ class BroadcastDomain(object):
     @property
     def routers(self):
         """List all interfaces in this domain belonging to a L3 router"""
-        return [i for i in self.interfaces if L3Router.is_l3router_intf(i)]
+        return list(self._routers)
+
+    @property
+    def hosts(self):
+        """List all interfaces in this domain not belonging to a L3 router"""
+        return list(self._hosts)
 
     def next_ipv4(self):
         """Allocate and return the next available IPv4 address in this
         domain
 
         :return ip_interface:"""
-        try:
-            addr = self.net[self._allocated_v4]
-            self._allocated_v4 += 1
-            return ip_interface(u'%s/%d' % (addr, self.net.prefixlen))
-        except IndexError:
-            raise ValueError('No more available IPv4 address')
-        except TypeError:
-            raise ValueError('No associated IPv4 subnet')
+        return self.next_ipv4s(1)[0]
 
     def next_ipv6(self):
         """Allocate and return the next available IPv6 address in this
         domain
 
         :return ip_interface:"""
-        try:
-            addr = self.net6[self._allocated_v6]
-            self._allocated_v6 += 1
-            return ip_interface(u'%s/%d' % (addr, self.net6.prefixlen))
-        except IndexError:
-            raise ValueError('No more available IPv6 address')
-        except TypeError:
-            raise ValueError('No associated IPv6 subnet')
+        return self.next_ipv6s(1)[0]
+
+    def next_ipv4s(self, count):
+        """Allocate and return the next count available IPv4 addresses in
+        this domain
+
+        :return: a list of ip_interface"""
+        return interfaces_of(self.next_ipv4_block(count), self.net.prefixlen,
+                             version=4)
+
+    def next_ipv6s(self, count):
+        """Allocate and return the next count available IPv6 addresses in
+        this domain
+
+        :return: a list of ip_interface"""
+        return interfaces_of(self.next_ipv6_block(count),
+                             self.net6.prefixlen, version=6)
+
+    def next_ipv4_block(self, count):
+        """Allocate a contiguous block of IPv4 addresses in this domain
+
+        :param count: the number of addresses to allocate
+        :return: the range of the allocated addresses, as integers"""
+        block = self._next_block(self.net, self._allocated_v4, count, 4)
+        self._allocated_v4 += count
+        return block
+
+    def next_ipv6_block(self, count):
+        """Allocate a contiguous block of IPv6 addresses in this domain
+
+        :param count: the number of addresses to allocate
+        :return: the range of the allocated addresses, as integers"""
+        block = self._next_block(self.net6, self._allocated_v6, count, 6)
+        self._allocated_v6 += count
+        return block
+
+    @staticmethod
+    def _next_block(net, allocated, count, version):
+        if net is None:
+            raise ValueError('No associated IPv%d subnet' % version)
+        if allocated + count > net.num_addresses:
+            raise ValueError('No more available IPv%d address' % version)
+        first = int(net.network_address) + allocated
+        return range(first, first + count)
 
     def use_ip_version(self, ip_version):
         """ Checks whether it makes sense to allocate a subnet
@@ -709,4 +1028,4 @@ class BroadcastDomain(object):
         for i in self.routers:
             if i.node.use_v4 and ip_version == 4 or i.node.use_v6 and ip_version == 6:
                 return True
-        return len(self.interfaces) - len(self.routers) > 1
+        return len(self._hosts) > 1
@@ -9,14 +9,15 @@ from mininet.log import lg
 from ipmininet.overlay import Overlay, Subnet
 from ipmininet.utils import get_set
 from ipmininet.router.config import BasicRouterConfig, OSPFArea, AS,\
-    iBGPFullMesh, OpenrDomain
+    iBGPFullMesh, iBGPRouteReflection, OpenrDomain
 
 
 class IPTopo(Topo):
     """A topology that supports L3 routers"""
 
     OVERLAYS = {cls.__name__: cls
-                for cls in (AS, iBGPFullMesh, OpenrDomain, OSPFArea, Subnet)}
+                for cls in (AS, iBGPFullMesh, iBGPRouteReflection, OpenrDomain,
+                            OSPFArea, Subnet)}
 
     def __init__(self, *args, **kwargs):
         self.overlays = []
@@ -5,12 +5,16 @@ from builtins import str
 from ipmininet import basestring
 
 from itertools import chain
+import collections
 import subprocess
 from ipaddress import ip_interface, IPv4Interface, IPv6Interface
 import functools
+import threading
+import weakref
 
 from . import OSPF_DEFAULT_AREA, MIN_IGP_METRIC
-from .utils import otherIntf, is_container
+from .netlink import interface_addresses, NetlinkError, Monitor
+from .utils import otherIntf, is_container, CommandBatch
 
 # Apparently there is a circular import between mininet.link and mininet.node,
 # break it by importing node first
@@ -23,17 +27,39 @@ from mininet.log import lg as log
 class IPIntf(_m.Intf):
     """This class represents a node interface. It is IP-agnostic, as in
     its `addresses` attribute is a dictionnary keyed by IP version,
-    containing the list of all addresses for a given version"""
+    containing the list of all addresses for a given version.
+
+    The addresses are cached, and only read back from the kernel if a netlink
+    monitor reported a change in the namespace of the node (or always if
+    such monitor cannot be used), or if a refresh is explicitly forced."""
+
+    # Whether the addresses are read back using netlink rather than by parsing
+    # the output of ip address, unless overridden with the netlink parameter
+    NETLINK = False
+
     def __init__(self, *args, **kwargs):
+        """:param netlink: Whether the addresses of this interface should be
+                        read back through netlink, defaults to
+                        IPIntf.NETLINK
+        :param provisioned: Whether the interface was already brought up by
+                            provision_links, in which case its addresses are
+                            only read back when first needed"""
         # Only one IP broadcast domain per interface, VLANs are supported
         # by aliasing interfaces.
         self.broadcast_domain = None
         self.addresses = {4: [], 6: []}
+        self._stale = True
+        self._address_listeners = []
         self.ra_prefixes = kwargs.pop('ra', [])
         self.rdnss_list = kwargs.pop('rdnss', [])
+        self.netlink = kwargs.pop('netlink', self.NETLINK)
+        provisioned = kwargs.pop('provisioned', False)
+        if provisioned:
+            kwargs['up'] = None
         super(IPIntf, self).__init__(*args, **kwargs)
-        self.isUp(setUp=True)
-        self._refresh_addresses()
+        if not provisioned:
+            self.isUp(setUp=True)
+            self._refresh_addresses()
 
     @property
     def igp_area(self):
@@ -61,6 +87,14 @@ class IPIntf(_m.Intf):
         """Check for a given key in the interface parameters"""
         return self.params.get(key, val)
 
+    def cmd(self, *args, **kwargs):
+        """Run a command in the node of this interface, without its shell if
+        the node has a NamespaceExecutor"""
+        executor = getattr(self.node, 'executor', None)
+        if executor is None:
+            return super(IPIntf, self).cmd(*args, **kwargs)
+        return executor.call(*args, **kwargs)
+
     def __default(self, version):
         """Return the default addresses for a given IP version
         :raise IndexError:"""
@@ -147,7 +181,7 @@ class IPIntf(_m.Intf):
         setv4 = setv6 = False
         lb_v4_update = lb_v6_update = False
         # Make sure we have an up-to-date view of our addresses
-        self._refresh_addresses()
+        self._update_addresses()
         cmds = []
         # We want to iterate over the new ip sets
         if not is_container(ip):
@@ -179,10 +213,13 @@ class IPIntf(_m.Intf):
         if setv6:
             cleanup.append(self.ip6s(exclude_lls=True,
                                      exclude_lbs=not lb_v6_update))
+        # Remove them and assign the new ones in a single round-trip
+        batch = CommandBatch(self.node)
         for ip in chain.from_iterable(cleanup):
-            self._del_ip(ip)
-        # Assign IP
-        rval = [self.cmd(cmd) for cmd in cmds]
+            batch.add(*self._del_ip_cmd(ip))
+        added = [batch.add(cmd) for cmd in cmds]
+        results = batch.run()
+        rval = [results[i][0] for i in added]
         self._refresh_addresses()
         return rval.pop() if rval and len(rval) == 1 else rval
 
@@ -191,32 +228,230 @@ class IPIntf(_m.Intf):
         Does not update self.addresses!
 
         :param ip: ip_interface-like"""
-        self.cmd('ip', 'address', 'del', 'dev', self.name, ip.with_prefixlen)
+        self.cmd(*self._del_ip_cmd(ip))
+
+    def _del_ip_cmd(self, ip):
+        """Return the command removing an assigned IP from this interface"""
+        return 'ip', 'address', 'del', 'dev', self.name, ip.with_prefixlen
 
     setIP = setIP6 = _set_ip
 
+    def _poll_changes(self):
+        """Invalidate the cached addresses of all the interfaces of our node
+        if the kernel reported changes since the last call.
+
+        :return: False if the changes cannot be monitored"""
+        monitor = _address_monitor(self.node)
+        if monitor is None:
+            return False
+        if monitor.changed():
+            for itf in self.node.intfList():
+                if isinstance(itf, IPIntf):
+                    itf._stale = True
+        return True
+
+    def _update_addresses(self, force=False):
+        """Make sure the cached addresses of this interface are up-to-date
+
+        :param force: Read back the addresses even if nothing changed"""
+        if not self._poll_changes() or force or self._stale:
+            self._refresh_addresses()
+
     def _refresh_addresses(self):
         """Request and parse the addresses of this interface"""
-        self.mac, self.addresses[4], self.addresses[6] = _addresses_of(
-                                                               self.name, self)
-
-    def updateIP(self):
-        self._refresh_addresses()
+        # Consume the pending notifications first, so that any change
+        # happening after the read back will invalidate the cache
+        self._poll_changes()
+        if self.netlink:
+            try:
+                self._set_addresses(*_netlink_addresses_of(self.node)[
+                    self.name])
+                return
+            except (NetlinkError, KeyError) as e:
+                log.warning('Cannot read the addresses of', self.name,
+                            'through netlink (%s), falling back to ip address'
+                            % e, '\n')
+        self._set_addresses(*_addresses_of(self.name, self))
+
+    def _set_addresses(self, mac, v4, v6):
+        """Replace the recorded mac and addresses of this interface"""
+        old = list(chain(self.addresses[4], self.addresses[6]))
+        self.mac, self.addresses[4], self.addresses[6] = mac, v4, v6
+        self._stale = False
+        if self._address_listeners:
+            new = list(chain(v4, v6))
+            self._notify_address_listeners(
+                [ip for ip in new if ip not in old],
+                [ip for ip in old if ip not in new])
+
+    def _record_addresses(self, ips):
+        """Record addresses that were added to this interface without
+        reading them back from the kernel
+
+        :param ips: an iterable of ip_interface"""
+        ips = list(ips)
+        all_added = []
+        for version in (4, 6):
+            added = [ip for ip in ips if ip.version == version and
+                     ip not in self.addresses[version]]
+            if added:
+                self.addresses[version] = sorted(
+                    chain(self.addresses[version], added),
+                    key=OrderedAddress, reverse=True)
+                all_added.extend(added)
+        if all_added:
+            self._notify_address_listeners(all_added, [])
+
+    def add_address_listener(self, listener):
+        """Register a function to call whenever the recorded addresses of
+        this interface change
+
+        :param listener: a function called as listener(intf, added, removed)
+                         with added and removed the lists of ip_interface
+                         that were added and removed"""
+        self._address_listeners.append(listener)
+
+    def remove_address_listener(self, listener):
+        """Unregister an address listener"""
+        self._address_listeners.remove(listener)
+
+    def _notify_address_listeners(self, added, removed):
+        if added or removed:
+            for listener in list(self._address_listeners):
+                listener(self, added, removed)
+
+    def updateIP(self, force=False):
+        """:param force: Read back the addresses even if the cache is valid"""
+        self._update_addresses(force=force)
         return self.ip
 
-    def updateIP6(self):
-        self._refresh_addresses()
+    def updateIP6(self, force=False):
+        """:param force: Read back the addresses even if the cache is valid"""
+        self._update_addresses(force=force)
         return self.ip6
 
-    def updateMAC(self):
-        self._refresh_addresses()
+    def updateMAC(self, force=False):
+        """:param force: Read back the addresses even if the cache is valid"""
+        self._update_addresses(force=force)
         return self.mac
 
-    def updateAddr(self):
-        self._refresh_addresses()
+    def updateAddr(self, force=False):
+        """:param force: Read back the addresses even if the cache is valid"""
+        self._update_addresses(force=force)
         return self.ip, self.mac
 
 
+def ip_batch(node, script, force=True):
+    """Run a script of ip commands with a single ip -batch command
+
+    :param node: The node in whose namespace the commands are run, or None
+                 to run them in the root namespace
+    :param script: The commands, one per line, without the leading ip
+    :param force: Whether the commands following a failed one are run
+    :return: the exit code, stdout and stderr of the command"""
+    cmd = ['ip', '-force', '-batch', '-'] if force else ['ip', '-batch', '-']
+    executor = getattr(node, 'executor', None)
+    if executor is not None:
+        p = executor.popen(cmd, stdin=subprocess.PIPE)
+    elif node is not None:
+        p = node.popen(cmd, stdin=subprocess.PIPE)
+    else:
+        p = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate(script.encode('utf-8'))
+    return p.wait(), out.decode('utf-8'), err.decode('utf-8')
+
+
+def set_addresses(plan):
+    """Add addresses to many interfaces, using a single ip -batch command per
+    node, and record them in the interfaces without reading them back.
+
+    :param plan: a dict {IPIntf: [ip_interface]} of addresses to add"""
+    per_node = {}
+    for itf, ips in plan.items():
+        per_node.setdefault(itf.node, []).append((itf, ips))
+    for node, intfs in per_node.items():
+        script = ''.join('address add dev %s %s\n' % (itf.name,
+                                                      ip.with_prefixlen)
+                         for itf, ips in intfs for ip in ips)
+        code, out, err = ip_batch(node, script)
+        if code or out or err:
+            log.error('Failed to assign some addresses on', node.name, ':',
+                      err, '\n')
+            # Fallback to what the kernel actually has
+            refresh_addresses(node)
+        else:
+            for itf, ips in intfs:
+                itf._record_addresses(ips)
+
+
+def refresh_addresses(node, force=True):
+    """Refresh the addresses of all the interfaces of a node. Interfaces
+    using the netlink backend are all refreshed using a single dump.
+
+    :param node: The node whose interfaces should be refreshed
+    :param force: Read back the addresses even if nothing changed, otherwise
+                  only refresh the interfaces whose cached addresses may be
+                  outdated"""
+    intfs = [itf for itf in node.intfList() if isinstance(itf, IPIntf)]
+    if intfs and intfs[0]._poll_changes() and not force:
+        intfs = [itf for itf in intfs if itf._stale]
+    dump = None
+    if any(itf.netlink for itf in intfs):
+        try:
+            dump = _netlink_addresses_of(node)
+        except NetlinkError as e:
+            log.warning('Cannot read the addresses of', node.name,
+                        'through netlink:', str(e), '\n')
+    for itf in intfs:
+        if itf.netlink and dump is not None and itf.name in dump:
+            itf._set_addresses(*dump[itf.name])
+        else:
+            itf._refresh_addresses()
+
+
+# The netlink monitors of address changes, per node
+_monitors = weakref.WeakKeyDictionary()
+_monitors_lock = threading.Lock()
+
+
+def _address_monitor(node):
+    """Return the monitor of the address changes in the namespace of a node,
+    or None if such monitor cannot be created"""
+    with _monitors_lock:
+        try:
+            return _monitors[node]
+        except KeyError:
+            pass
+        try:
+            monitor = Monitor(node.pid if node.inNamespace else None)
+        except (NetlinkError, AttributeError) as e:
+            log.debug('Cannot monitor the addresses of', node.name, ':',
+                      str(e), '\n')
+            monitor = None
+        _monitors[node] = monitor
+        return monitor
+
+
+def close_address_monitor(node):
+    """Close the monitor of the address changes in the namespace of a node,
+    if any, as its socket keeps the namespace alive"""
+    with _monitors_lock:
+        monitor = _monitors.pop(node, None)
+    if monitor is not None:
+        monitor.close()
+
+
+def _netlink_addresses_of(node):
+    """Dump the addresses of all the interfaces of a node through netlink
+    :return: {name: (mac, [ipv4], [ipv6])}"""
+    pid = node.pid if node.inNamespace else None
+    return {name: (mac,
+                   sorted(v4, key=OrderedAddress, reverse=True),
+                   sorted(v6, key=OrderedAddress, reverse=True))
+            for name, (mac, v4, v6) in interface_addresses(pid).items()}
+
+
 def _addresses_of(devname, node=None):
     """Return the addresses of a named interface"""
     cmdline = ['ip', 'address', 'show', 'dev', devname]
@@ -265,10 +500,80 @@ def _parse_addresses(out):
 class IPLink(_m.Link):
     """A Link class that defaults to IPIntf"""
     def __init__(self, node1, node2, intf=IPIntf, *args, **kwargs):
-        """We override Link intf default to use IPIntf"""
+        """We override Link intf default to use IPIntf
+
+        :param provisioned: Whether the veth pair was already created, placed
+                            in the namespaces of the nodes and brought up by
+                            provision_links"""
+        self.provisioned = kwargs.pop('provisioned', False)
+        if self.provisioned:
+            for p in ('params1', 'params2'):
+                kwargs[p] = dict(kwargs.get(p) or {}, provisioned=True)
         super(IPLink, self).__init__(node1=node1, node2=node2,
                                      intf=intf, *args, **kwargs)
 
+    def makeIntfPair(self, *args, **kwargs):
+        if self.provisioned:
+            return
+        return super(IPLink, self).makeIntfPair(*args, **kwargs)
+
+
+def provision_links(plan):
+    """Create the veth pairs of many links at once. A single ip -batch
+    command creates all the pairs directly in the namespaces of their nodes,
+    then a single ip -batch command per namespace brings them up. The links
+    and their interfaces are then built from the plan, without running any
+    other command.
+
+    :param plan: A list of (cls, node1, node2, options), with cls an IPLink
+                 class and options the keyword arguments of its constructor.
+                 The ports and interface names that are not given are
+                 allocated as Mininet would when creating the links in order
+    :return: the list of links
+    :raise RuntimeError: if the veth pairs cannot be created"""
+    next_port = {}
+
+    def port_of(node, port):
+        if node not in next_port:
+            next_port[node] = node.newPort()
+        if port is None:
+            port = next_port[node]
+        next_port[node] = max(port + 1, next_port[node])
+        return port
+
+    create = []
+    up = collections.OrderedDict()  # namespace: (node, [interface names])
+    links = []
+    for cls, node1, node2, options in plan:
+        options = dict(options)
+        ends = []
+        for i, node in ((1, node1), (2, node2)):
+            port = port_of(node, options.get('port%d' % i))
+            name = options.get('intfName%d' % i) or \
+                '%s-eth%d' % (node.name, port)
+            options['port%d' % i], options['intfName%d' % i] = port, name
+            addr = options.get('addr%d' % i)
+            ends.append('name %s %snetns %s' % (
+                name, 'address %s ' % addr if addr else '', node.pid))
+            ns = node.pid if node.inNamespace else None
+            up.setdefault(ns, (node if ns else None, []))[1].append(name)
+        create.append('link add %s type veth peer %s\n' % tuple(ends))
+        links.append((cls, node1, node2, options))
+    if not links:
+        return []
+    code, _, err = ip_batch(None, ''.join(create), force=False)
+    if code:
+        raise RuntimeError('Error creating interface pairs: %s' % err)
+    for node, names in up.values():
+        code, _, err = ip_batch(node, ''.join('link set dev %s up\n' % name
+                                              for name in names))
+        if code:
+            log.error('Failed to bring up some interfaces of',
+                      node.name if node else 'the root namespace', ':', err,
+                      '\n')
+    return [cls(node1, node2, provisioned=True, **options)
+            for cls, node1, node2, options in links]
+
 
 # Monkey patch mininit.link ...
 TCIntf = _m.TCIntf
@@ -403,11 +708,11 @@ class GRETunnel(object):
         log.debug('Creating GRE tunnel named', name, ', for subnet',
                   str(address), 'from', if_local, '[', if_local.ip, '] to',
                   if_remote, '[', if_remote.ip, ']')
-        cmd = if_local.node.cmd
-        cmd('ip', 'tunnel', 'add', name, 'mode', 'gre', 'remote', if_remote.ip,
-            'local', if_local.ip, 'ttl', str(ttl))
-        cmd('ip', 'link', 'set', name, 'up')
-        cmd('ip', 'address', 'add', 'dev', name, address)
+        with CommandBatch(if_local.node) as b:
+            b.add('ip', 'tunnel', 'add', name, 'mode', 'gre', 'remote',
+                  if_remote.ip, 'local', if_local.ip, 'ttl', str(ttl))
+            b.add('ip', 'link', 'set', name, 'up')
+            b.add('ip', 'address', 'add', 'dev', name, address)
 
     def cleanup(self):
         self._del_tunnel(self.if1, self.gre1)
@@ -416,4 +721,4 @@ class GRETunnel(object):
 
     @staticmethod
     def _del_tunnel(if_local, name):
-        if_local.node.cmd('ip', 'tunnel', 'delete', name)
+        if_local.cmd('ip', 'tunnel', 'delete', name)
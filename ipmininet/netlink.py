@@ -0,0 +1,273 @@
+"""A minimal rtnetlink(7) client, used to read back the state of the
+interfaces of a node directly from the kernel instead of parsing the output of
+the ip command run in a shell. The netlink sockets are opened inside the
+network namespace of the node, by temporarily moving the calling thread into
+it with setns(2)."""
+import contextlib
+import ctypes
+import ctypes.util
+import errno
+import os
+import socket
+import struct
+import threading
+
+from ipaddress import ip_interface
+
+# Constants from linux/netlink.h and linux/rtnetlink.h
+NETLINK_ROUTE = 0
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+RTNLGRP_LINK = 1
+RTNLGRP_IPV4_IFADDR = 5
+RTNLGRP_IPV6_IFADDR = 9
+CLONE_NEWNET = 0x40000000
+
+_NLMSGHDR = struct.Struct('=LHHLL')
+_IFINFOMSG = struct.Struct('=BxHiII')
+_IFADDRMSG = struct.Struct('=BBBBI')
+_RTATTR = struct.Struct('=HH')
+_RECV_SIZE = 65536
+
+_libc = None
+_seq_lock = threading.Lock()
+_seq = 0
+
+
+class NetlinkError(OSError):
+    """A netlink request failed, or netlink is unavailable"""
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _next_seq():
+    global _seq
+    with _seq_lock:
+        _seq += 1
+        return _seq
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    return _libc
+
+
+@contextlib.contextmanager
+def in_namespace(pid):
+    """Move the calling thread in the network namespace of a process, and back
+    into its original namespace when leaving the context.
+
+    :param pid: the pid of a process in the target namespace, or None to stay
+                in the current namespace"""
+    if pid is None:
+        yield
+        return
+    libc = _load_libc()
+    own = os.open('/proc/thread-self/ns/net', os.O_RDONLY)
+    try:
+        target = os.open('/proc/%d/ns/net' % pid, os.O_RDONLY)
+        try:
+            if libc.setns(target, CLONE_NEWNET):
+                err = ctypes.get_errno()
+                raise NetlinkError(err, 'setns: %s' % os.strerror(err))
+        finally:
+            os.close(target)
+        try:
+            yield
+        finally:
+            if libc.setns(own, CLONE_NEWNET):
+                err = ctypes.get_errno()
+                # We cannot leave the thread in a wrong namespace
+                raise SystemError('Cannot restore the network namespace: %s'
+                                  % os.strerror(err))
+    finally:
+        os.close(own)
+
+
+def open_socket(pid=None, groups=0):
+    """Open a rtnetlink socket bound to a network namespace. The socket
+    remains attached to that namespace once it is created.
+
+    :param pid: the pid of a process in the target namespace, or None to use
+                the current one
+    :param groups: a bitmask of multicast groups to subscribe to
+    :raise NetlinkError: if the socket cannot be created"""
+    try:
+        with in_namespace(pid):
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                 NETLINK_ROUTE)
+    except (OSError, AttributeError) as e:
+        raise NetlinkError(*e.args)
+    try:
+        sock.bind((0, groups))
+    except socket.error as e:
+        sock.close()
+        raise NetlinkError(*e.args)
+    return sock
+
+
+def parse_attributes(data, offset):
+    """Return a dict {attribute type: payload} from a sequence of rtattr"""
+    attrs = {}
+    while offset + _RTATTR.size <= len(data):
+        length, rta_type = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        attrs[rta_type] = data[offset + _RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def parse_messages(data):
+    """Return a generator of (type, payload) for each netlink message in
+    data. NLMSG_ERROR messages with a non-zero error raise NetlinkError."""
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(data):
+        length, msg_type, _, _, _ = _NLMSGHDR.unpack_from(data, offset)
+        if length < _NLMSGHDR.size:
+            break
+        payload = data[offset + _NLMSGHDR.size:offset + length]
+        if msg_type == NLMSG_ERROR:
+            err = -struct.unpack_from('=i', payload)[0]
+            if err:
+                raise NetlinkError(err, os.strerror(err))
+        yield msg_type, payload
+        offset += _align(length)
+
+
+def _dump(sock, msg_type, family=socket.AF_UNSPEC):
+    """Issue a dump request and return all the replies' (type, payload)"""
+    seq = _next_seq()
+    body = _IFINFOMSG.pack(family, 0, 0, 0, 0) if msg_type == RTM_GETLINK \
+        else _IFADDRMSG.pack(family, 0, 0, 0, 0)
+    sock.send(_NLMSGHDR.pack(_NLMSGHDR.size + len(body), msg_type,
+                             NLM_F_REQUEST | NLM_F_DUMP, seq, 0) + body)
+    replies = []
+    while True:
+        for reply in parse_messages(sock.recv(_RECV_SIZE)):
+            if reply[0] == NLMSG_DONE:
+                return replies
+            replies.append(reply)
+
+
+def format_lladdr(data):
+    """Format a link-layer address the same way as the ip command"""
+    if len(data) == 4:
+        return socket.inet_ntop(socket.AF_INET, data)
+    if len(data) == 16:
+        return socket.inet_ntop(socket.AF_INET6, data)
+    return ':'.join('%02x' % b for b in bytearray(data))
+
+
+def parse_link(payload):
+    """Return (index, name, lladdr) from a RTM_NEWLINK payload"""
+    _, _, index, _, _ = _IFINFOMSG.unpack_from(payload)
+    attrs = parse_attributes(payload, _IFINFOMSG.size)
+    name = attrs.get(IFLA_IFNAME, b'').rstrip(b'\0').decode('utf-8')
+    lladdr = attrs.get(IFLA_ADDRESS)
+    return index, name, format_lladdr(lladdr) if lladdr else None
+
+
+def parse_address(payload):
+    """Return (index, ip_interface) from a RTM_NEWADDR payload, or
+    (index, None) if it does not carry an IPv4/IPv6 address"""
+    family, prefixlen, _, _, index = _IFADDRMSG.unpack_from(payload)
+    attrs = parse_attributes(payload, _IFADDRMSG.size)
+    # IFA_ADDRESS is the peer address on point-to-point interfaces
+    addr = attrs.get(IFA_LOCAL, attrs.get(IFA_ADDRESS))
+    if addr is None or family not in (socket.AF_INET, socket.AF_INET6):
+        return index, None
+    return index, ip_interface(u'%s/%d' % (socket.inet_ntop(family, addr),
+                                           prefixlen))
+
+
+def interface_addresses(pid=None, sock=None):
+    """Dump the addresses of all interfaces of a network namespace, using one
+    RTM_GETLINK and one RTM_GETADDR request.
+
+    :param pid: the pid of a process in the target namespace, or None to use
+                the current one
+    :param sock: an already opened rtnetlink socket for that namespace
+    :return: a dict {interface name: (mac, [ipv4], [ipv6])}
+    :raise NetlinkError: if the namespace cannot be queried"""
+    close = sock is None
+    if close:
+        sock = open_socket(pid)
+    try:
+        names = {}
+        result = {}
+        for msg_type, payload in _dump(sock, RTM_GETLINK):
+            if msg_type == RTM_NEWLINK:
+                index, name, mac = parse_link(payload)
+                names[index] = name
+                result[name] = (mac, [], [])
+        for msg_type, payload in _dump(sock, RTM_GETADDR):
+            if msg_type != RTM_NEWADDR:
+                continue
+            index, addr = parse_address(payload)
+            if addr is None or index not in names:
+                continue
+            result[names[index]][1 if addr.version == 4 else 2].append(addr)
+        return result
+    except socket.error as e:
+        raise NetlinkError(*e.args)
+    finally:
+        if close:
+            sock.close()
+
+
+def group_mask(*groups):
+    """Return the bitmask to subscribe to the given RTNLGRP_* groups"""
+    mask = 0
+    for g in groups:
+        mask |= 1 << (g - 1)
+    return mask
+
+
+class Monitor(object):
+    """Listen to the notifications of link and address changes of a network
+    namespace, without blocking"""
+
+    GROUPS = group_mask(RTNLGRP_LINK, RTNLGRP_IPV4_IFADDR, RTNLGRP_IPV6_IFADDR)
+
+    def __init__(self, pid=None):
+        """:param pid: the pid of a process in the target namespace, or None
+                       to use the current one
+        :raise NetlinkError: if the monitor cannot be created"""
+        self.sock = open_socket(pid, groups=self.GROUPS)
+        self.sock.setblocking(False)
+
+    def changed(self):
+        """Consume all pending notifications
+
+        :return: whether something changed since the last call"""
+        changed = False
+        while True:
+            try:
+                if not self.sock.recv(_RECV_SIZE):
+                    return changed
+                changed = True
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return changed
+                if e.args[0] != errno.ENOBUFS:
+                    return True
+                # Some notifications were lost
+                changed = True
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,150 @@
+"""This module runs commands in the namespaces of a node without going through
+the shell of the node: each command is prefixed by mnexec -a, or by nsenter
+if mnexec is not installed, which enter the namespaces of the node before
+executing it. The commands of a node are thus no longer serialized by its
+shell, can run concurrently, and report their exit code directly."""
+from builtins import str
+from ipmininet import basestring
+
+import os
+import shlex
+import subprocess
+import weakref
+
+from .utils import has_cmd
+
+# The namespaces entered by the commands
+NAMESPACES = ('net', 'mnt')
+# The characters that require a shell to interpret the command
+SHELL_CHARS = frozenset('|&;<>()$`*?[]{}~#')
+# mnexec -a enters both the network and the mount namespaces of a process
+HAS_MNEXEC = has_cmd('mnexec')
+_MNEXEC_NAMESPACES = frozenset(('net', 'mnt'))
+_NSENTER_OPTIONS = {'net': '--net', 'mnt': '--mount', 'uts': '--uts',
+                    'ipc': '--ipc', 'pid': '--pid', 'user': '--user'}
+
+_executors = weakref.WeakKeyDictionary()  # node: NamespaceExecutor
+
+
+def command_args(args):
+    """Return the argument list of a command, given as in Node.cmd: either as
+    a list, or as strings joined by spaces. Commands using shell syntax are
+    run by sh.
+
+    :param args: the command + arguments"""
+    if len(args) == 1 and not isinstance(args[0], basestring):
+        return [str(a) for a in args[0]]
+    cmd = ' '.join(str(a) for a in args)
+    if SHELL_CHARS.intersection(cmd):
+        return ['sh', '-c', cmd]
+    return shlex.split(cmd)
+
+
+def _namespace_inode(path):
+    st = os.stat(path)
+    return st.st_dev, st.st_ino
+
+
+class NamespaceExecutor(object):
+    """Run commands in the namespaces of a process"""
+
+    def __init__(self, pid=None, namespaces=NAMESPACES):
+        """:param pid: The pid of a process in the target namespaces, or None
+                       to stay in the current ones
+        :param namespaces: The names of the namespaces to enter, as in
+                           /proc/<pid>/ns, the ones shared with the current
+                           process being skipped"""
+        self.pid = pid
+        self.namespaces = namespaces
+        self._targets = None  # The (path, name) of the namespaces to enter
+
+    @property
+    def targets(self):
+        """Return the (path, name) of the namespaces that the commands enter
+
+        :raise OSError: if the process does not exist"""
+        if self._targets is None:
+            targets = []
+            if self.pid is not None:
+                for name in self.namespaces:
+                    path = '/proc/%d/ns/%s' % (self.pid, name)
+                    if _namespace_inode(path) != \
+                            _namespace_inode('/proc/self/ns/%s' % name):
+                        targets.append((path, name))
+            self._targets = targets
+        return self._targets
+
+    def prefix(self, cwd):
+        """Return the command entering the target namespaces before executing
+        its arguments. The helper calls setns(2) itself, so that no code runs
+        in the child process between fork and exec, which is unsafe when
+        threads are running.
+
+        :param cwd: The working directory of the command"""
+        targets = self.targets
+        if not targets:
+            return []
+        if HAS_MNEXEC and \
+                _MNEXEC_NAMESPACES.issuperset(name for _, name in targets):
+            # mnexec also moves back to its working directory
+            return ['mnexec', '-a', str(self.pid)]
+        # Entering a mount namespace moves to its root directory
+        return ['nsenter'] + ['%s=%s' % (_NSENTER_OPTIONS[name], path)
+                              for path, name in targets] + \
+            ['--wd=%s' % cwd, '--']
+
+    def popen_args(self, *args, **kwargs):
+        """Return the argument list and the keyword arguments to give to
+        subprocess.Popen, or to an equivalent, to start a command
+
+        :param args: the command + arguments, see command_args
+        :param kwargs: key-val arguments, as used in subprocess.Popen
+        :raise OSError: if the target namespaces do not exist"""
+        for name, value in (('stdout', subprocess.PIPE),
+                            ('stderr', subprocess.PIPE),
+                            ('close_fds', True)):
+            kwargs.setdefault(name, value)
+        return (self.prefix(kwargs.get('cwd') or os.getcwd()) +
+                command_args(args), kwargs)
+
+    def popen(self, *args, **kwargs):
+        """Start a command and return its Popen handle
+
+        :param args: the command + arguments, see command_args
+        :param kwargs: key-val arguments, as used in subprocess.Popen
+        :raise OSError: if the target namespaces do not exist"""
+        args, kwargs = self.popen_args(*args, **kwargs)
+        return subprocess.Popen(args, **kwargs)
+
+    def pexec(self, *args, **kwargs):
+        """Run a command and wait for it to terminate
+
+        :param args: the command + arguments, see command_args
+        :param kwargs: key-val arguments, as used in subprocess.Popen
+        :return: its decoded stdout, stderr and exit code"""
+        p = self.popen(*args, **kwargs)
+        out, err = p.communicate()
+        return (out.decode('utf-8', 'replace') if out else '',
+                err.decode('utf-8', 'replace') if err else '',
+                p.wait())
+
+    def call(self, *args, **kwargs):
+        """Run a command and wait for it to terminate, as Node.cmd
+
+        :param args: the command + arguments, see command_args
+        :param kwargs: key-val arguments, as used in subprocess.Popen
+        :return: its decoded output, stdout and stderr being merged"""
+        kwargs.setdefault('stderr', subprocess.STDOUT)
+        return self.pexec(*args, **kwargs)[0]
+
+
+def executor_of(node):
+    """Return the NamespaceExecutor running the commands of a node, the one
+    of its process manager if it has one"""
+    executor = getattr(node, 'executor', None)
+    if executor is None:
+        executor = _executors.get(node)
+        if executor is None:
+            executor = _executors[node] = NamespaceExecutor(
+                node.pid if node.inNamespace else None)
+    return executor
@@ -0,0 +1,291 @@
+"""This module measures the reachability between many hosts at once. Each
+source probes all its destinations of a given IP version with a single fping
+process, or with one ping process per destination if fping is not installed.
+The probes of all sources run concurrently, directly in the namespaces of
+the sources (see ipmininet.nsexec), up to WINDOW probing processes at once.
+The outcome is a ReachabilityMatrix giving the loss and the round-trip time
+between each pair of hosts."""
+from builtins import str
+from ipmininet import ABC
+
+import abc
+import collections
+import errno
+import math
+import os
+import re
+import select
+import subprocess
+
+from mininet.log import lg as log
+
+from .nsexec import executor_of
+from .utils import has_cmd
+
+# The maximal number of probing processes running at once
+WINDOW = 64
+
+# ping6 and fping6 are not provided by default on newer systems
+PING6_CMD = 'ping6' if has_cmd('ping6') else 'ping -6'
+FPING6_CMD = 'fping6' if has_cmd('fping6') else 'fping -6'
+# Whether the sources can probe all their destinations with one fping
+HAS_FPING = has_cmd('fping')
+
+_PING_RE = re.compile(r'(\d+) packets transmitted, (\d+)( packets)? received')
+_FPING_RE = re.compile(r'\s*(\S+)\s+:\s+xmt/rcv/%loss = (\d+)/(\d+)/')
+_RTT_RE = re.compile(r'min/avg/max(?:/mdev)? = [\d.]+/([\d.]+)/')
+
+
+class Probe(ABC):
+    """The probes sent by one process from a source to some destinations"""
+
+    def __init__(self, src, version, targets, timeout=None):
+        """:param src: the source node
+        :param version: the IP version of the probes
+        :param targets: the list of (destination node, destination address)
+        :param timeout: the time to wait for a response, in seconds"""
+        self.src = src
+        self.version = version
+        self.targets = targets
+        self.timeout = timeout
+
+    @abc.abstractproperty
+    def args(self):
+        """The argument list of the probing process"""
+
+    @abc.abstractmethod
+    def parse(self, output):
+        """Parse the output of the probing process
+
+        :return: the list of (destination node, sent packets, received
+                 packets, average round-trip time in ms or None), in the
+                 order of the targets"""
+
+
+class PingProbe(Probe):
+    """Probe a single destination with ping"""
+
+    @property
+    def args(self):
+        args = ['ping'] if self.version == 4 else PING6_CMD.split()
+        args.append('-c1')
+        if self.timeout:
+            # Older versions of ping only accept whole seconds
+            args.extend(('-W', str(int(math.ceil(float(self.timeout))))))
+        args.append(str(self.targets[0][1]))
+        return args
+
+    def parse(self, output):
+        m = _PING_RE.search(output)
+        # e.g. 'connect: Network is unreachable'
+        sent, received = (int(m.group(1)), int(m.group(2))) if m else (1, 0)
+        rtt = _RTT_RE.search(output) if received else None
+        return [(self.targets[0][0], sent, received,
+                 float(rtt.group(1)) if rtt else None)]
+
+
+class FpingProbe(Probe):
+    """Probe all destinations at once with fping"""
+
+    @property
+    def args(self):
+        args = ['fping'] if self.version == 4 else FPING6_CMD.split()
+        args.extend(('-q', '-c', '1'))
+        if self.timeout:
+            args.extend(('-t', str(int(float(self.timeout) * 1000))))
+        args.extend(str(address) for _, address in self.targets)
+        return args
+
+    def parse(self, output):
+        stats = {}
+        for line in output.splitlines():
+            m = _FPING_RE.match(line)
+            if m is not None:
+                rtt = _RTT_RE.search(line)
+                stats[m.group(1)] = (int(m.group(2)), int(m.group(3)),
+                                     float(rtt.group(1)) if rtt else None)
+        return [(dst,) + stats.get(str(address), (1, 0, None))
+                for dst, address in self.targets]
+
+
+def plan_probes(plan, timeout=None):
+    """Build the probes between hosts
+
+    :param plan: the list of (src, {dst: dst_ip}, {dst: dst_ip6}) for each
+                 source, as returned by IPNet._ping_plan
+    :param timeout: the time to wait for a response, in seconds
+    :return: the list of Probe"""
+    probes = []
+    for src, ping_dict, ping6_dict in plan:
+        for version, dst_dict in ((4, ping_dict), (6, ping6_dict)):
+            if not dst_dict:
+                continue
+            targets = list(dst_dict.items())
+            if HAS_FPING:
+                probes.append(FpingProbe(src, version, targets, timeout))
+            else:
+                probes.extend(PingProbe(src, version, [t], timeout)
+                              for t in targets)
+    return probes
+
+
+def run_commands(commands, window=WINDOW):
+    """Run commands in the namespaces of their node, up to window commands at
+    once
+
+    :param commands: the list of (node, argument list)
+    :param window: the maximal number of commands running at once
+    :return: the list of their decoded outputs, stdout and stderr being
+             merged"""
+    outputs = [None] * len(commands)
+    pending = iter(enumerate(commands))
+    running = {}  # stdout fd: (index, Popen, output chunks)
+    # Unlike select, poll accepts file descriptors above FD_SETSIZE
+    poller = select.poll()
+
+    def launch():
+        """Start the next command, return whether there was one"""
+        for i, (node, args) in pending:
+            try:
+                p = executor_of(node).popen(args, stderr=subprocess.STDOUT)
+            except OSError as e:
+                log.debug('Cannot run', ' '.join(args), 'in', node.name,
+                          '(%s)\n' % e)
+                outputs[i] = str(e)
+                continue
+            fd = p.stdout.fileno()
+            running[fd] = (i, p, [])
+            poller.register(fd, select.POLLIN)
+            return True
+        return False
+
+    while len(running) < window and launch():
+        pass
+    while running:
+        try:
+            events = poller.poll()
+        except (select.error, OSError) as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            continue
+        for fd, _ in events:
+            i, p, chunks = running[fd]
+            data = os.read(fd, 4096)
+            if data:
+                chunks.append(data)
+                continue
+            poller.unregister(fd)
+            del running[fd]
+            p.stdout.close()
+            p.wait()
+            outputs[i] = b''.join(chunks).decode('utf-8', 'replace')
+            launch()
+    return outputs
+
+
+def collect(probes, outputs, incompatible_hosts=None):
+    """Gather the outcome of probes in a ReachabilityMatrix
+
+    :param probes: the list of Probe
+    :param outputs: the output of each probe
+    :param incompatible_hosts: see ReachabilityMatrix"""
+    matrix = ReachabilityMatrix(incompatible_hosts)
+    for p, output in zip(probes, outputs):
+        for dst, sent, received, rtt in p.parse(output):
+            matrix.record(p.src, dst, p.version, sent, received, rtt)
+    return matrix
+
+
+def probe(plan, timeout=None, window=WINDOW, incompatible_hosts=None):
+    """Probe all destinations of all sources concurrently
+
+    :param plan: the list of (src, {dst: dst_ip}, {dst: dst_ip6}) for each
+                 source, as returned by IPNet._ping_plan
+    :param timeout: the time to wait for a response, in seconds
+    :param window: the maximal number of probing processes at once
+    :param incompatible_hosts: see ReachabilityMatrix
+    :return: a ReachabilityMatrix"""
+    probes = plan_probes(plan, timeout)
+    outputs = run_commands([(p.src, p.args) for p in probes], window)
+    return collect(probes, outputs, incompatible_hosts)
+
+
+def _name(node):
+    return getattr(node, 'name', node)
+
+
+class ReachabilityMatrix(object):
+    """The outcome of the probes between hosts: for each source, destination
+    and IP version, the number of sent and received packets and the average
+    round-trip time. The nodes can be given either as nodes or by name."""
+
+    def __init__(self, incompatible_hosts=None):
+        """:param incompatible_hosts: the dict {node name: set of node names}
+                                      of the pairs of hosts without global
+                                      address in the same IP version"""
+        self.incompatible_hosts = incompatible_hosts or {}
+        # (src name, dst name, version): (sent, received, rtt), in the order
+        # of the probes
+        self.results = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.results)
+
+    def __iter__(self):
+        """Iterate over the (src name, dst name, version, sent, received,
+        rtt) of the probes"""
+        for key, result in self.results.items():
+            yield key + result
+
+    def record(self, src, dst, version, sent, received, rtt=None):
+        """Record the outcome of the probes from src to dst"""
+        self.results[_name(src), _name(dst), version] = (sent, received, rtt)
+
+    def _select(self, src, dst, version):
+        results = [self.results.get((_name(src), _name(dst), v))
+                   for v in ((4, 6) if version is None else (version,))]
+        return [r for r in results if r is not None]
+
+    def loss(self, src, dst, version=None):
+        """Return the packet loss percentage from src to dst, over both IP
+        versions if version is None
+
+        :raise KeyError: if src did not probe dst"""
+        results = self._select(src, dst, version)
+        sent = sum(r[0] for r in results)
+        if not sent:
+            raise KeyError('%s did not probe %s' % (_name(src), _name(dst)))
+        return 100.0 * (sent - sum(r[1] for r in results)) / sent
+
+    def rtt(self, src, dst, version=None):
+        """Return the average round-trip time from src to dst in ms, or None
+        if no response was received"""
+        rtts = [r[2] for r in self._select(src, dst, version)
+                if r[2] is not None]
+        return sum(rtts) / len(rtts) if rtts else None
+
+    @property
+    def packets(self):
+        """The total number of sent packets"""
+        return sum(r[0] for r in self.results.values())
+
+    @property
+    def lost(self):
+        """The total number of lost packets"""
+        return sum(r[0] - r[1] for r in self.results.values())
+
+    @property
+    def ploss(self):
+        """The overall packet loss percentage"""
+        packets = self.packets
+        return 100.0 * self.lost / packets if packets else 0
+
+    def unreachable(self, version=None):
+        """Return the list of (src name, dst name, version) of the
+        destinations that never answered"""
+        return [key for key, (_, received, _) in self.results.items()
+                if not received and (version is None or key[2] == version)]
+
+    def connected(self, version=None):
+        """Return whether every probed destination answered"""
+        return not self.unreachable(version)
@@ -1,18 +1,20 @@
 """This modules defines a L3 router class, with a modulable config system."""
 from builtins import str
 
-import sys
-import time
-
 from ipmininet import DEBUG_FLAG
-from ipmininet.utils import L3Router
+from ipmininet.utils import L3Router, CommandBatch
 from ipmininet.link import IPIntf
+from ipmininet.nsexec import NamespaceExecutor
 from .config import BasicRouterConfig
+from .config.cache import validation_cache
+from .sysctl import sysctl_path, set_sysctls
 
-import mininet.clean
 from mininet.node import Node
-from mininet.log import lg
+from mininet.log import lg as log
+import os
 import shlex
+import sys
+import threading
 
 
 class ProcessHelper(object):
@@ -65,6 +67,46 @@ class ProcessHelper(object):
                 pass  # Process is already dead
 
 
+class NamespaceProcessHelper(ProcessHelper):
+    """A ProcessHelper running the commands directly in the namespaces of
+    its node (see ipmininet.nsexec), instead of writing them to the shell of
+    the node. Many commands can thus run concurrently in the same node. The
+    commands are not interpreted by a shell, unless they use shell syntax.
+    The processes started with popen are detached from the terminal, as
+    Node.popen does, so that interrupting the CLI does not kill them."""
+
+    def __init__(self, node, *args, **kwargs):
+        """:param node: The node in whose namespaces the commands run"""
+        super(NamespaceProcessHelper, self).__init__(node, *args, **kwargs)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        """The NamespaceExecutor of the node"""
+        if self._executor is None:
+            self._executor = NamespaceExecutor(
+                self.node.pid if self.node.inNamespace else None)
+        return self._executor
+
+    def call(self, *args, **kwargs):
+        return self.executor.call(*args, **kwargs)
+
+    def popen(self, *args, **kwargs):
+        if sys.version_info >= (3, 2):
+            kwargs.setdefault('start_new_session', True)
+        else:
+            kwargs.setdefault('preexec_fn', os.setsid)
+        p = self.executor.popen(*args, **kwargs)
+        with self._lock:
+            self._pid_gen += 1
+            self._processes[self._pid_gen] = p
+            return self._pid_gen
+
+    def pexec(self, *args, **kw):
+        return self.executor.pexec(*args, **kw)
+
+
 class Router(Node, L3Router):
     """The actualy router, which manages a set of daemons"""
 
@@ -103,56 +145,163 @@ class Router(Node, L3Router):
         # so no need to move it
         IPIntf('lo', node=self, moveIntfFn=lambda x, y: None)
 
-    def start(self):
+    def start(self, build_config=True):
         """Start the router: Configure the daemons, set the relevant sysctls,
-        and fire up all needed processes"""
+        and fire up all needed processes
+
+        :param build_config: Whether the configuration files should be
+                             built, False if they were already built
+        :raise RuntimeError: if the configuration of a daemon is invalid
+                             or if a daemon did not start in time"""
         # Build the config
-        self.config.build()
+        if build_config:
+            self.config.build()
         # Check them
-        err_code = False
-        for d in self.config.daemons:
-            out, err, code = self._processes.pexec(shlex.split(d.dry_run))
-            err_code = err_code or code
-            if code:
-                lg.error(d.NAME, 'configuration check failed ['
-                         'rcode:', str(code), ']\n'
-                         'stdout:', str(out), '\n'
-                         'stderr:', str(err))
-        if err_code:
-            lg.error('Config checks failed, aborting!')
-            mininet.clean.cleanup()
-            sys.exit(1)
+        self.check_config()
         # Set relevant sysctls
-        for opt, val in self.config.sysctl:
-            self._old_sysctl[opt] = self._set_sysctl(opt, val)
+        self._apply_sysctls()
         # Fire up all daemons
         for d in self.config.daemons:
             self._processes.popen(shlex.split(d.startup_line))
-            # Busy-wait if the daemon needs some time before being started
-            while not d.has_started():
-                time.sleep(.001)
+            # Wait if the daemon needs some time before being started
+            if not d.wait_started():
+                raise RuntimeError('%s did not start after %ss'
+                                   % (d.NAME, d.STARTUP_TIMEOUT))
+
+    def check_config(self):
+        """Check the configuration of all daemons of this router. The
+        configurations that were already validated by the same daemon
+        executable are not checked again.
+
+        :raise RuntimeError: if at least one configuration check failed,
+                             with the details of every failed check"""
+        errors = []
+        for d, key in self._configs_to_check():
+            error = self._record_check(
+                d, key, self._processes.pexec(shlex.split(d.dry_run)))
+            if error is not None:
+                errors.append(error)
+        if errors:
+            raise RuntimeError('\n'.join(errors))
+
+    def _configs_to_check(self):
+        """Return the list of (daemon, validation cache key) of the daemons
+        whose configuration was not validated yet"""
+        checks = []
+        for d in self.config.daemons:
+            key = validation_cache.key(d)
+            if key is not None and key in validation_cache:
+                log.debug('Skipping the validated configuration of', d.NAME,
+                          'on', self.name, '\n')
+                continue
+            checks.append((d, key))
+        return checks
+
+    @staticmethod
+    def _record_check(daemon, key, result):
+        """Record the result of the dry run of a daemon
+
+        :param daemon: The daemon whose configuration was checked
+        :param key: Its validation cache key
+        :param result: The (stdout, stderr, exit code) of its dry run
+        :return: The error message if the check failed, None otherwise"""
+        out, err, code = result
+        if code:
+            return ('%s configuration check failed [rcode: %s]\n'
+                    'stdout: %s\nstderr: %s' % (daemon.NAME, code, out, err))
+        if key is not None:
+            validation_cache.add(key)
+        return None
+
+    def _apply_sysctls(self):
+        """Set the sysctls required by the configuration of the router,
+        keeping their original values to restore them when terminating"""
+        values = [(sysctl_path(key), val) for key, val in self.config.sysctl]
+        values.extend((sysctl_path(key, itf), val)
+                      for itf, key, val in self.config.intf_sysctl)
+        for path, old in self._set_sysctls(values).items():
+            self._old_sysctl.setdefault(path, old)
 
     def terminate(self):
         """Stops this router and sets back all sysctls to their old values"""
         self._processes.terminate()
         if not DEBUG_FLAG:
             self.config.cleanup()
-        for opt, val in self._old_sysctl.items():
-            self._set_sysctl(opt, val)
+        self._set_sysctls((path, val)
+                          for path, val in self._old_sysctl.items()
+                          if val is not None)
         super(Router, self).terminate()
 
-    def _set_sysctl(self, key, val):
-        """Change a sysctl value, and return the previous set value"""
-        val = str(val)
+    def _set_sysctls(self, values):
+        """Change many sysctl values at once, directly in /proc/sys if
+        possible, and return their previous values
+
+        :param values: An iterable of (path, value), the paths being relative
+                       to /proc/sys
+        :return: A dict {path: previous value}"""
+        values = list(values)
+        if not values:
+            return {}
         try:
-            v = self._processes.call('sysctl', key)\
-                    .split('=')[1]\
-                    .strip(' \n\t\r')
-        except IndexError:
-            v = None
-        if v != val:
-            self._processes.call('sysctl', '-w', '%s=%s' % (key, val))
-        return v
+            return set_sysctls(self.pid if self.inNamespace else None, values)
+        except OSError as e:
+            log.debug('Cannot access /proc/sys in', self.name, '(%s),' % e,
+                      'falling back to the sysctl command\n')
+            return self._set_sysctls_cmd(values)
+
+    def _set_sysctls_cmd(self, values):
+        """Change many sysctl values with the sysctl command, in one batch of
+        commands to read them and one to write the changed ones, and return
+        their previous values"""
+        with self.batch() as reads:
+            for key, _ in values:
+                reads.add('sysctl', key)
+        old = {}
+        with self.batch() as writes:
+            for (key, val), (out, _) in zip(values, reads.results):
+                val = str(val)
+                try:
+                    v = out.split('=')[1].strip(' \n\t\r')
+                except IndexError:
+                    v = None
+                old[key] = v
+                if v != val:
+                    writes.add('sysctl', '-w', '%s=%s' % (key, val))
+        return old
+
+    def batch(self):
+        """Return a CommandBatch running its commands in this router, as in
+        `with router.batch() as b:`"""
+        return CommandBatch(self)
+
+    @property
+    def executor(self):
+        """The NamespaceExecutor running the commands of the router without
+        its shell, or None if its process manager uses the shell"""
+        return getattr(self._processes, 'executor', None)
+
+    def acmd(self, *args, **kwargs):
+        """Coroutine running a command in the router, see ipmininet.aio.acmd
+        """
+        from ipmininet import aio
+        return aio.acmd(self, *args, **kwargs)
+
+    def apexec(self, *args, **kwargs):
+        """Coroutine running a command in the router, see
+        ipmininet.aio.apexec"""
+        from ipmininet import aio
+        return aio.apexec(self, *args, **kwargs)
+
+    def apopen(self, *args, **kwargs):
+        """Coroutine starting a command in the router, see
+        ipmininet.aio.apopen"""
+        from ipmininet import aio
+        return aio.apopen(self, *args, **kwargs)
+
+    def astart(self, build_config=True):
+        """Coroutine starting the router, see ipmininet.aio.astart_router"""
+        from ipmininet import aio
+        return aio.astart_router(self, build_config=build_config)
 
     def get(self, key, val=None):
         """Check for a given key in the router parameters"""
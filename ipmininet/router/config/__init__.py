@@ -1,21 +1,58 @@
 """This module holds the configuration generators for routing daemons
-that can be used in a router."""
+that can be used in a router.
+
+The daemon modules are only imported once one of their attributes is
+accessed, so that importing this package stays cheap."""
+import importlib
+import sys
+
 from .base import BasicRouterConfig, RouterConfig
-from .zebra import Zebra
-from .staticd import STATIC, StaticRoute
-from .ospf import OSPF, OSPFArea
-from .ospf6 import OSPF6
-from .bgp import BGP, AS, iBGPFullMesh, bgp_peering, bgp_fullmesh, ebgp_session, set_local_pref, set_med, set_community, set_rr, new_access_list, new_community_list, AF_INET, AF_INET6, SHARE, CLIENT_PROVIDER
-from .radvd import RADVD, AdvPrefix, AdvRDNSS, AdvConnectedPrefix
-from .iptables import IPTables, IP6Tables
-from .sshd import SSHd
-from .pimd import PIMD
-from .openrd import OpenrDaemon
-from .openr import Openr, OpenrDomain
+
+# The module defining each lazily imported attribute
+_LAZY_ATTRIBUTES = {
+    '.zebra': ['Zebra'],
+    '.staticd': ['STATIC', 'StaticRoute'],
+    '.ospf': ['OSPF', 'OSPFArea'],
+    '.ospf6': ['OSPF6'],
+    '.bgp': ['BGP', 'AS', 'iBGPFullMesh', 'iBGPRouteReflection',
+             'bgp_peering', 'bgp_fullmesh', 'ebgp_session', 'set_local_pref',
+             'set_med', 'set_community',
+             'set_rr', 'new_access_list', 'new_community_list', 'AF_INET',
+             'AF_INET6', 'SHARE', 'CLIENT_PROVIDER'],
+    '.radvd': ['RADVD', 'AdvPrefix', 'AdvRDNSS', 'AdvConnectedPrefix'],
+    '.iptables': ['IPTables', 'IP6Tables'],
+    '.sshd': ['SSHd'],
+    '.pimd': ['PIMD'],
+    '.openrd': ['OpenrDaemon'],
+    '.openr': ['Openr', 'OpenrDomain'],
+}
+_LAZY_MODULES = {attr: module for module, attrs in _LAZY_ATTRIBUTES.items()
+                 for attr in attrs}
 
 __all__ = ['BasicRouterConfig', 'Zebra', 'OSPF', 'OSPF6', 'OSPFArea', 'BGP',
-           'AS', 'SHARE', 'CLIENT_PROVIDER', 'iBGPFullMesh', 'bgp_peering', 'RouterConfig', 'bgp_fullmesh',
+           'AS', 'SHARE', 'CLIENT_PROVIDER', 'iBGPFullMesh', 'iBGPRouteReflection', 'bgp_peering', 'RouterConfig', 'bgp_fullmesh',
            'ebgp_session', 'set_local_pref', 'set_med', 'set_community', 'new_community_list'
 ,'set_rr', 'new_access_list', 'IPTables', 'IP6Tables', 'SSHd', 'RADVD',
            'AdvPrefix', 'AdvConnectedPrefix', 'AdvRDNSS', 'PIMD',
            'STATIC', 'StaticRoute', 'OpenrDaemon', 'Openr', 'OpenrDomain', 'AF_INET', 'AF_INET6']
+
+
+def __getattr__(name):
+    try:
+        module = _LAZY_MODULES[name]
+    except KeyError:
+        raise AttributeError('module %r has no attribute %r'
+                             % (__name__, name))
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_MODULES))
+
+
+if sys.version_info < (3, 7):
+    # Module-level __getattr__ is not supported (PEP 562)
+    for _name in _LAZY_MODULES:
+        __getattr__(_name)
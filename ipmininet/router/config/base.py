@@ -2,16 +2,23 @@
 that is able to provide configurations for a set of routing daemons.
 It also defines the base class for a routing daemon, as well as a minimalistic
 configuration for a router."""
-from future.utils import with_metaclass
-from ipmininet import basestring
+from builtins import str
+from ipmininet import basestring, ABC
 
 import os
 import abc
+import collections
+import multiprocessing
+import pickle
+import threading
+import time
 from contextlib import closing
 from operator import attrgetter
-from ipaddress import ip_address
+from ipaddress import ip_address, IPv4Address
 
-from .utils import ConfigDict, template_lookup, ip_statement
+from .utils import ConfigDict, render_cache, template_lookup, ip_statement
+from .cache import config_digest
+from .readiness import wait_for
 from ipmininet.utils import require_cmd, realIntfList
 from ipmininet.link import OrderedAddress
 
@@ -20,14 +27,66 @@ import mako.exceptions
 from mininet.log import lg as log
 
 
-last_routerid = ip_address(u'0.0.0.1')
+class RouterIdAllocator(object):
+    """Allocate unique router ids to the routers that have neither an
+    explicit router id nor an IPv4 address. The router ids used by the
+    routers of the network are collected once, at the first allocation,
+    so that each allocation then takes a constant amortized time."""
+
+    def __init__(self, routers=(), start=u'0.0.0.1'):
+        """:param routers: The routers whose router ids cannot be allocated.
+                           It is read at the first allocation, and can thus
+                           be a list that is filled in the meantime
+        :param start: The first router id that can be allocated"""
+        self.routers = routers
+        self._next = int(ip_address(start))
+        self._used = None  # The router ids in use, as integers
+        self._ids = {}  # router name: allocated router id
+        # Routers can be started concurrently
+        self._lock = threading.Lock()
+
+    def allocate(self, router):
+        """Return the router id of a router, allocating it on the first call
+
+        :param router: The router
+        :return: the router id, as a string"""
+        with self._lock:
+            try:
+                return self._ids[router.name]
+            except KeyError:
+                pass
+            if self._used is None:
+                self._used = self._collect()
+            while self._next in self._used:
+                self._next += 1
+            self._used.add(self._next)
+            routerid = IPv4Address(self._next).compressed
+            self._ids[router.name] = routerid
+            return routerid
+
+    def _collect(self):
+        used = set(int(ip_address(str(i))) for i in self._ids.values())
+        for r in self.routers:
+            for routerid in r.config.reserved_routerids():
+                try:
+                    used.add(int(ip_address(str(routerid))))
+                except ValueError:
+                    log.warning('Ignoring the invalid router id', routerid,
+                                'of', r.name, '\n')
+        return used
+
+    def clear(self):
+        """Forget the router ids in use, e.g. after that the addresses of
+        the routers changed. The router ids allocated so far are kept."""
+        with self._lock:
+            self._used = None
 
 
 class RouterConfig(object):
     """This class manages a set of daemons, and generates the global
     configuration for a router"""
 
-    def __init__(self, node, daemons=(), sysctl=None,
+    def __init__(self, node, daemons=(), sysctl=None, intf_sysctl=None,
                  *args, **kwargs):
         """Initialize our config builder
 
@@ -35,7 +94,11 @@ class RouterConfig(object):
         :param daemons: an iterable of active routing daemons for this node
         :param sysctl: A dictionnary of sysctl to set for this node.
                        By default, it enables IPv4/IPv6 forwarding on all
-                       interfaces."""
+                       interfaces.
+        :param intf_sysctl: A dictionnary of per-interface sysctls to set
+                            for this node, keyed by interface name. The
+                            sysctl keys omit the interface name, e.g.
+                            {'r1-eth0': {'net.ipv6.conf.accept_ra': 0}}"""
         self._node = node  # The node for which we will build the configuration
         self._daemons = {}  # Active daemons
         for d in daemons:
@@ -46,11 +109,24 @@ class RouterConfig(object):
         self.routerid = None
         if sysctl:
             self._sysctl.update(sysctl)
+        self._intf_sysctl = {}
+        for itf, values in (intf_sysctl or {}).items():
+            self._intf_sysctl[itf] = dict(values)
         super(RouterConfig, self).__init__(*args, **kwargs)
 
     def build(self):
         """Build the configuration for each daemon, then write the
         configuration files"""
+        self.build_tree()
+        # Write their config, using the global ConfigDict to handle
+        # dependencies
+        for d in self._daemons.values():
+            cfg = d.render(self._cfg)
+            d.write(cfg)
+
+    def build_tree(self):
+        """Build the configuration tree of each daemon, without rendering
+        nor writing the configuration files"""
         self._cfg.clear()
         self._cfg.password = self._node.password
         self._cfg.name = self._node.name
@@ -64,11 +140,11 @@ class RouterConfig(object):
         # Build their config
         for name, d in self._daemons.items():
             self._cfg[name] = d.build()
-        # Write their config, using the global ConfigDict to handle
-        # dependencies
-        for d in self._daemons.values():
-            cfg = d.render(self._cfg)
-            d.write(cfg)
+
+    @property
+    def tree(self):
+        """Return the configuration tree built by build_tree()"""
+        return self._cfg
 
     def cleanup(self):
         """Cleanup all temporary files for the daemons"""
@@ -118,6 +194,23 @@ class RouterConfig(object):
                 raise ValueError('sysctl must be specified using `key=val` '
                                  'format. Ignoring %s' % value)
 
+    @property
+    def intf_sysctl(self):
+        """Return a list of all per-interface sysctl to set on this node,
+        as (interface name, key, value)"""
+        return [(itf, key, val)
+                for itf, values in self._intf_sysctl.items()
+                for key, val in values.items()]
+
+    def set_intf_sysctl(self, itf, key, val):
+        """Set a per-interface sysctl
+
+        :param itf: The interface name
+        :param key: The sysctl key, without the interface name,
+                    e.g. net.ipv6.conf.accept_ra
+        :param val: The sysctl value"""
+        self._intf_sysctl.setdefault(itf, {})[key] = val
+
     @property
     def daemons(self):
         return sorted(self._daemons.values(), key=attrgetter('PRIO'))
@@ -132,36 +225,24 @@ class RouterConfig(object):
             key = key.NAME
         return self._daemons[key]
 
-    @staticmethod
-    def incr_last_routerid():
-        global last_routerid
-        last_routerid += 1
-
-    def _equal_routerid(self, n):
-
-        # Router id of 'n' already set
-        if n.config.routerid:
-            return str(n.config.routerid) != str(last_routerid)
-
-        # Check that a router id explicitly set
-        # in any other daemon is not in conflict
-        # with the current router id
-        for d in n.config.daemons:
-            if d != self \
-                    and d.options.routerid \
-                    and str(d.options.routerid) == str(last_routerid):
-                return True
-
-        # Check that the most-visible IPv4 address is not in conflict
-        # with the current router id
-        ip_list = sorted((ip for itf in realIntfList(n)
+    def _most_visible_ip(self):
+        """Return the most-visible IPv4 address of the router, or None"""
+        ip_list = sorted((ip for itf in realIntfList(self._node)
                           for ip in itf.ips()),
                          key=OrderedAddress)
-        if len(ip_list) != 0 \
-                and str(ip_list.pop().ip) == str(last_routerid):
-            return True
-
-        return False
+        return ip_list[-1] if ip_list else None
+
+    def reserved_routerids(self):
+        """Return the router ids that this router uses, or could use, and
+        thus that cannot be allocated to other routers"""
+        ids = [d.options.routerid for d in self._daemons.values()
+               if d.options.routerid]
+        if self.routerid:
+            ids.append(self.routerid)
+        ip = self._most_visible_ip()
+        if ip is not None:
+            ids.append(ip.ip.compressed)
+        return ids
 
     def compute_routerid(self):
         """Computes the default router id for all daemons.
@@ -174,33 +255,35 @@ class RouterConfig(object):
             if d.options.routerid:
                 return d.options.routerid
 
-        ip_list = sorted((ip for itf in realIntfList(self._node)
-                          for ip in itf.ips()),
-                         key=OrderedAddress)
-        if len(ip_list) == 0:
-
-            to_visit = realIntfList(self._node)
-            # Explore all routers to check that none has the same router id
-            while to_visit:
-                self.incr_last_routerid()
-                visited = set()
-                while to_visit:
-                    i = to_visit.pop()
-                    if i in visited:
-                        continue
-                    visited.add(i)
-                    for n in i.broadcast_domain.routers:
-                        if self._equal_routerid(n.node):
-                            break  # We need to change the router id
-                        to_visit.extend(realIntfList(n.node))
-                to_visit = realIntfList(self._node) if to_visit else []
-            return last_routerid.compressed
-        else:
-            id = ip_list.pop().ip.compressed
-            return id
-
-
-class Daemon(with_metaclass(abc.ABCMeta, object)):
+        ip = self._most_visible_ip()
+        if ip is not None:
+            return ip.ip.compressed
+        return self._generate_routerid()
+
+    def _generate_routerid(self):
+        """Generate a router id that is unique among the routers of the
+        network, or among the reachable routers if the router does not
+        belong to a network"""
+        allocator = getattr(self._node, 'routerid_allocator', None)
+        if allocator is None:
+            allocator = RouterIdAllocator(self._reachable_routers())
+        return allocator.allocate(self._node)
+
+    def _reachable_routers(self):
+        """Return the routers reachable from this one through other routers"""
+        routers = {self._node.name: self._node}
+        to_visit = [self._node]
+        while to_visit:
+            n = to_visit.pop()
+            for i in realIntfList(n):
+                for r in i.broadcast_domain.routers:
+                    if r.node.name not in routers:
+                        routers[r.node.name] = r.node
+                        to_visit.append(r.node)
+        return list(routers.values())
+
+
+class Daemon(ABC):
     """This class serves as base for routing daemons"""
     # The name of this routing daemon
     NAME = None
@@ -211,6 +294,8 @@ class Daemon(with_metaclass(abc.ABCMeta, object)):
     DEPENDS = ()
     # The kill patterns to cleanup any processes started by this daemon
     KILL_PATTERNS = ()
+    # The maximal number of seconds to wait for this daemon to be ready
+    STARTUP_TIMEOUT = 60
 
     def __init__(self, node, **kwargs):
         """:param node: The node for which we build the config
@@ -218,6 +303,10 @@ class Daemon(with_metaclass(abc.ABCMeta, object)):
         self._node = node
         self._startup_line = None
         self.files = []
+        # The digest of the last written configuration
+        self.cfg_digest = None
+        # The time it took for the daemon to be ready after its startup
+        self.startup_latency = None
         self._options = self._defaults(**kwargs)
         super(Daemon, self).__init__()
 
@@ -254,10 +343,8 @@ class Daemon(with_metaclass(abc.ABCMeta, object)):
         self.files.append(self.cfg_filename)
         log.debug('Generating %s\n' % self.cfg_filename)
         try:
-            return template_lookup.get_template(self.template_filename)\
-                                  .render(node=cfg,
-                                          ip_statement=ip_statement,
-                                          **kwargs)
+            return render_cache.render(self.template_filename,
+                                       **self.template_args(cfg, **kwargs))
         except:
             # Display template errors in a less cryptic way
             log.error('Couldn''t render a config file(',
@@ -266,10 +353,26 @@ class Daemon(with_metaclass(abc.ABCMeta, object)):
             raise ValueError('Cannot render a configuration [%s: %s]' % (
                 self._node.name, self.NAME))
 
+    def template_args(self, cfg, **kwargs):
+        """Return the arguments to pass to the template of this daemon
+
+        :param cfg: The global config for the node
+        :param kwargs: Additional arguments for the template"""
+        kwargs.update(node=cfg, ip_statement=ip_statement)
+        return kwargs
+
     def write(self, cfg):
-        """Write down the configuration for this daemon
+        """Write down the configuration for this daemon, unless the
+        configuration file already contains it
 
         :param cfg: The configuration string"""
+        self.cfg_digest = config_digest(cfg)
+        try:
+            with closing(open(self.cfg_filename, 'r')) as f:
+                if f.read() == cfg:
+                    return
+        except (IOError, OSError):
+            pass
         with closing(open(self.cfg_filename, 'w')) as f:
             f.write(cfg)
 
@@ -321,9 +424,29 @@ class Daemon(with_metaclass(abc.ABCMeta, object)):
     def set_defaults(self, defaults):
         """Update defaults to contain the defaults specific to this daemon"""
 
+    def readiness_conditions(self):
+        """Return the ReadinessCondition that will hold once this daemon is
+        ready, e.g. once it accepts connections on its API socket"""
+        return ()
+
     def has_started(self):
         """Return whether this daemon has started or not"""
-        return True
+        return all(c.is_ready() for c in self.readiness_conditions())
+
+    def wait_started(self, timeout=None):
+        """Wait until this daemon has started, and record how long it took
+
+        :param timeout: The maximal number of seconds to wait, defaults to
+                        STARTUP_TIMEOUT
+        :return: whether the daemon has started before the timeout"""
+        start = time.time()
+        started = wait_for(self.readiness_conditions(),
+                           timeout=self.STARTUP_TIMEOUT if timeout is None
+                           else timeout)
+        self.startup_latency = time.time() - start
+        log.debug('%s on %s ready after %.3fs\n'
+                  % (self.NAME, self._node.name, self.startup_latency))
+        return started
 
 
 class BasicRouterConfig(RouterConfig):
@@ -348,3 +471,90 @@ class BasicRouterConfig(RouterConfig):
         d.extend(additional_daemons)
         super(BasicRouterConfig, self).__init__(node, daemons=d,
                                                 *args, **kwargs)
+
+
+def build_configs(routers, workers=1):
+    """Build and write the configurations of many routers. The templates
+    whose rendering is not cached yet are rendered in a pool of worker
+    processes, over a snapshot of the configuration trees.
+
+    :param routers: The routers whose configuration should be built
+    :param workers: The maximal number of worker processes
+    :return: the list of (router, error) for the routers whose configuration
+             could not be built"""
+    errors = []
+    jobs = []  # (router, daemon, cache key)
+    to_render = collections.OrderedDict()  # cache key: (template, args)
+    for r in routers:
+        try:
+            r.config.build_tree()
+        except Exception as e:
+            errors.append((r, e))
+            continue
+        for d in r.config.daemons:
+            args = d.template_args(r.config.tree)
+            key = render_cache.key(d.template_filename, args)
+            jobs.append((r, d, key))
+            # Only plain config trees can be cached, and thus be safely
+            # sent to another process
+            if key is not None and key not in render_cache:
+                to_render[key] = (d.template_filename, args)
+    # The renderings of the pool are kept here rather than only in the
+    # render cache, which can evict them before they are written
+    rendered = {}
+    if workers > 1 and len(to_render) > 1:
+        for key, out in zip(to_render,
+                            _render_in_pool(list(to_render.values()),
+                                            workers)):
+            if out is not None:
+                rendered[key] = out
+    failed = set(r for r, _ in errors)
+    for r, d, key in jobs:
+        if r in failed:
+            continue
+        try:
+            out = rendered.get(key)
+            if out is None:
+                # Cached renderings are reused, the others are rendered here
+                out = d.render(r.config.tree)
+            else:
+                d.files.append(d.cfg_filename)
+            d.write(out)
+        except Exception as e:
+            errors.append((r, e))
+            failed.add(r)
+    for key, out in rendered.items():
+        render_cache.put(key, out)
+    return errors
+
+
+def _render_in_pool(jobs, workers):
+    """Render templates in a pool of processes
+
+    :param jobs: A list of (template name, template arguments)
+    :param workers: The maximal number of worker processes
+    :return: the list of rendered templates, None for the templates that
+             could not be rendered"""
+    pool = multiprocessing.Pool(min(workers, len(jobs)))
+    try:
+        return pool.map(_render_template, jobs)
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        log.warning('Cannot render the configurations in parallel:', str(e),
+                    '\n')
+        return [None] * len(jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _render_template(job):
+    """Render a template in a worker process
+
+    :param job: (template name, template arguments)
+    :return: the rendered template, or None if it failed, the failure is then
+             reported when rendering it again in the main process"""
+    template_name, args = job
+    try:
+        return template_lookup.get_template(template_name).render(**args)
+    except Exception:
+        return None
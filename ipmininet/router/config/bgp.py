@@ -2,11 +2,14 @@
 from builtins import str
 
 import itertools
+import math
+from collections import OrderedDict, deque
+from operator import attrgetter
 
-from ipaddress import ip_network, ip_address
+from ipaddress import ip_network, ip_address, IPv4Address
 
 from ipmininet.overlay import Overlay
-from ipmininet.utils import realIntfList
+from ipmininet.utils import IndexedList, PeerAddressIndex
 from .zebra import QuaggaDaemon, Zebra, RouteMap, AccessList, AccessListEntry, RouteMapMatchCond, CommunityList, \
     RouteMapSetAction, PERMIT, DENY
 
@@ -52,6 +55,114 @@ class iBGPFullMesh(AS):
         return '<iBGPMesh %s>' % self.asn
 
 
+class iBGPRouteReflection(AS):
+    """An overlay class to establish iBGP sessions through route reflectors
+    that are chosen automatically from the IGP topology.
+
+    The routers are split in clusters grown around the most central routers.
+    The most central routers of each cluster are its route reflectors: they
+    share the cluster-id of the cluster, and peer with all the other routers
+    of the cluster, their clients. The route reflectors of all clusters
+    peer in full mesh, so that the number of sessions grows linearly with
+    the number of routers instead of quadratically."""
+
+    DEGREE = 'degree'
+    CLOSENESS = 'closeness'
+
+    def __init__(self, asn, routers=(), cluster_size=20, redundancy=2,
+                 centrality=DEGREE, **props):
+        """:param asn: The number for this AS
+        :param routers: an initial set of routers to add to this AS
+        :param cluster_size: the maximal number of routers in a cluster,
+                             which sets the number of clusters
+        :param redundancy: the number of route reflectors per cluster
+        :param centrality: how to rank the routers when picking the route
+                           reflectors, either DEGREE (the number of IGP
+                           neighbors) or CLOSENESS (the number of IGP hops
+                           towards the other routers of the AS)
+        :param props: key-vals to set on all routers of this AS"""
+        if centrality not in (self.DEGREE, self.CLOSENESS):
+            raise ValueError('Unknown centrality: %s' % centrality)
+        super(iBGPRouteReflection, self).__init__(asn, routers=routers,
+                                                  **props)
+        self.cluster_size = max(1, cluster_size)
+        self.redundancy = max(1, redundancy)
+        self.centrality = centrality
+
+    def apply(self, topo):
+        clusters = self.clusters(topo)
+        for i, (reflectors, clients) in enumerate(clusters):
+            cluster_id = str(IPv4Address(i + 1))
+            for rr in reflectors:
+                set_rr(topo, rr, peers=clients)
+                topo.nodeInfo(rr)['bgp_cluster_id'] = cluster_id
+                topo.getNodeInfo(rr, 'bgp_rr_clients', list).extend(clients)
+        bgp_fullmesh(topo, [rr for reflectors, _ in clusters
+                            for rr in reflectors])
+        super(iBGPRouteReflection, self).apply(topo)
+
+    def clusters(self, topo):
+        """Split the routers of this AS in clusters
+
+        :param topo: The current topology
+        :return: the list of (route reflectors, clients) of every cluster"""
+        graph = self._igp_graph(topo)
+        ranking = self._rank(graph)
+        count = int(math.ceil(len(ranking) / float(self.cluster_size)))
+        heads = ranking[:count]
+        # Assign each router to the closest head, through a breadth-first
+        # search started from all the heads at once
+        cluster_of = {h: i for i, h in enumerate(heads)}
+        to_visit = deque(heads)
+        while to_visit:
+            n = to_visit.popleft()
+            for neighbor in graph[n]:
+                if neighbor not in cluster_of:
+                    cluster_of[neighbor] = cluster_of[n]
+                    to_visit.append(neighbor)
+        members = [[] for _ in heads]
+        for r in ranking:
+            # Routers without IGP adjacency in the AS join the first cluster
+            members[cluster_of.get(r, 0)].append(r)
+        return [(m[:self.redundancy], m[self.redundancy:]) for m in members]
+
+    def _igp_graph(self, topo):
+        """Return the adjacencies between the routers of this AS, and the
+        switches connecting them"""
+        routers = set(self.nodes)
+        graph = {r: set() for r in routers}
+        for a, b in topo.links():
+            if all(n in routers or topo.isSwitch(n) for n in (a, b)):
+                graph.setdefault(a, set()).add(b)
+                graph.setdefault(b, set()).add(a)
+        return graph
+
+    def _rank(self, graph):
+        """Return the routers of this AS, from the most to the least central
+        one"""
+        routers = set(self.nodes)
+        if self.centrality == self.DEGREE:
+            key = {r: -len(graph[r]) for r in routers}
+        else:
+            key = {}
+            for r in routers:
+                # The number of routers reached, and the sum of the distances
+                distances = {r: 0}
+                to_visit = deque([r])
+                while to_visit:
+                    n = to_visit.popleft()
+                    for neighbor in graph[n]:
+                        if neighbor not in distances:
+                            distances[neighbor] = distances[n] + 1
+                            to_visit.append(neighbor)
+                reached = [d for n, d in distances.items() if n in routers]
+                key[r] = (-len(reached), sum(reached))
+        return sorted(routers, key=lambda r: (key[r], r))
+
+    def __str__(self):
+        return '<iBGPRouteReflection %s>' % self.asn
+
+
 def bgp_fullmesh(topo, routers):
     """Establish a full-mesh set of BGP peerings between routers
 
@@ -85,7 +196,7 @@ def ebgp_session(topo, a, b, link_type=None):
         for router in [a, b]:
             peers_link = new_community_list('from-peers', 1, action=PERMIT)
             up_link = new_community_list('from-up', 3, action=PERMIT)
-            community_lists = topo.getNodeInfo(router, 'bgp_community_lists', list)
+            community_lists = topo.getNodeInfo(router, 'bgp_community_lists', IndexedList)
             for f in [peers_link, up_link]:
                 if f not in community_lists:
                     community_lists.append(f)
@@ -157,8 +268,8 @@ def set_local_pref(topo, router, peer, value, filter_list):
     """
     match_cond = []
     set_actions = []
-    access_lists = topo.getNodeInfo(router, 'bgp_access_lists', list)
-    community_lists = topo.getNodeInfo(router, 'bgp_community_lists', list)
+    access_lists = topo.getNodeInfo(router, 'bgp_access_lists', IndexedList)
+    community_lists = topo.getNodeInfo(router, 'bgp_community_lists', IndexedList)
 
     # Create match_conditions based on the provided filters
     for f in filter_list:
@@ -191,8 +302,8 @@ def set_med(topo, router, peer, value, filter_list):
     """
     match_cond = []
     set_actions = []
-    access_lists = topo.getNodeInfo(router, 'bgp_access_lists', list)
-    community_lists = topo.getNodeInfo(router, 'bgp_community_lists', list)
+    access_lists = topo.getNodeInfo(router, 'bgp_access_lists', IndexedList)
+    community_lists = topo.getNodeInfo(router, 'bgp_community_lists', IndexedList)
 
     # Create match_conditions based on the provided filters
     for f in filter_list:
@@ -227,8 +338,8 @@ def set_community(topo, router, peer, value, filter_list, direction):
     """
     match_cond = []
     set_actions = []
-    access_lists = topo.getNodeInfo(router, 'bgp_access_lists', list)
-    community_list = topo.getNodeInfo(router, 'bgp_community_lists', list)
+    access_lists = topo.getNodeInfo(router, 'bgp_access_lists', IndexedList)
+    community_list = topo.getNodeInfo(router, 'bgp_community_lists', IndexedList)
 
     # Create match_conditions based on the provided filters
     for f in filter_list:
@@ -290,6 +401,7 @@ class BGP(QuaggaDaemon):
     NAME = 'bgpd'
     DEPENDS = (Zebra,)
     KILL_PATTERNS = (NAME,)
+    VTY_PORT = 2605
 
     @property
     def STARTUP_LINE_EXTRA(self):
@@ -312,6 +424,22 @@ class BGP(QuaggaDaemon):
         cfg.community_lists = self.build_community_list()
         cfg.route_maps = self.build_route_map(cfg.neighbors)
         cfg.rr = self._node.get('bgp_rr_info')
+        cfg.cluster_id = self._node.get('bgp_cluster_id', '10.0.0.0')
+        # Without an explicit list of clients, every iBGP peer of a route
+        # reflector is a client
+        clients = self._node.get('bgp_rr_clients')
+        for n in cfg.neighbors:
+            n.rr_client = bool(cfg.rr) and n.asn == cfg.asn and \
+                (clients is None or n.node in clients)
+        self._apply_route_maps(cfg.neighbors, cfg.route_maps)
+        if self.options.peer_groups:
+            cfg.route_maps = self._merge_route_maps(cfg.route_maps)
+            cfg.peer_groups = self._build_peer_groups(cfg.neighbors,
+                                                      cfg.address_families)
+        else:
+            cfg.peer_groups = []
+            for af in cfg.address_families:
+                af.peer_groups = []
 
         return cfg
 
@@ -346,32 +474,99 @@ class BGP(QuaggaDaemon):
         Build and return a list of route map for the current node
         """
         node_route_maps = self._node.get('bgp_route_maps')
-        route_maps = []
+        # Route map entries indexed by key, the last updated entry last
+        route_maps = OrderedDict()
         if node_route_maps is not None:
+            peers_of = {}
+            for neighbor in neigbors:
+                peers_of.setdefault(neighbor.node, []).append(neighbor)
             for kwargs in node_route_maps:
                 remote_peer = kwargs.pop('peer')
-                peers = []
-                for neighbor in neigbors:
-                    if neighbor.node == remote_peer:
-                        peers.append(neighbor)
-                for peer in peers:
+                for peer in peers_of.get(remote_peer, ()):
                     kwargs['neighbor'] = peer
                     rm = RouteMap(**kwargs)
                     # If route map already exist, add conditions and actions to it
-                    try:
-                        index = route_maps.index(rm)
-                        tmp_rm = route_maps.pop(index)
+                    tmp_rm = route_maps.pop(rm.key, None)
+                    if tmp_rm is not None:
                         rm.append_match_cond(tmp_rm.match_cond)
                         rm.append_set_action(tmp_rm.set_actions)
-                    except ValueError:
-                        pass
-                    route_maps.append(rm)
-        return route_maps
+                    route_maps[rm.key] = rm
+        return list(route_maps.values())
+
+    @staticmethod
+    def _apply_route_maps(neighbors, route_maps):
+        """Record on every neighbor the (name, direction) of the route maps
+        applied to it"""
+        for n in neighbors:
+            n.route_maps = []
+        for rm in route_maps:
+            if rm.order == 10:
+                rm.neighbor.route_maps.append((rm.name, rm.direction))
+
+    @staticmethod
+    def _merge_route_maps(route_maps):
+        """Merge the route maps that have the same entries, but are applied
+        to different neighbors, under a single name
+
+        :return: the route maps to define"""
+        entries = OrderedDict()
+        for rm in route_maps:
+            entries.setdefault((id(rm.neighbor), rm.name), []).append(rm)
+        names = {}
+        merged = []
+        for (_, name), rms in entries.items():
+            key = (rms[0].neighbor.family,
+                   tuple(rm.content_key
+                         for rm in sorted(rms, key=attrgetter('order'))))
+            new_name = names.setdefault(key, name)
+            if new_name == name:
+                merged.extend(rms)
+                continue
+            # Apply the first route map with this content instead
+            for n in {id(rm.neighbor): rm.neighbor for rm in rms}.values():
+                n.route_maps = [(new_name if rm_name == name else rm_name,
+                                 direction)
+                                for rm_name, direction in n.route_maps]
+        return merged
+
+    @staticmethod
+    def _build_peer_groups(neighbors, address_families):
+        """Group the neighbors sharing the same configuration, apart from
+        their address, port and remote AS, into peer-groups
+
+        :return: the list of PeerGroup"""
+        member_of = {}
+        for af in address_families:
+            af.peer_groups = []
+            for n in af.neighbors:
+                member_of.setdefault(id(n), []).append(af)
+        groups = OrderedDict()
+        for n in neighbors:
+            afs = member_of.get(id(n), [])
+            key = (n.family, n.ebgp, n.ebgp_multihop, n.nh_self, n.rr_client,
+                   tuple(n.route_maps), tuple(id(af) for af in afs))
+            groups.setdefault(key, (afs, []))[1].append(n)
+        peer_groups = []
+        for afs, members in groups.values():
+            # A peer-group with a single member only makes the config longer
+            if len(members) < 2:
+                continue
+            group = PeerGroup('%sbgp-%s-%d' % ('e' if members[0].ebgp else 'i',
+                                               members[0].family,
+                                               len(peer_groups) + 1),
+                              members)
+            peer_groups.append(group)
+            for af in afs:
+                af.peer_groups.append(group)
+        return peer_groups
 
     def set_defaults(self, defaults):
         """:param debug: the set of debug events that should be logged
-        :param address_families: The set of AddressFamily to use"""
+        :param address_families: The set of AddressFamily to use
+        :param peer_groups: Whether the neighbors sharing the same
+                            configuration are grouped in peer-groups"""
         defaults.address_families = [AF_INET(), AF_INET6()]
+        defaults.peer_groups = True
         super(BGP, self).set_defaults(defaults)
 
     def _build_neighbors(self):
@@ -402,6 +597,7 @@ class AddressFamily(object):
         self.networks = [ip_network(str(n)) for n in networks]
         self.redistribute = redistribute
         self.neighbors = []
+        self.peer_groups = []
         super(AddressFamily, self).__init__()
 
 
@@ -415,6 +611,26 @@ def AF_INET6(*args, **kwargs):
     return AddressFamily('ipv6', *args, **kwargs)
 
 
+class PeerGroup(object):
+    """A BGP peer-group, holding the configuration shared by its members"""
+
+    def __init__(self, name, members):
+        """:param name: The name of the peer-group
+        :param members: The list of Peer in this group, which must share the
+                        same configuration"""
+        self.name = self.peer = name
+        self.members = members
+        first = members[0]
+        self.family = first.family
+        self.ebgp = first.ebgp
+        self.ebgp_multihop = first.ebgp_multihop
+        self.nh_self = first.nh_self
+        self.rr_client = first.rr_client
+        self.route_maps = first.route_maps
+        for n in members:
+            n.peer_group = name
+
+
 class Peer(object):
     """A BGP peer"""
 
@@ -434,31 +650,28 @@ class Peer(object):
         # We default to nexthop self for all peering type
         self.nh_self = 'next-hop-self force'
         # We enable eBGP multihop if eBGP is in use
-        ebgp = self.asn != base.asn
+        self.ebgp = ebgp = self.asn != base.asn
         self.ebgp_multihop = ebgp
         self.description = '%s (%sBGP)' % (node, 'e' if ebgp else 'i')
+        self.rr_client = False
+        # The (name, direction) of the route maps applied to this peer
+        self.route_maps = []
+        # The name of the peer-group of this peer, if any
+        self.peer_group = None
 
     @staticmethod
     def _find_peer_address(base, peer, v6=False):
         """Return the IP address that base should try to contact to establish
         a peering"""
-        visited = set()
-        to_visit = realIntfList(base)
-        # Explore all interfaces in base ASN recursively, until we find one
-        # connected to the peer
-        while to_visit:
-            i = to_visit.pop(0)
-            if i in visited:
-                continue
-            visited.add(i)
-            for n in i.broadcast_domain.routers:
-                if n.node.name == peer:
-                    if not v6:
-                        return n.ip, n.node
-                    elif n.ip6 and not ip_address(n.ip6).is_link_local:
-                        return n.ip6, n.node
-                    else:
-                        return None, None
-                elif n.node.asn == base.asn or not n.node.asn:
-                    to_visit.extend(realIntfList(n.node))
+        # The network shares its index between its routers
+        index = getattr(base, 'peer_index', None)
+        if index is None:
+            index = PeerAddressIndex()
+        n = index.interface(base, peer)
+        if n is None:
+            return None, None
+        if not v6:
+            return n.ip, n.node
+        elif n.ip6 and not ip_address(n.ip6).is_link_local:
+            return n.ip6, n.node
         return None, None
@@ -0,0 +1,139 @@
+"""This module remembers which daemon configurations were already validated
+by their daemon, so that the dry-run of identical configurations can be
+skipped when starting the same topologies over and over."""
+import hashlib
+import os
+
+from mininet.log import lg as log
+
+from .utils import cache_directory
+
+# The environment variable overriding the location of the cache,
+# set it to an empty string to disable the cache
+VALIDATION_CACHE_ENV = 'IPMININET_VALIDATION_CACHE'
+
+
+def config_digest(cfg):
+    """Return the digest of a rendered configuration
+
+    :param cfg: The configuration string"""
+    return hashlib.sha256(cfg.encode('utf-8')).hexdigest()
+
+
+def executable_identity(cmd):
+    """Return a string identifying the executable that would run for a given
+    command, which changes whenever the executable is updated
+
+    :param cmd: The command name or path
+    :return: the identity, or None if the executable cannot be found"""
+    if os.path.dirname(cmd):
+        candidates = [cmd]
+    else:
+        candidates = [os.path.join(p.strip('"'), cmd) for p in
+                      os.environ.get('PATH', '').split(os.path.pathsep)]
+    for path in candidates:
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            path = os.path.realpath(path)
+            st = os.stat(path)
+            return '%s:%d:%d' % (path, st.st_size, int(st.st_mtime))
+    return None
+
+
+class ValidationCache(object):
+    """A set of validated daemon configurations, stored as marker files named
+    after the hash of the configuration, of the dry-run command and of the
+    daemon executable. The least recently used markers are evicted once there
+    are more than max_entries of them."""
+
+    def __init__(self, directory=None, max_entries=4096):
+        """:param directory: The directory holding the markers, defaults to
+                             a private per-user directory
+        :param max_entries: The maximal number of markers to keep"""
+        self._directory = directory
+        self.max_entries = max_entries
+
+    @property
+    def directory(self):
+        if self._directory is None:
+            self._directory = cache_directory(VALIDATION_CACHE_ENV,
+                                              'ipmininet_validated') or ''
+        return self._directory
+
+    def key(self, daemon):
+        """Return the cache key of the current configuration of a daemon
+
+        :param daemon: A Daemon whose configuration was written
+        :return: the key, or None if the configuration cannot be cached"""
+        if not self.directory or daemon.cfg_digest is None:
+            return None
+        dry_run = daemon.dry_run
+        cmd = dry_run.split()
+        binary = executable_identity(cmd[0]) if cmd else None
+        if binary is None:
+            return None
+        h = hashlib.sha256()
+        for part in (daemon.NAME,
+                     # Configuration files are named after their node
+                     dry_run.replace(daemon.cfg_filename, '{cfg}'),
+                     binary, daemon.cfg_digest):
+            h.update(part.encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def _marker(self, key):
+        return os.path.join(self.directory, key)
+
+    def __contains__(self, key):
+        try:
+            # Refresh the marker for the LRU eviction
+            os.utime(self._marker(key), None)
+            return True
+        except OSError:
+            return False
+
+    def add(self, key):
+        """Record a validated configuration
+
+        :param key: The key, as returned by key()"""
+        try:
+            open(self._marker(key), 'w').close()
+        except (IOError, OSError) as e:
+            log.debug('Cannot record a validated configuration:', str(e),
+                      '\n')
+            return
+        self._evict()
+
+    def _evict(self):
+        """Remove the least recently used markers if there are too many"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        if len(names) <= self.max_entries:
+            return
+        markers = []
+        for name in names:
+            try:
+                markers.append((os.stat(self._marker(name)).st_mtime, name))
+            except OSError:
+                pass
+        markers.sort()
+        # Leave some room before the next eviction
+        for _, name in markers[:len(markers) - self.max_entries * 3 // 4]:
+            try:
+                os.unlink(self._marker(name))
+            except OSError:
+                pass
+
+    def clear(self):
+        """Remove all markers"""
+        if not self.directory:
+            return
+        for name in os.listdir(self.directory):
+            try:
+                os.unlink(self._marker(name))
+            except OSError:
+                pass
+
+
+validation_cache = ValidationCache()
@@ -1,5 +1,5 @@
 from .base import Daemon
-from .utils import ConfigDict, template_lookup
+from .utils import ConfigDict, render_cache
 
 
 class OpenrDaemon(Daemon):
@@ -236,8 +236,7 @@ class OpenrDaemon(Daemon):
         the openr.mako template and passed to the daemon as argument."""
         cfg = ConfigDict()
         cfg[self.NAME] = self.build()
-        return template_lookup.get_template(self.template_filename)\
-                              .render(node=cfg)
+        return render_cache.render(self.template_filename, node=cfg)
 
     @property
     def dry_run(self):
@@ -44,6 +44,7 @@ class OSPF(QuaggaDaemon):
     NAME = 'ospfd'
     DEPENDS = (Zebra,)
     KILL_PATTERNS = (NAME,)
+    VTY_PORT = 2604
 
     def __init__(self, node, *args, **kwargs):
         super(OSPF, self).__init__(node=node, *args, **kwargs)
@@ -11,6 +11,7 @@ class OSPF6(OSPF):
     NAME = 'ospf6d'
     DEAD_INT = 3
     KILL_PATTERNS = (NAME,)
+    VTY_PORT = 2606
 
     def _build_interfaces(self, interfaces):
         """Return the list of OSPF6 interface properties from the list of
@@ -10,6 +10,7 @@ class PIMD(QuaggaDaemon):
     NAME = 'pimd'
     DEPENDS = (Zebra,)
     KILL_PATTERNS = (NAME,)
+    VTY_PORT = 2611
 
     def __init__(self, node, *args, **kwargs):
         super(PIMD, self).__init__(node=node, *args, **kwargs)
@@ -0,0 +1,209 @@
+"""This module defines the conditions that a daemon can declare to signal
+that it is ready, e.g. once it has created its API socket, as well as the
+machinery to wait for them without busy-looping."""
+from ipmininet import ABC
+
+import abc
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import socket
+import time
+
+# The delay between two checks of the conditions grows exponentially
+# from MIN_DELAY to MAX_DELAY (seconds)
+MIN_DELAY = .001
+MAX_DELAY = .1
+
+# inotify(7) constants
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+_IN_EVENTS = (0x00000008 |  # IN_CLOSE_WRITE
+              0x00000080 |  # IN_MOVED_TO
+              0x00000100)   # IN_CREATE
+
+
+class ReadinessCondition(ABC):
+    """A condition that holds once a daemon is ready"""
+
+    @abc.abstractmethod
+    def is_ready(self):
+        """Return whether the condition holds"""
+
+    @property
+    def watched_directory(self):
+        """Return the directory whose changes could make this condition hold,
+        or None if there is no such directory"""
+        return None
+
+
+class SocketPath(ReadinessCondition):
+    """Holds once a UNIX socket exists at a given path and accepts
+    connections"""
+
+    def __init__(self, path):
+        """:param path: The path of the socket"""
+        self.path = path
+
+    def is_ready(self):
+        if not os.path.exists(self.path):
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+            return True
+        except socket.error:
+            return False
+        finally:
+            sock.close()
+
+    @property
+    def watched_directory(self):
+        return os.path.dirname(os.path.abspath(self.path))
+
+    def __str__(self):
+        return '<socket %s>' % self.path
+
+
+class PidFile(ReadinessCondition):
+    """Holds once a pidfile contains the pid of a running process"""
+
+    def __init__(self, path):
+        """:param path: The path of the pidfile"""
+        self.path = path
+
+    def is_ready(self):
+        try:
+            with open(self.path) as f:
+                pid = int(f.readline().strip())
+        except (IOError, OSError, ValueError):
+            return False
+        return pid > 0 and os.path.exists('/proc/%d' % pid)
+
+    @property
+    def watched_directory(self):
+        return os.path.dirname(os.path.abspath(self.path))
+
+    def __str__(self):
+        return '<pidfile %s>' % self.path
+
+
+class ListeningPort(ReadinessCondition):
+    """Holds once a TCP port accepts connections in the network namespace of a
+    node, e.g. the vty port of a daemon"""
+
+    # The TCP_LISTEN state in /proc/net/tcp
+    LISTEN = '0A'
+
+    def __init__(self, node, port):
+        """:param node: The node in which the port should be listening
+        :param port: The TCP port number"""
+        self.node = node
+        self.port = port
+
+    def is_ready(self):
+        # /proc/<pid>/net/ shows the sockets of the namespace of that process
+        for table in ('tcp', 'tcp6'):
+            try:
+                with open('/proc/%d/net/%s' % (self.node.pid, table)) as f:
+                    next(f)  # Skip the header line
+                    for line in f:
+                        parts = line.split()
+                        if parts[3] == self.LISTEN and \
+                                int(parts[1].rsplit(':', 1)[1], 16) == \
+                                self.port:
+                            return True
+            except (IOError, OSError, IndexError, ValueError, StopIteration):
+                continue
+        return False
+
+    def __str__(self):
+        return '<port %s on %s>' % (self.port, self.node.name)
+
+
+class _Inotify(object):
+    """A minimal inotify(7) wrapper used to wake up as soon as a watched
+    directory changes. It silently does nothing if inotify is unavailable."""
+
+    _libc = None
+
+    def __init__(self, directories):
+        self.fd = None
+        try:
+            libc = self._load_libc()
+            fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd < 0:
+                return
+            self.fd = fd
+            for d in directories:
+                libc.inotify_add_watch(fd, d.encode('utf-8'), _IN_EVENTS)
+        except (OSError, AttributeError):
+            self.close()
+
+    @classmethod
+    def _load_libc(cls):
+        if cls._libc is None:
+            cls._libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                    use_errno=True)
+        return cls._libc
+
+    def wait(self, delay):
+        """Wait for at most delay seconds, or until a watched directory
+        changes"""
+        if self.fd is None:
+            time.sleep(delay)
+            return
+        try:
+            ready, _, _ = select.select([self.fd], [], [], delay)
+        except (select.error, OSError) as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return
+        if ready:
+            self._drain()
+
+    def _drain(self):
+        """Consume all pending events"""
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except OSError:
+            pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def wait_for(conditions, timeout=None):
+    """Wait until all conditions hold. The conditions are checked with an
+    exponential backoff between MIN_DELAY and MAX_DELAY, and checked again as
+    soon as one of their watched directories changes.
+
+    :param conditions: A sequence of ReadinessCondition
+    :param timeout: The maximal number of seconds to wait, None to wait
+                    indefinitely
+    :return: whether all conditions hold"""
+    pending = [c for c in conditions if not c.is_ready()]
+    if not pending:
+        return True
+    deadline = None if timeout is None else time.time() + timeout
+    watcher = _Inotify({c.watched_directory for c in pending
+                        if c.watched_directory is not None})
+    delay = MIN_DELAY
+    try:
+        while pending:
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                delay = min(delay, remaining)
+            watcher.wait(delay)
+            pending = [c for c in pending if not c.is_ready()]
+            delay = min(delay * 2, MAX_DELAY)
+    finally:
+        watcher.close()
+    return True
@@ -3,19 +3,63 @@ from distutils.spawn import find_executable
 import subprocess
 import os
 import tempfile
+import threading
+
+from mininet.log import lg as log
 
 from .base import Daemon
+from .utils import cache_directory
+
+# The environment variable overriding the directory of the ssh keypair
+SSH_KEY_ENV = 'IPMININET_SSH_KEY_DIR'
+
+_keypair = None
+_keypair_lock = threading.Lock()
+
+
+def _usable_keypair(keyfile):
+    """Return whether an existing keypair is complete and private"""
+    try:
+        st = os.stat(keyfile)
+    except OSError:
+        return False
+    return (st.st_uid == os.getuid() and not st.st_mode & 0o077 and
+            os.path.isfile('%s.pub' % keyfile))
+
+
+def ssh_keypair():
+    """Return the paths of the ssh keypair authorized on the routers. It is
+    generated on first use, and reused across runs.
+
+    :return: (private key path, public key path)"""
+    global _keypair
+    with _keypair_lock:
+        if _keypair is not None:
+            return _keypair
+        directory = cache_directory(SSH_KEY_ENV, 'ipmininet_ssh')
+        if directory is None:
+            # Generate a new keypair for this run only
+            keyfile = tempfile.mktemp(dir='/tmp')
+        else:
+            keyfile = os.path.join(directory, 'id_rsa')
+        if not _usable_keypair(keyfile):
+            for f in (keyfile, '%s.pub' % keyfile):
+                if os.path.exists(f):
+                    os.unlink(f)
+            log.debug('Generating the ssh keypair', keyfile, '\n')
+            subprocess.call(['ssh-keygen', '-b', '2048', '-t', 'rsa', '-f',
+                             keyfile, '-q', '-P', ''])
+        _keypair = keyfile, '%s.pub' % keyfile
+        return _keypair
 
 
-# Generate a new ssh keypair at each run
-KEYFILE = tempfile.mktemp(dir='/tmp')
-PUBKEY = '%s.pub' % KEYFILE
-if os.path.exists(KEYFILE):
-    os.unlink(KEYFILE)
-if os.path.exists(PUBKEY):
-    os.unlink(PUBKEY)
-subprocess.call(['ssh-keygen', '-b', '2048', '-t', 'rsa', '-f', KEYFILE, '-q',
-                 '-P', ''])
+def __getattr__(name):
+    # The keypair used to be generated when importing this module
+    if name == 'KEYFILE':
+        return ssh_keypair()[0]
+    if name == 'PUBKEY':
+        return ssh_keypair()[1]
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
 
 
 class SSHd(Daemon):
@@ -39,5 +83,5 @@ class SSHd(Daemon):
 
     def build(self):
         cfg = super(SSHd, self).build()
-        cfg.authorized_keys = PUBKEY
+        cfg.authorized_keys = ssh_keypair()[1]
         return cfg
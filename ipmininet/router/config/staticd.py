@@ -9,6 +9,7 @@ class STATIC(QuaggaDaemon):
     NAME = 'staticd'
     DEPENDS = (Zebra,)
     KILL_PATTERNS = (NAME,)
+    VTY_PORT = 2616
 
     def build(self):
         cfg = super(STATIC, self).build()
@@ -13,45 +13,48 @@ router bgp ${node.bgpd.asn}
     bgp router-id ${node.bgpd.routerid}
     bgp bestpath compare-routerid
     no bgp default ipv4-unicast
+% if node.bgpd.rr:
+    bgp cluster-id ${node.bgpd.cluster_id}
+% endif
+% for g in node.bgpd.peer_groups:
+    neighbor ${g.name} peer-group
+    % if g.ebgp_multihop:
+    neighbor ${g.name} ebgp-multihop
+    % endif
+% endfor
 % for n in node.bgpd.neighbors:
     no auto-summary
     neighbor ${n.peer} remote-as ${n.asn}
     neighbor ${n.peer} port ${n.port}
     neighbor ${n.peer} description ${n.description}
-    % if n.ebgp_multihop:
+    % if n.peer_group:
+    neighbor ${n.peer} peer-group ${n.peer_group}
+    % elif n.ebgp_multihop:
     neighbor ${n.peer} ebgp-multihop
     % endif
     <%block name="neighbor"/>
 % endfor
 % for af in node.bgpd.address_families:
     address-family ${af.name}
-    % for rm in node.bgpd.route_maps:
-        % if rm.neighbor.family == af.name and rm.order == 10:
-    neighbor ${rm.neighbor.peer} route-map ${rm.name}-${af.name} ${rm.direction}
-        % endif
-    % endfor
     % for net in af.networks:
     network ${net.with_prefixlen}
     % endfor
     % for r in af.redistribute:
     redistribute ${r}
     % endfor
-    % for n in af.neighbors:
+    % for n in af.peer_groups + [n for n in af.neighbors if not n.peer_group]:
         % if n.family == af.name:
     neighbor ${n.peer} activate
-            % if n.nh_self and not node.bgpd.rr:
-    neighbor ${n.peer} ${n.nh_self}
-            % elif n.nh_self and node.bgpd.rr:
-    neighbor ${n.peer} route-reflector-client
-            % endif
-            % if node.bgpd.rr and n.asn == node.bgpd.asn:
+            % for rm_name, direction in n.route_maps:
+    neighbor ${n.peer} route-map ${rm_name}-${af.name} ${direction}
+            % endfor
+            % if n.rr_client:
     neighbor ${n.peer} route-reflector-client
+            % elif n.nh_self and not node.bgpd.rr:
+    neighbor ${n.peer} ${n.nh_self}
             % endif
         % endif
     % endfor
-    % if node.bgpd.rr:
-    bgp cluster-id 10.0.0.0
-    % endif
 % endfor
 !
 % for al in node.bgpd.access_lists:
@@ -2,14 +2,205 @@
 from builtins import str
 from ipmininet import basestring
 
+import collections
+import hashlib
 import os
+import sys
+import tempfile
+import threading
+import types
 
-from ipaddress import ip_interface
+from ipaddress import ip_interface, _BaseAddress, _BaseNetwork
+import mako
 from mako.lookup import TemplateLookup
 
+from mininet.log import lg as log
+
 __TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+# The environment variable overriding the location of the compiled templates
+TEMPLATE_CACHE_ENV = 'IPMININET_TEMPLATE_CACHE'
+
+
+def cache_directory(env, name, *subdirs):
+    """Return a private directory to store data across processes, creating
+    it if needed. It defaults to a per-user directory in the temporary
+    directory, unless overridden by an environment variable.
+
+    :param env: The environment variable overriding the base directory,
+                setting it to an empty string disables the cache
+    :param name: The name of the default base directory
+    :param subdirs: The path of the directory inside the base directory
+    :return: the directory path, or None if no such directory can be safely
+             used"""
+    base = os.environ.get(env, os.path.join(tempfile.gettempdir(),
+                                            '%s_%d' % (name, os.getuid())))
+    if not base:
+        return None
+    path = os.path.join(base, *subdirs)
+    try:
+        os.makedirs(path, 0o700)
+    except OSError:
+        if not os.path.isdir(path):
+            log.debug('Cannot create the cache directory', path, '\n')
+            return None
+    # We trust the content of these directories, they must be ours
+    for d in set((base, path)):
+        st = os.stat(d)
+        if st.st_uid != os.getuid() or st.st_mode & 0o022:
+            log.warning('Ignoring the cache directory', d,
+                        'as it is not private\n')
+            return None
+    return path
+
+
+def _module_directory():
+    """Return the directory in which the compiled templates are stored, so
+    that they are only compiled once across processes. It is keyed by the
+    content of the templates and by the mako and python versions."""
+    digest = hashlib.sha1(('%s %s' % (mako.__version__, sys.version_info[:2]))
+                          .encode('utf-8'))
+    for name in sorted(os.listdir(__TEMPLATES_DIR)):
+        digest.update(name.encode('utf-8'))
+        with open(os.path.join(__TEMPLATES_DIR, name), 'rb') as f:
+            digest.update(f.read())
+    return cache_directory(TEMPLATE_CACHE_ENV, 'ipmininet_templates',
+                           digest.hexdigest())
+
+
+class LazyTemplateLookup(TemplateLookup):
+    """A TemplateLookup storing the compiled templates in _module_directory(),
+    which is only computed when the first template is looked up, as it reads
+    all the templates"""
+
+    def __init__(self, *args, **kwargs):
+        super(LazyTemplateLookup, self).__init__(*args, **kwargs)
+        self._module_directory_set = False
+        self._module_directory_lock = threading.Lock()
+
+    def get_template(self, uri):
+        if not self._module_directory_set:
+            with self._module_directory_lock:
+                if not self._module_directory_set:
+                    self.module_directory = _module_directory()
+                    self.template_args['module_directory'] = \
+                        self.module_directory
+                    self._module_directory_set = True
+        return super(LazyTemplateLookup, self).get_template(uri)
+
+
+template_lookup = LazyTemplateLookup(directories=[__TEMPLATES_DIR])
+
+
+class Uncacheable(Exception):
+    """The rendering arguments cannot be safely fingerprinted"""
+
+
+def fingerprint(obj, _stack=None):
+    """Return a hashable value that is equal for two objects if they would
+    yield the same configuration when rendered. Only plain values, containers
+    and the objects defined in the config package are supported.
+
+    :raise Uncacheable: if the object cannot be fingerprinted"""
+    if obj is None or isinstance(obj, (bool, int, float, basestring, bytes)):
+        # True == 1 but they are not rendered the same way
+        return type(obj).__name__, obj
+    if isinstance(obj, (_BaseAddress, _BaseNetwork)):
+        return type(obj).__name__, str(obj)
+    if isinstance(obj, (types.FunctionType, types.BuiltinFunctionType)):
+        # Helpers such as ip_statement
+        return 'function', obj
+    if _stack is None:
+        _stack = set()
+    if id(obj) in _stack:
+        raise Uncacheable('%r contains itself' % obj)
+    _stack.add(id(obj))
+    try:
+        if isinstance(obj, dict):
+            return type(obj).__name__, tuple((fingerprint(k, _stack),
+                                              fingerprint(v, _stack))
+                                             for k, v in obj.items())
+        if isinstance(obj, (list, tuple, set, frozenset)):
+            return type(obj).__name__, tuple(fingerprint(v, _stack)
+                                             for v in obj)
+        if type(obj).__module__.startswith(__name__.rsplit('.', 1)[0]) and \
+                hasattr(obj, '__dict__'):
+            return type(obj).__name__, fingerprint(vars(obj), _stack)
+    finally:
+        _stack.discard(id(obj))
+    raise Uncacheable('Cannot fingerprint %s objects' % type(obj).__name__)
+
+
+class RenderCache(object):
+    """A LRU cache of rendered templates, keyed by template name and by the
+    fingerprint of the rendering arguments"""
+
+    def __init__(self, lookup, size=256):
+        """:param lookup: The TemplateLookup to use
+        :param size: The maximal number of rendered templates to keep"""
+        self.lookup = lookup
+        self.size = size
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(template_name, kwargs):
+        """Return the cache key of a rendering
+
+        :param template_name: The template name
+        :param kwargs: The arguments to pass to the template
+        :return: the key, or None if this rendering cannot be cached"""
+        try:
+            return template_name, fingerprint(kwargs)
+        except Uncacheable as e:
+            log.debug('Not caching', template_name, ':', str(e), '\n')
+            return None
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._cache
+
+    def get(self, key):
+        """Return a cached rendering and mark it as recently used
+
+        :raise KeyError: if the rendering is not cached"""
+        with self._lock:
+            out = self._cache.pop(key)
+            self._cache[key] = out
+            return out
+
+    def put(self, key, out):
+        """Cache a rendering
+
+        :param key: The key, as returned by key()
+        :param out: The rendered template"""
+        with self._lock:
+            self._cache[key] = out
+            while len(self._cache) > self.size:
+                self._cache.popitem(last=False)
+
+    def render(self, template_name, **kwargs):
+        """Render a template, or return its cached rendering if it was
+        already rendered with identical arguments
+
+        :param template_name: The template name
+        :param kwargs: The arguments to pass to the template"""
+        key = self.key(template_name, kwargs)
+        if key is not None:
+            try:
+                return self.get(key)
+            except KeyError:
+                pass
+        out = self.lookup.get_template(template_name).render(**kwargs)
+        if key is not None:
+            self.put(key, out)
+        return out
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
 
-template_lookup = TemplateLookup(directories=[__TEMPLATES_DIR])
+render_cache = RenderCache(template_lookup)
 
 
 class ConfigDict(dict):
@@ -23,6 +214,9 @@ class ConfigDict(dict):
             self[key] = val
 
     def __getattr__(self, item):
+        if item.startswith('__') and item.endswith('__'):
+            # Special methods, e.g. looked up by pickle or copy
+            raise AttributeError(item)
         # so that self.item == self[item]
         try:
             # But preserve i.e. methods
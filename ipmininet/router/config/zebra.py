@@ -1,8 +1,8 @@
 import os
-import socket
 
 from ipmininet.utils import realIntfList
 from .base import Daemon
+from .readiness import ListeningPort, PidFile, SocketPath
 from .utils import ConfigDict
 
 #  Route Map actions
@@ -18,6 +18,8 @@ class QuaggaDaemon(Daemon):
 
     # Additional parameters to pass when starting the daemon
     STARTUP_LINE_EXTRA = ''
+    # The TCP port of the vty of the daemon, None if it has none
+    VTY_PORT = None
 
     @property
     def startup_line(self):
@@ -50,6 +52,13 @@ class QuaggaDaemon(Daemon):
             .format(name=self.NAME,
                     cfg=self.cfg_filename)
 
+    def readiness_conditions(self):
+        # The daemon writes its pidfile and opens its vty once initialized
+        conditions = (PidFile(self._file('pid')),)
+        if self.VTY_PORT is not None:
+            conditions += (ListeningPort(self._node, self.VTY_PORT),)
+        return conditions
+
 
 class Zebra(QuaggaDaemon):
     NAME = 'zebra'
@@ -58,6 +67,7 @@ class Zebra(QuaggaDaemon):
     # set via ip route)
     STARTUP_LINE_EXTRA = '-k'
     KILL_PATTERNS = (NAME,)
+    VTY_PORT = 2601
 
     def __init__(self, *args, **kwargs):
         super(Zebra, self).__init__(*args, **kwargs)
@@ -67,9 +77,9 @@ class Zebra(QuaggaDaemon):
         # Update with preset defaults
         cfg.update(self.options)
         # Track interfaces
-        cfg.interfaces = (ConfigDict(name=itf.name,
+        cfg.interfaces = [ConfigDict(name=itf.name,
                                      description=itf.describe)
-                          for itf in realIntfList(self._node))
+                          for itf in realIntfList(self._node)]
         return cfg
 
     def set_defaults(self, defaults):
@@ -81,19 +91,14 @@ class Zebra(QuaggaDaemon):
         defaults.route_maps = []
         super(Zebra, self).set_defaults(defaults)
 
-    def has_started(self):
-        # We override this such that we wait until we have the API socket
-        # and until wa can connect to it
-        return os.path.exists(self.zebra_socket) and self.listening()
+    def readiness_conditions(self):
+        # We also wait until we have the API socket and until we can connect
+        # to it
+        return super(Zebra, self).readiness_conditions() + \
+            (SocketPath(self.zebra_socket),)
 
     def listening(self):
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        try:
-            sock.connect(self.zebra_socket)
-            sock.close()
-            return True
-        except socket.error:
-            return False
+        return SocketPath(self.zebra_socket).is_ready()
 
 
 class CommunityList(object):
@@ -113,8 +118,19 @@ class CommunityList(object):
         self.action = action
         self.community = community
 
+    @property
+    def key(self):
+        """The hashable identity of this community-list"""
+        return self.name, self.action
+
     def __eq__(self, other):
-        return self.name == other.name and self.action == other.action
+        return self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
 
 
 class AccessListEntry(object):
@@ -149,8 +165,19 @@ class AccessList(object):
                         else AccessListEntry(prefix=e)
                         for e in entries]
 
+    @property
+    def key(self):
+        """The hashable identity of this access-list"""
+        return self.name
+
     def __eq__(self, other):
-        return self.name == other.name
+        return self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
 
 
 class RouteMapMatchCond(object):
@@ -166,8 +193,19 @@ class RouteMapMatchCond(object):
         self.condition = condition
         self.cond_type = cond_type
 
+    @property
+    def key(self):
+        """The hashable identity of this condition"""
+        return self.cond_type, self.condition
+
     def __eq__(self, other):
-        return self.condition == other.condition and self.cond_type == other.cond_type
+        return self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
 
 
 class RouteMapSetAction(object):
@@ -183,8 +221,19 @@ class RouteMapSetAction(object):
         self.action_type = action_type
         self.value = value
 
+    @property
+    def key(self):
+        """The hashable identity of this action"""
+        return self.action_type, self.value
+
     def __eq__(self, other):
-        return self.action_type == other.action_type and self.value == other.value
+        return self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
 
 
 class RouteMap(object):
@@ -226,26 +275,53 @@ class RouteMap(object):
         self.order = order
         self.proto = proto
 
+    @property
+    def key(self):
+        """The hashable identity of this route map entry: two entries with
+        the same key are merged together"""
+        neighbor = self.neighbor
+        if isinstance(neighbor, list):
+            neighbor = tuple(neighbor)
+        return neighbor, self.direction, self.exit_policy, self.order
+
+    @property
+    def content_key(self):
+        """A hashable representation of the content of this route map entry,
+        ignoring the neighbor it applies to"""
+        return (self.match_policy, self.order, self.direction,
+                self.call_action, self.exit_policy,
+                tuple(c.key for c in self.match_cond),
+                tuple(a.key for a in self.set_actions))
+
     def __eq__(self, other):
-        return self.neighbor == other.neighbor and self.direction == other.direction and self.exit_policy == other.exit_policy and self.order == other.order
+        return self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
 
     def append_match_cond(self, match_conditions):
-        """
+        """Add the match conditions that are not yet part of this entry
 
-        :return:
+        :param match_conditions: a list of RouteMapMatchCond
         """
+        known = set(self.match_cond)
         for match_condition in match_conditions:
-            if match_condition not in self.match_cond:
+            if match_condition not in known:
+                known.add(match_condition)
                 self.match_cond.append(match_condition)
 
     def append_set_action(self, set_actions):
-        """
+        """Add the set actions that are not yet part of this entry
 
-        :param set_actions:
-        :return:
+        :param set_actions: a list of RouteMapSetAction
         """
+        known = set(self.set_actions)
         for set_action in set_actions:
-            if set_action not in self.set_actions:
+            if set_action not in known:
+                known.add(set_action)
                 self.set_actions.append(set_action)
 
     @staticmethod
@@ -0,0 +1,63 @@
+"""This module reads and writes the sysctls of a node directly through
+/proc/sys, from within the network namespace of the node, instead of running
+the sysctl command in its shell."""
+from builtins import str
+
+import os
+
+from mininet.log import lg as log
+
+from ipmininet.netlink import in_namespace
+
+PROC_SYS = '/proc/sys'
+# The position of the interface name in per-interface sysctls, e.g.
+# net.ipv6.conf.<intf>.forwarding or net.ipv4.neigh.<intf>.base_reachable_time
+INTF_POS = 3
+
+
+def sysctl_path(key, intf=None):
+    """Return the path of a sysctl, relative to /proc/sys. Paths are also
+    accepted by the sysctl command, and support interface names with dots.
+
+    :param key: The sysctl key, e.g. net.ipv4.ip_forward. For per-interface
+                sysctls, the key without interface name,
+                e.g. net.ipv6.conf.forwarding
+    :param intf: The interface name for per-interface sysctls"""
+    if '/' in key:
+        return key
+    parts = key.split('.')
+    if intf is not None:
+        parts.insert(INTF_POS, intf)
+    return '/'.join(parts)
+
+
+def set_sysctls(pid, values):
+    """Set sysctls in the network namespace of a process, in one pass
+
+    :param pid: The pid of a process in the target namespace, or None to use
+                the current one
+    :param values: An iterable of (path, value) with path as returned by
+                   sysctl_path
+    :return: A dict {path: previous value}, the previous value is None if it
+             could not be read
+    :raise OSError: if the namespace cannot be entered"""
+    old = {}
+    with in_namespace(pid):
+        for path, val in values:
+            val = str(val)
+            fname = os.path.join(PROC_SYS, path)
+            try:
+                with open(fname) as f:
+                    v = f.read().strip(' \n\t\r')
+            except (IOError, OSError):
+                v = None
+            old[path] = v
+            if v == val:
+                continue
+            try:
+                with open(fname, 'w') as f:
+                    f.write(val)
+            except (IOError, OSError) as e:
+                log.error('Cannot set sysctl', path, 'to', val, ':', str(e),
+                          '\n')
+    return old
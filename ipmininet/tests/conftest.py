@@ -0,0 +1,4 @@
+import sys
+
+# The coroutines of ipmininet.aio require Python 3.5+
+collect_ignore = ['test_aio.py'] if sys.version_info < (3, 5) else []
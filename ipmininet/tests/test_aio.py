@@ -0,0 +1,68 @@
+"""This module tests the coroutines driving the nodes"""
+import asyncio
+import os
+import tempfile
+import time
+
+from ipmininet import aio
+from ipmininet.router.config.readiness import PidFile
+from ipmininet.tests.utils import FakeNode, barrier_cmd, logged_cmd, \
+    max_overlap
+
+
+def test_commands():
+    node = FakeNode()
+    assert aio.run(aio.acmd(node, 'echo a; echo b >&2')) == 'a\nb\n'
+    assert aio.run(aio.apexec(node, ['sh', '-c', 'echo a; exit 3'])) == \
+        ('a\n', '', 3)
+
+    async def read():
+        p = await aio.apopen(node, 'echo', 'a')
+        return (await p.stdout.read()), (await p.wait())
+
+    assert aio.run(read()) == (b'a\n', 0)
+
+
+def test_concurrency(tmpdir):
+    node = FakeNode()
+
+    async def run_all(cmds):
+        start = time.time()
+        outputs = await asyncio.gather(*[aio.acmd(node, cmd)
+                                         for cmd in cmds])
+        print('%d commands ran in %.3fs' % (len(cmds), time.time() - start))
+        return outputs
+
+    log = str(tmpdir.join('log'))
+    try:
+        aio.set_concurrency(2)
+        # Only two commands run at once
+        aio.run(run_all([logged_cmd(log, 'sleep .1')] * 4))
+        assert max_overlap(log) <= 2
+        aio.set_concurrency(4)
+        # The four commands only meet if they all run at once
+        barrier = tmpdir.mkdir('barrier')
+        assert aio.run(run_all([barrier_cmd(barrier, 4)] * 4)) == \
+            ['met\n'] * 4
+    finally:
+        aio.set_concurrency(64)
+
+
+def test_await_conditions():
+    path = tempfile.mktemp()
+    cond = PidFile(path)
+
+    async def write_later():
+        await asyncio.sleep(.05)
+        with open(path, 'w') as f:
+            f.write('%d\n' % os.getpid())
+
+    async def wait():
+        waiter = aio.await_conditions([cond], timeout=1)
+        return (await asyncio.gather(waiter, write_later()))[0]
+
+    assert not aio.run(aio.await_conditions([cond], timeout=.05))
+    try:
+        assert aio.run(wait())
+    finally:
+        os.unlink(path)
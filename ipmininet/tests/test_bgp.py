@@ -10,12 +10,19 @@ from ipmininet.examples.bgp_rr import BGPTopoRR
 from ipmininet.examples.bgp_full_config import BGPTopoFull
 from ipmininet.ipnet import IPNet
 from ipmininet.iptopo import IPTopo
-from ipmininet.router.config import BGP, bgp_peering, AS, iBGPFullMesh
+from ipmininet.router.config import BGP, bgp_peering, AS, iBGPFullMesh, \
+    iBGPRouteReflection
 from ipmininet.router.config.base import RouterConfig
-from ipmininet.router.config.bgp import AF_INET, AF_INET6
-from ipmininet.tests.utils import assert_connectivity, assert_path, traceroute
+from ipmininet.router.config.bgp import AF_INET, AF_INET6, Peer
+from ipmininet.router.config.utils import ConfigDict, ip_statement, \
+    template_lookup
+from ipmininet.router.config.zebra import RouteMap, RouteMapMatchCond, \
+    CommunityList
+from ipmininet.utils import IndexedList
+from ipmininet.tests.utils import assert_connectivity, assert_path, \
+    traceroute, FakeBGP, FakeNet, FakeRouter
 from . import require_root
-from ipaddress import ip_address
+from ipaddress import ip_address, ip_interface
 import sys
 import pexpect
 
@@ -210,3 +217,164 @@ def test_bgp_full_config():
         net.stop()
     finally:
         cleanup()
+
+
+class GridRRTopo(IPTopo):
+    """A grid of routers in a single AS, using automatic route reflection"""
+
+    def __init__(self, size, centrality, *args, **kwargs):
+        self.size = size
+        self.centrality = centrality
+        super(GridRRTopo, self).__init__(*args, **kwargs)
+
+    def build(self, *args, **kwargs):
+        grid = [[self.addRouter('r%d_%d' % (i, j))
+                 for j in range(self.size)] for i in range(self.size)]
+        for i in range(self.size):
+            for j in range(self.size):
+                if i + 1 < self.size:
+                    self.addLink(grid[i][j], grid[i + 1][j])
+                if j + 1 < self.size:
+                    self.addLink(grid[i][j], grid[i][j + 1])
+        self.addOverlay(iBGPRouteReflection(
+            1, [r for line in grid for r in line], cluster_size=10,
+            centrality=self.centrality))
+        super(GridRRTopo, self).build(*args, **kwargs)
+
+
+@pytest.mark.parametrize("centrality", [iBGPRouteReflection.DEGREE,
+                                        iBGPRouteReflection.CLOSENESS])
+def test_route_reflection_overlay(centrality):
+    topo = GridRRTopo(6, centrality)
+    routers = topo.routers()
+    reflectors = [r for r in routers if topo.nodeInfo(r).get('bgp_rr_info')]
+    # 4 clusters of 2 route reflectors
+    assert len(reflectors) == 8
+    cluster_ids = {}
+    for rr in reflectors:
+        cluster_ids.setdefault(topo.nodeInfo(rr)['bgp_cluster_id'],
+                               []).append(rr)
+    assert sorted(len(rrs) for rrs in cluster_ids.values()) == [2] * 4
+    for rrs in cluster_ids.values():
+        assert topo.nodeInfo(rrs[0])['bgp_rr_clients'] == \
+            topo.nodeInfo(rrs[1])['bgp_rr_clients']
+    # Every client peers with the route reflectors of its cluster, and the
+    # route reflectors peer in full mesh
+    for r in routers:
+        peers = topo.nodeInfo(r)['bgp_peers']
+        assert len(peers) == len(set(peers))
+        if r in reflectors:
+            assert set(reflectors) - {r} <= set(peers)
+        else:
+            assert len(peers) == 2
+            assert all(r in topo.nodeInfo(rr)['bgp_rr_clients']
+                       for rr in peers)
+    sessions = sum(len(topo.nodeInfo(r)['bgp_peers']) for r in routers) // 2
+    assert sessions == 2 * (len(routers) - 8) + 8 * 7 // 2
+    # The corners of the grid are the least central routers
+    assert not {'r0_0', 'r0_5', 'r5_0', 'r5_5'} & set(reflectors)
+
+
+def render_bgpd(peers, route_maps, peer_groups=True):
+    af = AF_INET()
+    af.neighbors.extend(peers)
+    BGP._apply_route_maps(peers, route_maps)
+    if peer_groups:
+        route_maps = BGP._merge_route_maps(route_maps)
+        groups = BGP._build_peer_groups(peers, [af])
+    else:
+        groups = []
+    cfg = ConfigDict(logfile=None, debug=(), asn=1, routerid='1.1.1.1',
+                     rr=None, peer_groups=groups, neighbors=peers,
+                     address_families=[af], access_lists=[],
+                     community_lists=[], route_maps=route_maps)
+    return template_lookup.get_template('bgpd.mako').render(
+        node=ConfigDict(name='r', password='zebra', bgpd=cfg),
+        ip_statement=ip_statement).splitlines()
+
+
+def peers_and_route_maps():
+    """Three iBGP peers and three eBGP peers, the first two of them with
+    the same policy"""
+    net = FakeNet()
+    base = net.add(FakeRouter('r'))
+    base.params['asn'] = 1
+    neighbors = [('10.0.0.%d' % i, 1) for i in range(1, 4)] + \
+        [('10.1.0.%d' % i, i) for i in range(2, 5)]
+    for address, asn in neighbors:
+        n = net.add(FakeRouter('n%s' % address))
+        n.params['asn'] = asn
+        net.link(base, n).intf2._record_addresses(
+            [ip_interface(u'%s/24' % address)])
+    IPNet._broadcast_domains(net)
+    peers = [Peer(base, n.name) for n in net.routers[1:]]
+    route_maps = [RouteMap(set_actions=[('local-preference', 150)],
+                           neighbor=peers[i]) for i in (3, 4)] + \
+        [RouteMap(set_actions=[('local-preference', 50)], neighbor=peers[5])]
+    return peers, route_maps
+
+
+def test_peer_groups():
+    peers, route_maps = peers_and_route_maps()
+    lines = [line.strip() for line in render_bgpd(peers, route_maps)]
+    ibgp, ebgp = 'ibgp-ipv4-1', 'ebgp-ipv4-2'
+    assert 'neighbor %s peer-group' % ibgp in lines
+    assert 'neighbor %s peer-group' % ebgp in lines
+    for p in peers[:3]:
+        assert 'neighbor %s peer-group %s' % (p.peer, ibgp) in lines
+        assert 'neighbor %s activate' % p.peer not in lines
+    for p in peers[3:5]:
+        assert 'neighbor %s peer-group %s' % (p.peer, ebgp) in lines
+        assert 'neighbor %s remote-as %d' % (p.peer, p.asn) in lines
+    # The last eBGP peer has a different policy
+    assert not any(line.startswith('neighbor 10.1.0.4 peer-group')
+                   for line in lines)
+    assert 'neighbor 10.1.0.4 activate' in lines
+    assert 'neighbor %s activate' % ibgp in lines
+    assert 'neighbor %s next-hop-self force' % ibgp in lines
+    assert 'neighbor %s ebgp-multihop' % ebgp in lines
+    # The identical route maps are defined once, and applied to the group
+    rm_name = route_maps[0].name
+    assert 'neighbor %s route-map %s-ipv4 in' % (ebgp, rm_name) in lines
+    assert 'route-map %s-ipv4 permit 10' % route_maps[1].name not in lines
+    assert len([line for line in lines if line.startswith('route-map')]) == 2
+
+    peers, route_maps = peers_and_route_maps()
+    lines = [line.strip() for line in render_bgpd(peers, route_maps,
+                                                  peer_groups=False)]
+    assert not any('peer-group' in line for line in lines)
+    assert 'neighbor 10.1.0.3 route-map %s-ipv4 in' % route_maps[1].name \
+        in lines
+
+
+def test_build_route_map():
+    peers, _ = peers_and_route_maps()
+    a, b = peers[3], peers[4]
+    route_maps = [
+        {'peer': a.node, 'match_cond': [RouteMapMatchCond('community', 'c1')],
+         'set_actions': [('local-preference', 150)]},
+        {'peer': b.node, 'set_actions': [('local-preference', 50)]},
+        {'peer': a.node, 'match_cond': [RouteMapMatchCond('community', 'c1'),
+                                        RouteMapMatchCond('community', 'c2')],
+         'set_actions': [('local-preference', 150)]},
+        {'peer': a.node, 'direction': 'out', 'set_actions': [('metric', 5)]},
+        {'peer': 'unknown', 'set_actions': [('metric', 5)]}]
+    rms = BGP.build_route_map(FakeBGP(route_maps), peers)
+    # The entries with the same neighbor, direction and order are merged,
+    # the merged entry taking the place of the last one
+    assert [(rm.neighbor, rm.direction) for rm in rms] == \
+        [(b, 'in'), (a, 'in'), (a, 'out')]
+    assert [c.condition for c in rms[1].match_cond] == ['c1', 'c2']
+    assert [(s.action_type, s.value) for s in rms[1].set_actions] == \
+        [('local-preference', 150)]
+    assert rms[1] == RouteMap(neighbor=a) and len({rms[1], rms[2]}) == 2
+
+
+def test_filter_lists():
+    lists = IndexedList([CommunityList('c1', community=1)])
+    assert CommunityList('c1', community=2) in lists
+    assert CommunityList('c2', community=1) not in lists
+    lists.append(CommunityList('c2'))
+    lists.remove(CommunityList('c1'))
+    assert CommunityList('c1') not in lists
+    assert [c.name for c in lists] == ['c2']
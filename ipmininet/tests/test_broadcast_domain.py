@@ -0,0 +1,119 @@
+"""This module tests the discovery of the broadcast domains"""
+import pytest
+
+from ipaddress import ip_address, ip_interface, ip_network
+
+from ipmininet.ipnet import BroadcastDomain, IPNet
+from ipmininet.tests.utils import FakeHost, FakeNet, FakeNode, FakeRouter
+
+
+def lan(size):
+    """A router, and size hosts attached to a chain of two switches, each
+    host being dual-homed"""
+    net = FakeNet()
+    r = net.add(FakeRouter('r'))
+    s1, s2 = net.add(FakeNode('s1')), net.add(FakeNode('s2'))
+    net.link(r, s1)
+    net.link(s1, s2)
+    hosts = [net.add(FakeHost('h%d' % i)) for i in range(size)]
+    for h in hosts:
+        net.link(h, s1)
+        net.link(h, s2)
+    return net, r, hosts
+
+
+def test_discovery():
+    net, r, hosts = lan(100)
+    other = net.add(FakeHost('other'))
+    link = net.link(r, other)
+    domains = IPNet._broadcast_domains(net)
+    # The LAN, the point-to-point link and the loopback of r
+    assert len(domains) == 3
+    lan_domain, p2p, lo = domains
+    assert lan_domain.interfaces == {r.intf('r-eth1')} | \
+        {i for h in hosts for i in h.intfs}
+    assert p2p.interfaces == {link.intf1, link.intf2}
+    assert lo.interfaces == {r.intf('lo')}
+    for d in domains:
+        for i in d:
+            assert i.broadcast_domain is d
+
+
+def test_stats():
+    net, r, hosts = lan(3)
+    hosts[0].intfs[0].params['v4_width'] = 2
+    domain = IPNet._broadcast_domains(net)[0]
+    assert domain.len_v4() == domain.len_v6() == 0
+    assert domain.routers == [r.intf('r-eth1')]
+    # The statistics are updated when the addresses change
+    hosts[0].intfs[0]._record_addresses([ip_interface(u'10.0.0.1/24'),
+                                         ip_interface(u'10.0.0.2/24')])
+    hosts[1].intfs[0]._record_addresses([ip_interface(u'2001:db8::1/64')])
+    assert domain.len_v4() == 2
+    assert domain.len_v6() == 1
+    assert BroadcastDomain(hosts[0].intfs[0]).fixed_net4s == \
+        [ip_interface(u'10.0.0.0/24').network]
+
+
+def test_membership():
+    net, r, hosts = lan(3)
+    domain = IPNet._broadcast_domains(net)[0]
+    r_itf = r.intf('r-eth1')
+    assert r_itf in domain
+    assert sorted(i.name for i in domain.hosts) == \
+        sorted(i.name for h in hosts for i in h.intfs)
+    assert domain.use_ip_version(4)
+
+    h_itf = hosts[0].intfs[0]
+    h_itf._record_addresses([ip_interface(u'10.0.0.1/24')])
+    r_itf._record_addresses([ip_interface(u'10.0.0.2/24')])
+    assert domain.len_v4() == 2
+    domain.remove_interface(h_itf)
+    assert h_itf not in domain
+    assert h_itf not in domain.hosts
+    assert domain.len_v4() == 1
+    # The domain no longer tracks the addresses of removed interfaces
+    h_itf._set_addresses(None, [], [])
+    assert domain.len_v4() == 1
+    domain.remove_interface(r_itf)
+    assert domain.routers == []
+    assert domain.len_v4() == 0
+
+    assert domain.add_interface(r_itf)
+    assert not domain.add_interface(r_itf)
+    assert domain.routers == [r_itf]
+    assert domain.len_v4() == 1
+    # The members cannot be changed from the outside
+    domain.routers.remove(r_itf)
+    assert domain.routers == [r_itf]
+
+
+def test_detach():
+    net, r, hosts = lan(2)
+    h_itf = hosts[0].intfs[0]
+    old = IPNet._broadcast_domains(net)[0]
+    old.detach()
+    domain = IPNet._broadcast_domains(net)[0]
+    # Only the new domain follows the address changes
+    assert len(h_itf._address_listeners) == 1
+    h_itf._record_addresses([ip_interface(u'10.0.0.1/24')])
+    assert domain.len_v4() == 1
+    assert old.len_v4() == 0
+
+
+def test_next_addresses():
+    net, r, hosts = lan(1)
+    domain = IPNet._broadcast_domains(net)[0]
+    with pytest.raises(ValueError):
+        domain.next_ipv4()
+    domain.net = ip_network(u'10.0.0.0/30')
+    domain.net6 = ip_network(u'2001:db8::/64')
+    assert domain.next_ipv4() == ip_interface(u'10.0.0.1/30')
+    assert domain.next_ipv4s(2) == [ip_interface(u'10.0.0.2/30'),
+                                    ip_interface(u'10.0.0.3/30')]
+    with pytest.raises(ValueError):
+        domain.next_ipv4()
+    block = domain.next_ipv6_block(1000)
+    assert len(block) == 1000
+    assert block[0] == int(ip_address(u'2001:db8::1'))
+    assert domain.next_ipv6() == ip_interface(u'2001:db8::3e9/64')
@@ -0,0 +1,69 @@
+"""This module tests the caches of daemon configurations"""
+import os
+import time
+
+from ipmininet.router.config.cache import ValidationCache
+from ipmininet.router.config import base, utils
+from ipmininet.tests.utils import FakeDaemon, FakeRouter
+
+
+def test_validation_cache(tmpdir):
+    cache = ValidationCache(directory=str(tmpdir))
+    key = cache.key(FakeDaemon('r1', 'hostname r'))
+    assert key is not None
+    assert key not in cache
+    cache.add(key)
+    assert key in cache
+    # The same configuration on another node is also valid
+    assert cache.key(FakeDaemon('r2', 'hostname r')) == key
+    assert cache.key(FakeDaemon('r1', 'hostname s')) != key
+
+
+def test_validation_cache_unknown_executable(tmpdir):
+    cache = ValidationCache(directory=str(tmpdir))
+    d = FakeDaemon('r1', 'hostname r')
+    d.dry_run = 'ipmininet-missing-daemon -C %s' % d.cfg_filename
+    assert cache.key(d) is None
+
+
+def test_validation_cache_eviction(tmpdir):
+    cache = ValidationCache(directory=str(tmpdir), max_entries=4)
+    keys = [cache.key(FakeDaemon('r1', str(i))) for i in range(4)]
+    for i, key in enumerate(keys):
+        cache.add(key)
+        os.utime(os.path.join(str(tmpdir), key), (i, i))
+    # Use the oldest one, so that it becomes the most recent
+    assert keys[0] in cache
+    time.sleep(.01)
+    cache.add(cache.key(FakeDaemon('r1', 'new')))
+    assert len(os.listdir(str(tmpdir))) == 3
+    assert keys[0] in cache
+    assert keys[1] not in cache
+    assert keys[2] not in cache
+
+
+def test_lazy_template_lookup(tmpdir, monkeypatch):
+    monkeypatch.setenv(utils.TEMPLATE_CACHE_ENV, str(tmpdir))
+    lookup = utils.LazyTemplateLookup(
+        directories=[os.path.dirname(utils.__file__) + '/templates'])
+    # The templates are only hashed when the first one is looked up
+    assert lookup.module_directory is None
+    assert not tmpdir.listdir()
+    lookup.get_template('zebra.mako')
+    assert os.path.dirname(lookup.module_directory) == str(tmpdir)
+    assert len(tmpdir.listdir()) == 1
+
+
+def test_build_configs_keeps_pool_renderings(monkeypatch):
+    # The renderings of the pool outnumber the render cache entries
+    monkeypatch.setattr(base.render_cache, 'size', 2)
+    monkeypatch.setattr(base, '_render_in_pool',
+                        lambda jobs, workers: ['out %s' % args['cfg']
+                                               for _, args in jobs])
+    routers = [FakeRouter('r%d' % i) for i in range(5)]
+    for i, r in enumerate(routers):
+        r.config._daemons[FakeDaemon.NAME] = FakeDaemon(r.name, str(i))
+    assert base.build_configs(routers, workers=2) == []
+    daemons = [r.config.daemon(FakeDaemon) for r in routers]
+    assert [d.written for d in daemons] == ['out %d' % i for i in range(5)]
+    assert daemons[0].files == ['/tmp/fake_r0.cfg']
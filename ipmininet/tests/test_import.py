@@ -0,0 +1,28 @@
+"""This module guards the modules loaded when importing the library"""
+import subprocess
+import sys
+
+IMPORT_SCRIPT = """
+import sys
+import time
+start = time.time()
+import ipmininet.ipnet
+import ipmininet.router.config
+print(time.time() - start)
+print(' '.join(sys.modules))
+"""
+
+
+def test_import_time():
+    out = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT])\
+        .decode('utf-8').splitlines()
+    duration, modules = float(out[0]), out[1].split()
+    # No ssh key generation nor unused daemon module at import time
+    assert 'ipmininet.router.config.sshd' not in modules
+    assert 'ipmininet.router.config.bgp' not in modules
+    assert 'ipmininet.aio' not in modules
+    if sys.version_info >= (3, 7):
+        assert 'future.utils' not in modules
+    # The import time depends on the load of the machine, it is only
+    # reported (see pytest -s)
+    print('Importing ipmininet took %.3fs' % duration)
@@ -0,0 +1,66 @@
+"""This module tests the subnet allocator"""
+import pytest
+
+from ipaddress import ip_interface, ip_network
+
+from ipmininet.ipalloc import SubnetAllocator, interfaces_of
+from ipmininet.ipnet import IPNet
+from ipmininet.tests.utils import FakeDomain
+
+
+def nets(*prefixes):
+    return [ip_network(p) for p in prefixes]
+
+
+def test_allocate_splits():
+    allocator = SubnetAllocator(nets(u'10.0.0.0/24'))
+    assert allocator.allocate(26) == ip_network(u'10.0.0.0/26')
+    assert allocator.free_subnets() == nets(u'10.0.0.64/26', u'10.0.0.128/25')
+    # The smallest free subnet holding the prefix is used first
+    assert allocator.allocate(27) == ip_network(u'10.0.0.64/27')
+    assert allocator.allocate(25) == ip_network(u'10.0.0.128/25')
+    assert allocator.free_subnets() == nets(u'10.0.0.96/27')
+    with pytest.raises(ValueError):
+        allocator.allocate(26)
+    assert allocator.allocate(27) == ip_network(u'10.0.0.96/27')
+    assert len(allocator) == 0
+    with pytest.raises(ValueError):
+        allocator.allocate(30)
+
+
+def test_allocate_reserved():
+    allocator = SubnetAllocator(nets(u'10.0.0.0/24'),
+                                reserved=nets(u'10.0.0.0/26', u'10.0.0.64/27',
+                                              u'10.0.0.200/29'))
+    assert allocator.free_subnets() == nets(
+        u'10.0.0.192/29', u'10.0.0.208/28', u'10.0.0.96/27', u'10.0.0.224/27',
+        u'10.0.0.128/26')
+    assert allocator.allocate(26) == ip_network(u'10.0.0.128/26')
+    assert allocator.allocate(30) == ip_network(u'10.0.0.192/30')
+    assert allocator.allocate(28) == ip_network(u'10.0.0.208/28')
+
+
+def test_allocate_v6():
+    allocator = SubnetAllocator(nets(u'fc00::/7'))
+    assert allocator.allocate(48) == ip_network(u'fc00::/48')
+    assert allocator.allocate(48) == ip_network(u'fc00:0:1::/48')
+    assert allocator.allocate(64) == ip_network(u'fc00:0:2::/64')
+    assert len(allocator) == 41 + 15
+
+
+def test_allocate_subnets():
+    subnets = nets(u'10.0.0.0/24')
+    domains = [FakeDomain(2), FakeDomain(50), FakeDomain(2, use_ip=False),
+               FakeDomain(10)]
+    IPNet._allocate_subnets(subnets, list(domains), max_prefixlen=28,
+                            allocated_subnets=nets(u'10.0.0.0/28'))
+    assert [d.net for d in domains] == [
+        ip_network(u'10.0.0.32/28'), ip_network(u'10.0.0.64/26'), None,
+        ip_network(u'10.0.0.16/28')]
+    assert subnets == nets(u'10.0.0.48/28', u'10.0.0.128/25')
+
+
+def test_interfaces_of():
+    assert interfaces_of(range(167772161, 167772163), 24, version=4) == \
+        [ip_interface(u'10.0.0.1/24'), ip_interface(u'10.0.0.2/24')]
+    assert interfaces_of([1], 64, version=6) == [ip_interface(u'::1/64')]
@@ -0,0 +1,70 @@
+"""This module tests the index of IP prefixes"""
+import pytest
+
+from ipaddress import ip_address, ip_interface
+
+from ipmininet.ipindex import PrefixIndex, to_address
+
+
+@pytest.fixture()
+def index():
+    idx = PrefixIndex()
+    idx.add(ip_interface(u'10.0.0.1/8'), 'a')
+    idx.add(ip_interface(u'10.1.0.1/16'), 'b')
+    idx.add(ip_interface(u'10.1.0.2/16'), 'c')
+    idx.add(ip_interface(u'2001:db8::1/48'), 'd')
+    idx.add(ip_interface(u'2001:db8:0:1::1/64'), 'e')
+    return idx
+
+
+@pytest.mark.parametrize("ip,expected", [
+    (u'10.0.0.1', ['a']),
+    (u'10.1.0.2', ['c']),
+    (u'10.1.2.3', ['b', 'c']),
+    (u'10.2.0.1', ['a']),
+    (u'2001:db8::1', ['d']),
+    (u'2001:db8::2', ['d']),
+    (u'2001:db8:0:1::2', ['e']),
+])
+def test_lookup(index, ip, expected):
+    assert index.lookup(ip_address(ip)) == expected
+
+
+@pytest.mark.parametrize("ip", [u'11.0.0.1', u'2001:db9::1'])
+def test_lookup_miss(index, ip):
+    with pytest.raises(KeyError):
+        index.lookup(ip_address(ip))
+
+
+def test_exact(index):
+    assert index.exact(ip_address(u'10.0.0.1')) == ['a']
+    with pytest.raises(KeyError):
+        index.exact(ip_address(u'10.0.0.2'))
+
+
+def test_lookup_many(index):
+    assert index.lookup_many([u'10.1.0.1', ip_address(u'10.3.0.1'),
+                              u'12.0.0.1', u'2001:db8::1/48']) == \
+        [['b'], ['a'], None, ['d']]
+    assert index.lookup_many([int(ip_address(u'10.1.0.2'))], version=4) == \
+        [['c']]
+
+
+def test_remove(index):
+    index.remove(ip_interface(u'10.1.0.1/16'), 'b')
+    assert index.lookup(ip_address(u'10.1.2.3')) == ['c']
+    index.remove(ip_interface(u'10.1.0.2/16'), 'c')
+    assert index.lookup(ip_address(u'10.1.2.3')) == ['a']
+    with pytest.raises(KeyError):
+        index.remove(ip_interface(u'10.1.0.2/16'), 'c')
+    assert len(index) == 3
+
+
+@pytest.mark.parametrize("ip,expected", [
+    (u'10.0.0.1', u'10.0.0.1'),
+    (u'10.0.0.1/24', u'10.0.0.1'),
+    (ip_interface(u'2001:db8::1/64'), u'2001:db8::1'),
+    (ip_address(u'2001:db8::1'), u'2001:db8::1'),
+])
+def test_to_address(ip, expected):
+    assert to_address(ip) == ip_address(expected)
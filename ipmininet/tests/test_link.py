@@ -4,8 +4,9 @@ from ipaddress import ip_interface
 from ipmininet.clean import cleanup
 from ipmininet.examples.static_address_network import StaticAddressNet
 from ipmininet.ipnet import IPNet
-from ipmininet.link import OrderedAddress
+from ipmininet.link import OrderedAddress, IPLink, provision_links
 from ipmininet.tests import require_root
+from ipmininet.tests.utils import PortNode
 
 
 @pytest.mark.parametrize("unsorted_list,sorted_list", [
@@ -73,3 +74,28 @@ def test_addr_intf():
         net.stop()
     finally:
         cleanup()
+
+
+@require_root
+def test_provision_links():
+    a, b = PortNode('a'), PortNode('b')
+    try:
+        links = provision_links([
+            (IPLink, a, b, {'addr1': '02:00:00:00:00:01'}),
+            (IPLink, a, b, {'port1': 5, 'params2': {'v4_width': 2}}),
+            (IPLink, b, a, {})])
+        assert a.cmd_count == b.cmd_count == 0
+        assert [itf.name for itf in a.intfs] == ['a-eth0', 'a-eth5', 'a-eth6']
+        assert [itf.name for itf in b.intfs] == ['b-eth0', 'b-eth1', 'b-eth2']
+        assert links[0].intf1.mac == '02:00:00:00:00:01'
+        assert links[1].intf2.interface_width == (2, 1)
+        assert links[2].intf1.node is b
+        # The interfaces are up in the namespaces of their nodes
+        for itf in a.intfs:
+            assert 'UP' in a.cmd('ip', 'link', 'show', 'dev', itf.name)\
+                .split('\n')[0]
+        assert links[0].intf1.updateMAC() == '02:00:00:00:00:01'
+    finally:
+        a.stop()
+        b.stop()
+
@@ -9,7 +9,11 @@ from ipmininet.clean import cleanup
 from ipmininet.examples.static_address_network import StaticAddressNet
 from ipmininet.ipnet import IPNet
 from ipmininet.link import _parse_addresses
-from ipmininet.router.config.utils import ip_statement
+from ipmininet.router.config.base import _render_in_pool
+from ipmininet.router.config.ospf import OSPFNetwork
+from ipmininet.router.config.utils import ip_statement, fingerprint,\
+    ConfigDict, RenderCache, Uncacheable, template_lookup
+from ipmininet.tests.utils import FakeNode
 from . import require_root
 
 
@@ -151,3 +155,78 @@ def test_find_node(start, node, present):
 ])
 def test_ip_statement(test_input, expected):
     assert ip_statement(test_input) == expected
+
+
+def _ospf_cfg(cost):
+    return ConfigDict(name='r1', ospfd=ConfigDict(
+        interfaces=[ConfigDict(name='r1-eth0', cost=cost)],
+        networks=[OSPFNetwork(ipaddress.ip_interface(u'10.0.0.1/24'), '0.0.0.0')]))
+
+
+def test_config_fingerprint():
+    assert fingerprint(_ospf_cfg(1)) == fingerprint(_ospf_cfg(1))
+    assert fingerprint(_ospf_cfg(1)) != fingerprint(_ospf_cfg(2))
+    assert fingerprint(_ospf_cfg(1)) != fingerprint(_ospf_cfg(True))
+    with pytest.raises(Uncacheable):
+        fingerprint(ConfigDict(interfaces=(i for i in range(2))))
+    cfg = ConfigDict()
+    cfg.itself = cfg
+    with pytest.raises(Uncacheable):
+        fingerprint(cfg)
+
+
+def test_render_cache():
+    cache = RenderCache(template_lookup, size=1)
+    cfg = ConfigDict(logfile='/tmp/r1.log', debug=(), interfaces=[],
+                     access_lists=[], route_maps=[])
+    node = ConfigDict(name='r1', password='zebra', zebra=cfg)
+    out = cache.render('zebra.mako', node=node)
+    assert 'hostname r1' in out
+    assert list(cache._cache.values()) == [out]
+    assert cache.render('zebra.mako', node=node) == out
+    cfg.logfile = '/tmp/r2.log'
+    assert '/tmp/r2.log' in cache.render('zebra.mako', node=node)
+    assert len(cache._cache) == 1
+
+
+def test_render_in_pool():
+    jobs = []
+    for name in ('r1', 'r2', 'r3'):
+        cfg = ConfigDict(logfile='/tmp/%s.log' % name, debug=(),
+                         interfaces=[ConfigDict(name='%s-eth0' % name,
+                                                description='-> n/a')],
+                         access_lists=[], route_maps=[])
+        jobs.append(('zebra.mako', dict(node=ConfigDict(name=name,
+                                                        password='zebra',
+                                                        zebra=cfg),
+                                        ip_statement=ip_statement)))
+    rendered = _render_in_pool(jobs, 2)
+    assert rendered == [template_lookup.get_template(t).render(**args)
+                        for t, args in jobs]
+
+
+def test_command_batch():
+    node = FakeNode()
+    with utils.CommandBatch(node) as b:
+        echo = b.add('echo', 'a b')
+        quoted = b.add(['echo', 'a;b'])
+        failed = b.add('echo a >/dev/null; test -d /nonexistent;')
+        no_newline = b.add('printf x')
+        stdin = b.add('cat')
+    assert node.popen_count == 1
+    assert b.results[echo] == ('a b\n', 0)
+    assert b.results[quoted] == ('a;b\n', 0)
+    assert b.results[failed] == ('', 1)
+    assert b.results[no_newline] == ('x', 0)
+    assert b.results[stdin] == ('', 0)
+    with pytest.raises(ValueError):
+        b.add('echo\necho')
+    assert utils.CommandBatch(node).run() == []
+    assert node.popen_count == 1
+    # Batches longer than the line of a terminal are not truncated
+    with utils.CommandBatch(node) as b:
+        for i in range(200):
+            b.add('echo', '%d %s' % (i, 'x' * 50))
+    assert len(b.script) > 8192
+    assert node.popen_count == 2
+    assert b.results[-1] == ('199 %s\n' % ('x' * 50), 0)
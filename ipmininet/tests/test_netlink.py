@@ -0,0 +1,110 @@
+"""This module tests the netlink backend used to read back the addresses
+of the interfaces"""
+import subprocess
+import time
+
+from ipmininet import link
+from ipmininet.link import IPIntf, _addresses_of, close_address_monitor, \
+    refresh_addresses
+from ipmininet.netlink import interface_addresses
+
+from . import require_root
+from ipmininet.tests.utils import NamespaceNode
+
+
+def test_interface_addresses():
+    dump = interface_addresses()
+    assert 'lo' in dump
+    for name, (mac, v4, v6) in dump.items():
+        ip_mac, ip_v4, ip_v6 = _addresses_of(name)
+        assert mac == ip_mac
+        assert sorted(v4) == sorted(ip_v4)
+        assert sorted(v6) == sorted(ip_v6)
+
+
+@require_root
+def test_interface_addresses_namespace():
+    holder = subprocess.Popen(['unshare', '-n', 'sleep', '60'])
+    try:
+        time.sleep(.1)
+        subprocess.check_call(['nsenter', '-t', str(holder.pid), '-n',
+                               'ip', 'address', 'add', 'dev', 'lo',
+                               '10.1.2.3/24'])
+        dump = interface_addresses(holder.pid)
+        assert list(dump.keys()) == ['lo']
+        assert '10.1.2.3/24' in [a.with_prefixlen for a in dump['lo'][1]]
+        # The calling thread must be back in its original namespace
+        assert set(dump.keys()) != set(interface_addresses().keys())
+    finally:
+        holder.kill()
+        holder.wait()
+
+
+@require_root
+def test_address_cache():
+    node = NamespaceNode()
+    try:
+        node.cmd('ip', 'link', 'add', 'name', 'a', 'type', 'veth',
+                 'peer', 'name', 'b')
+        itf = IPIntf('a', node=node)
+        mac = itf.updateMAC()
+        assert mac is not None
+        count = node.cmd_count
+        # Nothing changed, the cache is used
+        assert itf.updateMAC() == mac
+        assert itf.updateIP() is None
+        assert node.cmd_count == count
+        # A forced refresh reads back the addresses
+        itf.updateIP(force=True)
+        assert node.cmd_count == count + 1
+        # External changes are detected
+        node.cmd('ip', 'address', 'add', 'dev', 'a', '10.1.2.3/24')
+        time.sleep(.1)
+        assert itf.updateIP() == '10.1.2.3'
+    finally:
+        node.stop()
+
+
+@require_root
+def test_close_address_monitor():
+    node = NamespaceNode()
+    try:
+        monitor = link._address_monitor(node)
+        assert monitor is not None
+        close_address_monitor(node)
+        # The monitor no longer holds the namespace
+        assert monitor.sock.fileno() == -1
+        assert node not in link._monitors
+        close_address_monitor(node)
+    finally:
+        node.stop()
+
+
+@require_root
+def test_refresh_addresses(monkeypatch):
+    node = NamespaceNode()
+    dumps = []
+
+    def dump(pid=None):
+        dumps.append(pid)
+        return interface_addresses(pid)
+
+    monkeypatch.setattr(link, 'interface_addresses', dump)
+    try:
+        intfs = []
+        for i in range(3):
+            node.cmd('ip', 'link', 'add', 'name', 'a%d' % i, 'type', 'veth',
+                     'peer', 'name', 'b%d' % i)
+            intfs.append(IPIntf('a%d' % i, node=node, netlink=True,
+                                provisioned=True))
+        # The stale interfaces are all read back with a single dump
+        refresh_addresses(node, force=False)
+        assert len(dumps) == 1
+        assert all(itf.mac is not None for itf in intfs)
+        refresh_addresses(node, force=False)
+        assert len(dumps) == 1
+        refresh_addresses(node)
+        assert len(dumps) == 2
+    finally:
+        close_address_monitor(node)
+        node.stop()
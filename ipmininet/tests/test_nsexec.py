@@ -0,0 +1,90 @@
+"""This module tests the execution of commands in the namespaces of a node
+without its shell"""
+import os
+import subprocess
+import time
+
+import pytest
+
+from ipmininet import nsexec
+from ipmininet.nsexec import NamespaceExecutor, command_args
+from ipmininet.router import NamespaceProcessHelper
+from ipmininet.tests.utils import FakeNode, barrier_cmd
+
+from . import require_root
+
+
+@pytest.mark.parametrize("args,expected", [
+    ((['ip', 'link', 1],), ['ip', 'link', '1']),
+    (('ip link', 'show', 'dev', 'lo'), ['ip', 'link', 'show', 'dev', 'lo']),
+    (("echo 'a b'",), ['echo', 'a b']),
+    (('ip link | grep lo',), ['sh', '-c', 'ip link | grep lo']),
+    (('echo a > /dev/null',), ['sh', '-c', 'echo a > /dev/null']),
+])
+def test_command_args(args, expected):
+    assert command_args(args) == expected
+
+
+def test_exit_codes():
+    executor = NamespaceExecutor()
+    assert executor.targets == []
+    assert executor.pexec('sh', '-c', '"echo a; echo b >&2; exit 3"') == \
+        ('a\n', 'b\n', 3)
+    assert executor.call('echo a; echo b >&2') == 'a\nb\n'
+
+
+def test_concurrent_commands(tmpdir):
+    executor = NamespaceExecutor()
+    # The commands only meet if they all run at once
+    processes = [executor.popen(barrier_cmd(tmpdir, 5)) for _ in range(5)]
+    assert [p.communicate()[0] for p in processes] == [b'met\n'] * 5
+    assert [p.wait() for p in processes] == [0] * 5
+
+
+@require_root
+def test_namespace():
+    holder = subprocess.Popen(['unshare', '-n', 'sleep', '60'])
+    try:
+        time.sleep(.1)
+        executor = NamespaceExecutor(holder.pid)
+        assert [path for path, _ in executor.targets] == \
+            ['/proc/%d/ns/net' % holder.pid]
+        executor.call('ip address add dev lo 10.1.2.3/24')
+        out, _, code = executor.pexec('ip', 'address', 'show')
+        assert code == 0
+        assert '10.1.2.3/24' in out
+        assert '10.1.2.3/24' not in subprocess.check_output(
+            ['ip', 'address', 'show']).decode('utf-8')
+    finally:
+        holder.kill()
+        holder.wait()
+
+
+@require_root
+def test_prefix(monkeypatch):
+    holder = subprocess.Popen(['unshare', '-n', 'sleep', '60'])
+    try:
+        time.sleep(.1)
+        assert NamespaceExecutor().prefix('/tmp') == []
+        executor = NamespaceExecutor(holder.pid)
+        monkeypatch.setattr(nsexec, 'HAS_MNEXEC', True)
+        assert executor.prefix('/tmp') == ['mnexec', '-a', str(holder.pid)]
+        monkeypatch.setattr(nsexec, 'HAS_MNEXEC', False)
+        assert executor.prefix('/tmp') == [
+            'nsenter', '--net=/proc/%d/ns/net' % holder.pid, '--wd=/tmp',
+            '--']
+        assert executor.call('pwd', cwd='/tmp') == '/tmp\n'
+    finally:
+        holder.kill()
+        holder.wait()
+
+
+def test_detached_daemons():
+    helper = NamespaceProcessHelper(FakeNode())
+    p = helper.get_process(helper.popen('sleep', 10))
+    try:
+        # The daemon does not receive the signals of the terminal
+        assert os.getsid(p.pid) == p.pid != os.getsid(0)
+    finally:
+        helper.terminate()
+        p.wait()
@@ -0,0 +1,51 @@
+"""This module tests the index of the interfaces used for BGP peerings"""
+from ipaddress import ip_interface
+
+from ipmininet.ipnet import IPNet
+from ipmininet.router.config.bgp import Peer
+from ipmininet.utils import PeerAddressIndex
+from ipmininet.tests.utils import FakeNet, FakeRouter
+
+
+def topology():
+    """r1 - r2 - r3 - x - r4, with x in another AS, and r2 - r3 doubled"""
+    net = FakeNet()
+    r1, r2, r3, r4 = [net.add(FakeRouter('r%d' % i)) for i in range(1, 5)]
+    x = net.add(FakeRouter('x'))
+    for r in (r1, r2, r3, r4):
+        r.params['asn'] = 1
+    x.params['asn'] = 2
+    net.link(r1, r2)
+    net.link(r2, r3)
+    net.link(r2, r3)
+    net.link(r3, x)
+    net.link(x, r4)
+    IPNet._broadcast_domains(net)
+    return r1, r2, r3, r4, x
+
+
+def test_peer_index():
+    r1, r2, r3, r4, x = topology()
+    index = PeerAddressIndex()
+    assert index.interface(r1, 'r2') is r2.intf('r2-eth1')
+    assert index.interface(r1, 'r3') is r3.intf('r3-eth1')
+    assert index.interface(r1, 'x') is x.intf('x-eth1')
+    # x belongs to another AS
+    assert index.interface(r1, 'r4') is None
+    assert index.interface(x, 'r4') is r4.intf('r4-eth1')
+    assert index.interface(r3, 'r1') is r1.intf('r1-eth1')
+
+
+def test_peer_address():
+    r1, r2, r3, r4, x = topology()
+    r1.peer_index = PeerAddressIndex()
+    itf = r3.intf('r3-eth1')
+    itf._record_addresses([ip_interface(u'10.0.0.1/24'),
+                           ip_interface(u'fe80::1/64')])
+    assert Peer._find_peer_address(r1, 'r3') == (u'10.0.0.1', r3)
+    # No global IPv6 address on the first interface found
+    assert Peer._find_peer_address(r1, 'r3', v6=True) == (None, None)
+    itf._record_addresses([ip_interface(u'2001:db8::1/64')])
+    assert Peer._find_peer_address(r1, 'r3', v6=True) == (u'2001:db8::1',
+                                                          r3)
+    assert Peer._find_peer_address(r1, 'r4') == (None, None)
@@ -0,0 +1,108 @@
+"""This module tests the concurrent reachability probes"""
+import os
+import resource
+
+import pytest
+
+from ipmininet import reachability
+from ipmininet.reachability import FpingProbe, PingProbe, \
+    ReachabilityMatrix, collect, plan_probes, run_commands
+from ipmininet.tests.utils import FakeNode, barrier_cmd, logged_cmd, \
+    max_overlap
+
+PING_OUTPUT = """PING 10.0.0.2 (10.0.0.2) 56(84) bytes of data.
+64 bytes from 10.0.0.2: icmp_seq=1 ttl=64 time=0.052 ms
+
+--- 10.0.0.2 ping statistics ---
+1 packets transmitted, 1 received, 0% packet loss, time 0ms
+rtt min/avg/max/mdev = 0.052/0.052/0.052/0.000 ms
+"""
+
+FPING_OUTPUT = """10.0.0.2 : xmt/rcv/%loss = 1/1/0%, min/avg/max = 0.04/0.05/0.06
+10.0.0.3 : xmt/rcv/%loss = 1/0/100%
+"""
+
+
+def test_parse():
+    src, a, b, c = (FakeNode(n) for n in ('src', 'a', 'b', 'c'))
+    assert PingProbe(src, 4, [(a, '10.0.0.2')]).parse(PING_OUTPUT) == \
+        [(a, 1, 1, .052)]
+    assert PingProbe(src, 4, [(a, '10.0.0.2')])\
+        .parse('connect: Network is unreachable\n') == [(a, 1, 0, None)]
+    probe = FpingProbe(src, 4, [(a, '10.0.0.2'), (b, '10.0.0.3'),
+                                (c, '10.0.0.4')], timeout='0.5')
+    assert probe.args[-5:] == ['-t', '500', '10.0.0.2', '10.0.0.3',
+                               '10.0.0.4']
+    # The destinations missing from the output are unreachable
+    assert probe.parse(FPING_OUTPUT) == [(a, 1, 1, .05), (b, 1, 0, None),
+                                         (c, 1, 0, None)]
+
+
+def test_plan_probes(monkeypatch):
+    src, a, b = (FakeNode(n) for n in ('src', 'a', 'b'))
+    plan = [(src, {a: '10.0.0.2', b: '10.0.0.3'}, {a: '2001:db8::2'})]
+    monkeypatch.setattr(reachability, 'HAS_FPING', False)
+    probes = plan_probes(plan, timeout=.5)
+    assert [(type(p), p.version, p.targets) for p in probes] == [
+        (PingProbe, 4, [(a, '10.0.0.2')]), (PingProbe, 4, [(b, '10.0.0.3')]),
+        (PingProbe, 6, [(a, '2001:db8::2')])]
+    assert probes[0].args == ['ping', '-c1', '-W', '1', '10.0.0.2']
+    monkeypatch.setattr(reachability, 'HAS_FPING', True)
+    probes = plan_probes(plan)
+    assert [(type(p), p.version, len(p.targets)) for p in probes] == [
+        (FpingProbe, 4, 2), (FpingProbe, 6, 1)]
+
+
+def test_run_commands(tmpdir):
+    node = FakeNode('node')
+    log = str(tmpdir.join('log'))
+    outputs = run_commands([(node, ['sh', '-c',
+                                    logged_cmd(log, 'sleep .1; echo %d' % i)])
+                            for i in range(4)] +
+                           [(node, ['/nonexistent/ping'])], window=2)
+    # At most two commands run at once
+    assert max_overlap(log) <= 2
+    assert outputs[:4] == ['0\n', '1\n', '2\n', '3\n']
+    assert 'nonexistent' in outputs[4]
+    # The commands of a window run together
+    barrier = tmpdir.mkdir('barrier')
+    assert run_commands([(node, ['sh', '-c', barrier_cmd(barrier, 2)])] * 2,
+                        window=2) == ['met\n'] * 2
+
+
+def test_run_commands_high_fds():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY and hard < 1100:
+        pytest.skip('Cannot open more than 1024 file descriptors')
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, 1100), hard))
+    fd = os.open(os.devnull, os.O_RDONLY)
+    fillers = []
+    try:
+        # The pipes of the commands get file descriptors above FD_SETSIZE
+        while fd < 1030:
+            fillers.append(fd)
+            fd = os.dup(fd)
+        fillers.append(fd)
+        assert run_commands([(FakeNode('node'), ['echo', 'a'])]) == ['a\n']
+    finally:
+        for fd in fillers:
+            os.close(fd)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+
+def test_matrix():
+    src, a, b = (FakeNode(n) for n in ('src', 'a', 'b'))
+    probes = [FpingProbe(src, 4, [(a, '10.0.0.2'), (b, '10.0.0.3')]),
+              PingProbe(src, 6, [(a, '2001:db8::2')])]
+    matrix = collect(probes, [FPING_OUTPUT, PING_OUTPUT])
+    assert len(matrix) == 3
+    assert list(matrix)[0] == ('src', 'a', 4, 1, 1, .05)
+    assert matrix.loss(src, a) == 0
+    assert matrix.loss('src', 'b', 4) == 100
+    assert matrix.rtt(src, a, 6) == .052
+    assert matrix.rtt(src, b) is None
+    assert (matrix.packets, matrix.lost) == (3, 1)
+    assert matrix.unreachable() == [('src', 'b', 4)]
+    assert matrix.connected(version=6)
+    assert not matrix.connected()
+    assert ReachabilityMatrix().ploss == 0
@@ -0,0 +1,69 @@
+"""This module tests the daemon readiness conditions"""
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from ipmininet.router.config import BGP, Zebra
+from ipmininet.router.config.readiness import SocketPath, PidFile,\
+    ListeningPort, wait_for
+from ipmininet.tests.utils import FakeNode
+
+
+def test_wait_socket_path():
+    path = tempfile.mktemp()
+    cond = SocketPath(path)
+    assert not cond.is_ready()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    def _listen():
+        time.sleep(.05)
+        sock.bind(path)
+        sock.listen(1)
+
+    t = threading.Thread(target=_listen)
+    try:
+        t.start()
+        assert wait_for([cond], timeout=5), "The socket was not detected"
+    finally:
+        t.join()
+        sock.close()
+        os.unlink(path)
+
+
+def test_wait_pidfile():
+    path = tempfile.mktemp()
+    cond = PidFile(path)
+    assert not wait_for([cond], timeout=.05), "Missing pidfile detected"
+    try:
+        with open(path, 'w') as f:
+            f.write('%d\n' % os.getpid())
+        assert wait_for([cond], timeout=1)
+    finally:
+        os.unlink(path)
+
+
+def test_listening_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        cond = ListeningPort(FakeNode(), port)
+        assert not cond.is_ready()
+        sock.listen(1)
+        assert wait_for([cond], timeout=1)
+    finally:
+        sock.close()
+
+
+def test_quagga_daemon_conditions():
+    node = FakeNode()
+    node.cwd = '/tmp'
+    bgpd = BGP(node)
+    pidfile, vty = bgpd.readiness_conditions()
+    assert pidfile.path == bgpd._file('pid')
+    assert (vty.node, vty.port) == (node, BGP.VTY_PORT)
+    # Zebra also waits for its API socket
+    assert [type(c) for c in Zebra(node).readiness_conditions()] == \
+        [PidFile, ListeningPort, SocketPath]
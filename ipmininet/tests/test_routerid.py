@@ -0,0 +1,46 @@
+"""This module tests the allocation of router ids"""
+from ipaddress import ip_interface
+
+from ipmininet.ipnet import IPNet
+from ipmininet.router.config.base import RouterIdAllocator
+from ipmininet.tests.utils import FakeDaemon, FakeNet, FakeRouter
+
+
+def topology():
+    """r1 - r2 - r3, r2 having an IPv4 address and r3 an explicit router id,
+    and r4 being isolated"""
+    net = FakeNet()
+    r1, r2, r3, r4 = [net.add(FakeRouter('r%d' % i)) for i in range(1, 5)]
+    net.link(r1, r2)
+    net.link(r2, r3)
+    IPNet._broadcast_domains(net)
+    r2.intf('r2-eth1')._record_addresses([ip_interface(u'0.0.0.2/30')])
+    r3.config._daemons['fake'] = FakeDaemon('r3', routerid='0.0.0.3')
+    return net, r1, r2, r3, r4
+
+
+def test_allocator():
+    net, r1, r2, r3, r4 = topology()
+    allocator = RouterIdAllocator(net.routers)
+    for r in net.routers:
+        r.routerid_allocator = allocator
+    assert r1.config.compute_routerid() == '0.0.0.1'
+    assert r2.config.compute_routerid() == '0.0.0.2'
+    assert r3.config.compute_routerid() == '0.0.0.3'
+    assert r4.config.compute_routerid() == '0.0.0.4'
+    # Allocated router ids are stable
+    assert r1.config.compute_routerid() == '0.0.0.1'
+    allocator.clear()
+    assert allocator.allocate(FakeRouter('r5')) == '0.0.0.5'
+
+
+def test_reachable_routers():
+    net, r1, r2, r3, r4 = topology()
+    r1.config.routerid = r1.config.compute_routerid()
+    assert r1.config.routerid == '0.0.0.1'
+    # Without allocator, the router ids are unique among reachable routers
+    r5 = net.add(FakeRouter('r5'))
+    net.link(r5, r2)
+    IPNet._broadcast_domains(net)
+    assert r5.config.compute_routerid() == '0.0.0.4'
+    assert r4.config.compute_routerid() == '0.0.0.1'
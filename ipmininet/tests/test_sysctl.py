@@ -0,0 +1,49 @@
+"""This module tests the /proc/sys sysctl engine of the routers"""
+import subprocess
+import time
+
+import pytest
+
+from ipmininet.router.sysctl import sysctl_path, set_sysctls
+
+from . import require_root
+
+
+@pytest.mark.parametrize("key,intf,path", [
+    ('net.ipv4.ip_forward', None, 'net/ipv4/ip_forward'),
+    ('net.ipv6.conf.forwarding', 'r1-eth0', 'net/ipv6/conf/r1-eth0/forwarding'),
+    ('net.ipv4.conf.rp_filter', 'eth0.10', 'net/ipv4/conf/eth0.10/rp_filter'),
+    ('net/ipv4/ip_forward', None, 'net/ipv4/ip_forward'),
+])
+def test_sysctl_path(key, intf, path):
+    assert sysctl_path(key, intf) == path
+
+
+def _sysctl(pid, key):
+    cmd = ['sysctl', '-n', key]
+    if pid is not None:
+        cmd = ['nsenter', '-t', str(pid), '-n'] + cmd
+    return subprocess.check_output(cmd).decode('utf-8').strip()
+
+
+@require_root
+def test_set_sysctls():
+    holder = subprocess.Popen(['unshare', '-n', 'sleep', '60'])
+    try:
+        time.sleep(.1)
+        forward = sysctl_path('net.ipv4.ip_forward')
+        lo_forward = sysctl_path('net.ipv6.conf.forwarding', 'lo')
+        root_value = _sysctl(None, forward)
+        old = set_sysctls(holder.pid, [(forward, 1), (lo_forward, 1)])
+        assert old == {forward: '0', lo_forward: '0'}
+        assert _sysctl(holder.pid, forward) == '1'
+        assert _sysctl(holder.pid, lo_forward) == '1'
+        # Nothing changed outside of the namespace
+        assert _sysctl(None, forward) == root_value
+        # Restore the previous values
+        assert set_sysctls(holder.pid, old.items()) == {forward: '1',
+                                                        lo_forward: '1'}
+        assert _sysctl(holder.pid, forward) == '0'
+    finally:
+        holder.kill()
+        holder.wait()
@@ -6,13 +6,22 @@ except ImportError:
     # Python 3
     from io import StringIO
 
+import os
 import re
 import signal
+import subprocess
 import time
 
 import mininet.log
+from mininet.node import Host
 from ipaddress import ip_address
 
+from ipmininet.link import IPIntf
+from ipmininet.router import Router
+from ipmininet.router.config.base import RouterConfig
+from ipmininet.router.config.cache import config_digest
+from ipmininet.router.config.utils import ConfigDict
+
 
 def traceroute(net, src, dst_ip, timeout=300):
     t = 0
@@ -80,18 +89,10 @@ def get_dst_ip(net, dst, v6=False):
 
 
 def host_connected(net, v6=False, timeout=0.5):
-    for src in net.hosts:
-        for dst in net.hosts:
-            if src != dst:
-                dst.defaultIntf().updateIP()
-                dst.defaultIntf().updateIP6()
-                dst_ip = dst.defaultIntf().ip6 if v6 else dst.defaultIntf().ip
-                cmd = "nmap%s -sn -n --max-retries 0 --max-rtt-timeout %dms %s"\
-                      % (" -6" if v6 else "", int(timeout * 1000), dst_ip)
-                out = src.cmd(cmd.split(" "))
-                if u"0 hosts up" in out:
-                    return False
-    return True
+    matrix = net.reachability(timeout=timeout, use_v4=not v6, use_v6=v6)
+    # The hosts without address yet are not probed
+    count = len(net.hosts)
+    return len(matrix) == count * (count - 1) and matrix.connected()
 
 
 def assert_connectivity(net, v6=False, timeout=300):
@@ -127,6 +128,40 @@ def check_tcp_connectivity(client, server, v6=False, server_port=80, timeout=300
     return code, out, err
 
 
+def barrier_cmd(directory, count, timeout=10):
+    """Return a shell command that waits until count such commands started
+    with the same directory, so that they only meet if they run
+    concurrently. It outputs 'met' if they all met before the timeout, and
+    'missed' otherwise.
+
+    :param directory: an empty directory shared by the commands
+    :param count: the number of commands that must run together
+    :param timeout: the maximal number of seconds to wait for the others"""
+    started = 'ls %s | wc -l' % directory
+    return ('touch %s/$$; i=0; '
+            'while [ $(%s) -lt %d ] && [ $i -lt %d ]; do '
+            'sleep .01; i=$((i + 1)); done; '
+            '[ $(%s) -ge %d ] && echo met || echo missed'
+            % (directory, started, count, timeout * 100, started, count))
+
+
+def logged_cmd(log, cmd):
+    """Return a shell command running cmd between a start and an end record
+    in the log file, see max_overlap()"""
+    return 'echo start >> %s; %s; echo end >> %s' % (log, cmd, log)
+
+
+def max_overlap(log):
+    """Return the maximal number of commands of logged_cmd() that ran at
+    once"""
+    running = overlap = 0
+    with open(log) as f:
+        for line in f:
+            running += 1 if line.strip() == 'start' else -1
+            overlap = max(overlap, running)
+    return overlap
+
+
 class CLICapture(object):
 
     def __init__(self, loglevel):
@@ -143,3 +178,192 @@ class CLICapture(object):
         self.handler.flush()
         self.handler.close()
         self.out = self.stream.getvalue().splitlines()
+
+
+class FakeIntf(IPIntf):
+    """An interface that only exists in the topology, not in the kernel"""
+
+    def __init__(self, name, node):
+        self.name = name
+        self.node = node
+        self.link = None
+        self.params = {}
+        self.addresses = {4: [], 6: []}
+        self._address_listeners = []
+        node.intfs.append(self)
+
+
+class FakeLink(object):
+
+    def __init__(self, intf1, intf2):
+        self.intf1, self.intf2 = intf1, intf2
+        intf1.link = intf2.link = self
+
+
+class FakeNode(object):
+    """A node without shell, whose commands run in the current namespaces"""
+
+    pid = os.getpid()
+    inNamespace = False
+
+    def __init__(self, name='fake'):
+        self.name = name
+        self.intfs = []
+        self.popen_count = 0
+
+    def intfList(self):
+        return self.intfs
+
+    def popen(self, *args, **kwargs):
+        self.popen_count += 1
+        return subprocess.Popen(*args, **kwargs)
+
+    def intf(self, name):
+        return next(i for i in self.intfs if i.name == name)
+
+
+class FakeHost(FakeNode, Host):
+    pass
+
+
+class FakeRouter(FakeNode, Router):
+
+    def __init__(self, name):
+        super(FakeRouter, self).__init__(name)
+        self.params = {}
+        self.use_v4 = self.use_v6 = True
+        self.password = 'zebra'
+        self.config = RouterConfig(self)
+        FakeIntf('lo', self)
+
+
+class FakeDomain(object):
+    """A broadcast domain of a given number of IPv4 addresses, without
+    interfaces"""
+
+    def __init__(self, size, use_ip=True):
+        self.size = size
+        self.use_ip = use_ip
+        self.interfaces = []
+        self.net = None
+
+    def len_v4(self):
+        return self.size
+
+    @property
+    def max_v4prefixlen(self):
+        return 32 - (self.size + 1).bit_length()
+
+    def use_ip_version(self, version):
+        return self.use_ip
+
+
+class FakeDaemon(object):
+    """A daemon whose configuration is given as a string, and which records
+    the rendering it writes instead of rendering a template"""
+
+    NAME = 'fake'
+    PRIO = 0
+    DEPENDS = ()
+    template_filename = 'fake.mako'
+
+    def __init__(self, node, cfg='', routerid=None):
+        """:param node: The name of the node of the daemon
+        :param cfg: Its configuration
+        :param routerid: The router id set in its options"""
+        self.node = node
+        self.cfg = cfg
+        self.cfg_filename = '/tmp/fake_%s.cfg' % node
+        self.dry_run = 'sh -n %s' % self.cfg_filename
+        self.cfg_digest = config_digest(cfg)
+        self.options = ConfigDict(routerid=routerid)
+        self.files = []
+        self.written = None
+
+    def build(self):
+        return ConfigDict()
+
+    def template_args(self, cfg):
+        return {'cfg': self.cfg}
+
+    def render(self, cfg):
+        raise AssertionError('The daemon of %s was rendered' % self.node)
+
+    def write(self, out):
+        self.written = out
+
+
+class FakeBGP(object):
+    """A BGP daemon only holding the route maps of its node"""
+
+    def __init__(self, route_maps):
+        self._node = ConfigDict(bgp_route_maps=route_maps)
+
+
+class FakeNet(object):
+    """A network holding fake nodes, linked by fake links"""
+
+    def __init__(self):
+        self.nodes = []
+        self.routers = []
+
+    def add(self, node):
+        self.nodes.append(node)
+        if isinstance(node, Router):
+            self.routers.append(node)
+        return node
+
+    def link(self, n1, n2):
+        return FakeLink(FakeIntf('%s-eth%d' % (n1.name, len(n1.intfs)), n1),
+                        FakeIntf('%s-eth%d' % (n2.name, len(n2.intfs)), n2))
+
+    def values(self):
+        return self.nodes
+
+
+class NamespaceNode(FakeNode):
+    """A node living in its own network namespace, whose commands run with
+    nsenter"""
+
+    inNamespace = True
+
+    def __init__(self, name='ns'):
+        super(NamespaceNode, self).__init__(name)
+        self.holder = subprocess.Popen(['unshare', '-n', 'sleep', '60'])
+        time.sleep(.1)
+        self.pid = self.holder.pid
+        self.cmd_count = 0
+
+    def addIntf(self, intf, **kwargs):
+        self.intfs.append(intf)
+
+    def cmd(self, *args, **kwargs):
+        self.cmd_count += 1
+        return subprocess.check_output(
+            ['nsenter', '-t', str(self.pid), '-n'] +
+            [str(a) for a in args]).decode('utf-8')
+
+    def popen(self, cmd, **kwargs):
+        self.popen_count += 1
+        return subprocess.Popen(['nsenter', '-t', str(self.pid), '-n'] + cmd,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, **kwargs)
+
+    def stop(self):
+        self.holder.kill()
+        self.holder.wait()
+
+
+class PortNode(NamespaceNode):
+    """A namespace node keeping track of the ports of its interfaces"""
+
+    def __init__(self, name):
+        super(PortNode, self).__init__(name)
+        self.ports = {}
+
+    def addIntf(self, intf, port=None, **kwargs):
+        super(PortNode, self).addIntf(intf)
+        self.ports[intf] = port
+
+    def newPort(self):
+        return max(self.ports.values()) + 1 if self.ports else 0
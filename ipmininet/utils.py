@@ -4,6 +4,13 @@ from ipmininet import basestring
 
 import collections
 import os
+import subprocess
+import uuid
+
+try:
+    from shlex import quote
+except ImportError:  # Python 2
+    from pipes import quote
 
 from mininet.log import lg as log
 
@@ -111,6 +118,75 @@ def get_set(d, key, default):
         return x
 
 
+class IndexedList(list):
+    """A list that also indexes its elements in a dictionary, so that
+    membership tests take a constant time. Its elements must be hashable."""
+
+    def __init__(self, iterable=()):
+        super(IndexedList, self).__init__(iterable)
+        self._reindex()
+
+    def __reduce__(self):
+        return type(self), (list(self),)
+
+    def _reindex(self):
+        self._counts = collections.Counter(list.__iter__(self))
+
+    def _added(self, items):
+        for x in items:
+            self._counts[x] += 1
+
+    def _removed(self, x):
+        self._counts[x] -= 1
+        if not self._counts[x]:
+            del self._counts[x]
+
+    def __contains__(self, x):
+        return x in self._counts
+
+    def append(self, x):
+        super(IndexedList, self).append(x)
+        self._added((x,))
+
+    def extend(self, iterable):
+        items = list(iterable)
+        super(IndexedList, self).extend(items)
+        self._added(items)
+
+    def __iadd__(self, iterable):
+        self.extend(iterable)
+        return self
+
+    def insert(self, i, x):
+        super(IndexedList, self).insert(i, x)
+        self._added((x,))
+
+    def remove(self, x):
+        super(IndexedList, self).remove(x)
+        self._removed(x)
+
+    def pop(self, *args):
+        x = super(IndexedList, self).pop(*args)
+        self._removed(x)
+        return x
+
+    def __setitem__(self, i, x):
+        super(IndexedList, self).__setitem__(i, x)
+        self._reindex()
+
+    def __delitem__(self, i):
+        super(IndexedList, self).__delitem__(i)
+        self._reindex()
+
+    def clear(self):
+        del self[:]
+
+    def __imul__(self, n):
+        super(IndexedList, self).__imul__(n)
+        self._reindex()
+        return self
+
+
 def find_node(start, node_name):
     """
     :param start: The starting node of the search
@@ -136,3 +212,146 @@ def find_node(start, node_name):
             elif L3Router.is_l3router_intf(n):
                 to_visit.extend(realIntfList(n.node))
     return None
+
+
+class PeerAddressIndex(object):
+    """An index of the router interfaces through which a router reaches the
+    other routers, without crossing the boundaries of its AS. The network is
+    explored once per router, on first use, rather than once per pair of
+    routers."""
+
+    def __init__(self):
+        # base router name: {router name: first interface found}
+        self._reachable = {}
+
+    def interface(self, base, peer):
+        """Return the interface through which a router reaches another one,
+        i.e. the first interface of the peer found by a breadth-first search
+        from the router, only traversing the routers of its AS
+
+        :param base: the router
+        :param peer: the name of the other router
+        :return: an interface of peer or None if it cannot be reached"""
+        try:
+            reachable = self._reachable[base.name]
+        except KeyError:
+            reachable = self._reachable[base.name] = self._explore(base)
+        return reachable.get(peer)
+
+    def clear(self):
+        """Forget the explored routers, e.g. if the topology changed"""
+        self._reachable.clear()
+
+    @staticmethod
+    def _explore(base):
+        """Return the first interface found for every router reachable from
+        a router"""
+        reachable = {}
+        expanded = set()
+        visited = set()
+        to_visit = collections.deque(realIntfList(base))
+        while to_visit:
+            i = to_visit.popleft()
+            if i in visited:
+                continue
+            visited.add(i)
+            for n in i.broadcast_domain.routers:
+                node = n.node
+                if node.name not in reachable:
+                    reachable[node.name] = n
+                if node in expanded:
+                    continue
+                if node.asn == base.asn or not node.asn:
+                    expanded.add(node)
+                    to_visit.extend(realIntfList(node))
+        return reachable
+
+
+class CommandBatch(object):
+    """Queue commands for a node, then run them as a single shell script,
+    in one round-trip to the node, i.e. through a single sh process fed with
+    the script on its stdin. The script is not written to the shell of the
+    node, whose terminal truncates long input lines. Each command is run
+    with its stderr merged into its stdout and without stdin, and its output
+    and exit status are recorded separately. Use it as:
+
+        with CommandBatch(node) as b:
+            i = b.add('ip link set dev eth0 up')
+        output, status = b.results[i]"""
+
+    def __init__(self, node):
+        """:param node: The node in which the commands are run"""
+        self.node = node
+        self.commands = []
+        self.results = None  # [(output, exit status)], once run
+        self._marker = '__batch_%s__' % uuid.uuid4().hex
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.run()
+
+    def add(self, *args):
+        """Queue a command
+
+        :param args: the command + arguments, either as strings interpreted
+                     by the shell and joined by spaces, as in Node.cmd, or
+                     as a single list of arguments
+        :return: the index of its result in self.results"""
+        if len(args) == 1 and not isinstance(args[0], basestring):
+            cmd = ' '.join(quote(str(a)) for a in args[0])
+        else:
+            cmd = ' '.join(str(a) for a in args)
+        if '\n' in cmd:
+            raise ValueError('Batched commands must fit on a single line: %s'
+                             % cmd)
+        self.commands.append(cmd.strip().rstrip(';'))
+        return len(self.commands) - 1
+
+    @property
+    def script(self):
+        """The shell script running the queued commands, one per line"""
+        return ''.join("{ %s ; } </dev/null 2>&1; printf '\\n%s %%d\\n' $?\n"
+                       % (cmd, self._marker) for cmd in self.commands)
+
+    def run(self):
+        """Run the queued commands
+
+        :return: the list of the (output, exit status) of each command, the
+                 exit status being None if the command could not be run"""
+        if not self.commands:
+            self.results = []
+            return self.results
+        executor = getattr(self.node, 'executor', None)
+        popen = self.node.popen if executor is None else executor.popen
+        p = popen(['sh'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                  stderr=subprocess.STDOUT)
+        out, _ = p.communicate(self.script.encode('utf-8'))
+        p.wait()
+        self.results = self._parse(out.decode('utf-8', 'replace'))
+        return self.results
+
+    def _parse(self, output):
+        parts = output.split('\n%s ' % self._marker)
+        results = []
+        out = parts[0]
+        for part in parts[1:]:
+            status, _, rest = part.partition('\n')
+            try:
+                results.append((out, int(status)))
+            except ValueError:
+                break
+            out = rest
+        if len(results) < len(self.commands):
+            log.error('Some batched commands could not be run on',
+                      self.node.name, ':', out, '\n')
+            results.append((out, None))
+            results.extend(('', None) for _ in
+                           range(len(self.commands) - len(results)))
+        return results
+